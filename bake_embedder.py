@@ -1,4 +1,5 @@
 # scripts/bake_embedder.py
+import json
 import os
 from sentence_transformers import SentenceTransformer
 
@@ -10,3 +11,25 @@ m = SentenceTransformer(model_id, device="cpu")
 m.save(local_dir)
 
 print("Saved embedding model to:", local_dir)
+
+# ONNX backends (EMBEDDER_BACKEND=onnx / onnx-int8). The build fails if either
+# graph drifts from the PyTorch vectors, since existing indexes rely on them.
+if os.getenv("EXPORT_ONNX", "1") == "1":
+    from src.onnx_embedder import check_tolerance, export_onnx, onnx_paths, quantize_int8
+
+    export_onnx(local_dir)
+    quantize_int8(local_dir)
+    report = {
+        "onnx": check_tolerance(m, local_dir, quantized=False, min_cosine=float(os.getenv("ONNX_MIN_COSINE", "0.9999"))),
+        "onnx-int8": check_tolerance(m, local_dir, quantized=True, min_cosine=float(os.getenv("ONNX_INT8_MIN_COSINE", "0.98"))),
+    }
+    onnx_paths(local_dir)["tolerance"].write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print("Exported ONNX embedders:", report)
+
+# Cross-encoder for RERANK=true (src/rerank.py). Small enough to bake by default.
+if os.getenv("BAKE_RERANKER", "1") == "1":
+    from sentence_transformers import CrossEncoder
+
+    reranker_dir = "/app/models/ms-marco-MiniLM-L-6-v2"
+    CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2", device="cpu").save(reranker_dir)
+    print("Saved reranker model to:", reranker_dir)
@@ -137,6 +137,13 @@ fi
 say "Uploading DB to GCS: gs://${BUCKET}/${DB_OBJECT}"
 gcloud storage cp "${DB_LOCAL_PATH}" "gs://${BUCKET}/${DB_OBJECT}"
 
+# Compressed, framed artifact for fast cold starts (src/db_artifact.py).
+# The manifest goes up last so instances never see it ahead of its frames.
+say "Packing + uploading compressed DB artifact"
+python -m src.db_artifact pack "${DB_LOCAL_PATH}" "${DB_LOCAL_PATH}.z"
+gcloud storage cp "${DB_LOCAL_PATH}.z" "gs://${BUCKET}/${DB_OBJECT}.z"
+gcloud storage cp "${DB_LOCAL_PATH}.manifest.json" "gs://${BUCKET}/${DB_OBJECT}.manifest.json"
+
 say "Granting storage.objectViewer to ${DEFAULT_SA} on bucket..."
 gcloud storage buckets add-iam-policy-binding "gs://${BUCKET}" \
   --member="serviceAccount:${DEFAULT_SA}" \
@@ -204,7 +211,7 @@ gcloud run deploy "${SERVICE_NAME}" \
   --image "${IMAGE}" \
   --allow-unauthenticated \
   --region "${REGION}" \
-  --set-env-vars "SQLITE_PATH=${SQLITE_PATH},GCS_DB_BUCKET=${BUCKET},GCS_DB_OBJECT=${DB_OBJECT}" \
+  --set-env-vars "SQLITE_PATH=${SQLITE_PATH},SQLITE_IMMUTABLE=true,GCS_DB_BUCKET=${BUCKET},GCS_DB_OBJECT=${DB_OBJECT}" \
   --update-secrets "PINECONE_API_KEY=PINECONE_API_KEY:latest" \
   --update-secrets "GEMINI_API_KEY=GEMINI_API_KEY:latest" \
   --memory 4Gi \
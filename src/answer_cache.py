@@ -0,0 +1,326 @@
+"""
+Exact-answer cache for rag_answer / rag_answer_async.
+
+Key = normalised question + doc_id filter + top_k + prompt fingerprint +
+corpus version, so a changed prompt template, model, index or DB never serves
+a stale answer. In-memory LRU + TTL, optionally backed by a SQLite file
+(ANSWER_CACHE_PATH) that survives restarts.
+
+Concurrent identical questions are single-flighted: the first caller runs the
+pipeline (one Gemini call), the others wait for its result.
+
+SemanticAnswerCache sits behind it for paraphrases: previously answered query
+vectors are searched (per doc_id/top_k/prompt/corpus scope) and an answer is
+reused when the cosine similarity clears settings.semantic_cache_threshold.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.cache import LRUTTLCache, SQLiteCacheTier, normalize_text
+from src.config import settings
+
+
+# (size, mtime_ns) of the DB file -> its identity, so the stamp is read once per file.
+_DB_IDENTITY: Dict[str, Any] = {"stat": None, "id": None}
+_DB_IDENTITY_LOCK = threading.Lock()
+
+
+def _db_identity() -> str:
+    # A DB fetched from the published artifact is identified by the artifact's
+    # sha256 / generation, which survives the re-download (and new mtime) of
+    # every cold start; a local DB falls back to size + mtime.
+    from src.db_artifact import published_identity
+
+    try:
+        st = os.stat(settings.sqlite_path)
+    except OSError:
+        return "missing"
+    key = (st.st_size, st.st_mtime_ns)
+    with _DB_IDENTITY_LOCK:
+        if _DB_IDENTITY["stat"] == key:
+            return _DB_IDENTITY["id"]
+    ident = published_identity(settings.sqlite_path) or f"{st.st_size}:{st.st_mtime_ns}"
+    with _DB_IDENTITY_LOCK:
+        _DB_IDENTITY.update(stat=key, id=ident)
+    return ident
+
+
+def corpus_version() -> str:
+    """
+    Changes whenever the data behind an answer can change: the DB contents
+    (replaced on deploy / re-ingest), the vector index and embedder, and the
+    retrieval mode. ANSWER_CACHE_VERSION can be bumped to flush by hand.
+    """
+    db = _db_identity()
+    if settings.vector_backend == "local":
+        index = f"local:{settings.local_index_dir}:{settings.local_index_mode}"
+    else:
+        index = f"pinecone:{settings.pinecone_index_name}/{settings.pinecone_namespace}"
+    raw = "|".join(
+        [
+            db,
+            index,
+            settings.local_embedding_model,
+            settings.embedder_backend,
+            f"hybrid={settings.hybrid_retrieval}",
+            settings.answer_cache_version,
+        ]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def answer_cache_key(question: str, *, doc_id: Optional[str], top_k: int, prompt_fingerprint: str) -> str:
+    raw = json.dumps([normalize_text(question), doc_id, int(top_k), prompt_fingerprint, corpus_version()])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, maxsize: int, *, ttl_s: Optional[float] = None, path: str = ""):
+        self.memory = LRUTTLCache(maxsize, ttl_s=ttl_s)
+        self.disk = SQLiteCacheTier(path, "answers", ttl_s=ttl_s) if path else None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_async: Dict[str, "asyncio.Future"] = {}
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.computed = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            raw = self.disk.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.put(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        value = self.get(key)
+        if value is not None:
+            return _hit(value)
+
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return _hit(fut.result())
+
+        try:
+            value = compute()
+            self.put(key, value)
+            with self._lock:
+                self.computed += 1
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        value = self.get(key)
+        if value is not None:
+            return _hit(value)
+
+        fut = self._inflight_async.get(key)
+        if fut is not None:
+            with self._lock:
+                self.coalesced += 1
+            return _hit(await asyncio.shield(fut))
+
+        fut = self._inflight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+            self.put(key, value)
+            with self._lock:
+                self.computed += 1
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # mark retrieved: waiters (if any) re-raise it themselves
+            raise
+        finally:
+            self._inflight_async.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        mem = self.memory.stats()
+        # Single-flight waiters are served without a pipeline run, so they count as hits.
+        served = mem["hits"] + self.disk_hits + self.coalesced
+        total = served + self.computed
+        return {
+            **mem,
+            "disk_entries": len(self.disk) if self.disk is not None else None,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "computed": self.computed,
+            "answer_hit_ratio": (served / total) if total else 0.0,
+        }
+
+
+def _hit(value: Dict[str, Any]) -> Dict[str, Any]:
+    return {**value, "cache": "exact"}
+
+
+class SemanticAnswerCache:
+    """
+    Bounded nearest-neighbour cache over answered query vectors.
+
+    Entries live in one LRU (OrderedDict) across all scopes; each scope keeps
+    a stacked matrix of its unit vectors, rebuilt lazily after inserts or
+    evictions, so a lookup is one matrix-vector product. Everything is dropped
+    when corpus_version() changes.
+    """
+
+    def __init__(self, maxsize: int, *, threshold: float, ttl_s: Optional[float] = None, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be > 0")
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl_s = ttl_s or None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._next_id = 0
+        # entry_id -> (scope, unit vector, value, expires_at)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # scope -> (entry_ids, matrix); dropped when the scope changes, rebuilt on lookup
+        self._index: Dict[Tuple, Tuple[List[int], Optional[np.ndarray]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version_locked(self) -> None:
+        v = corpus_version()
+        if v != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._index.clear()
+            self._version = v
+
+    def _scope_matrix_locked(self, scope: Tuple) -> Tuple[List[int], Optional[np.ndarray]]:
+        if scope not in self._index:
+            ids = [eid for eid, e in self._entries.items() if e[0] == scope]
+            self._index[scope] = (ids, np.stack([self._entries[i][1] for i in ids]) if ids else None)
+        return self._index[scope]
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def lookup(self, vector, scope: Tuple) -> Optional[Dict[str, Any]]:
+        q = self._unit(vector)
+        with self._lock:
+            self._check_version_locked()
+            ids, mat = self._scope_matrix_locked(scope)
+            if mat is not None:
+                sims = mat @ q
+                best = int(np.argmax(sims))
+                eid, sim = ids[best], float(sims[best])
+                entry = self._entries.get(eid)
+                if sim >= self.threshold and entry is not None:
+                    if entry[3] is None or entry[3] > self._clock():
+                        self._entries.move_to_end(eid)
+                        self.hits += 1
+                        return {**entry[2], "cache": "semantic", "cache_similarity": round(sim, 4)}
+                    del self._entries[eid]
+                    self._index.pop(scope, None)
+            self.misses += 1
+            return None
+
+    def add(self, vector, scope: Tuple, value: Dict[str, Any]) -> None:
+        q = self._unit(vector)
+        expires_at = self._clock() + self.ttl_s if self.ttl_s else None
+        with self._lock:
+            self._check_version_locked()
+            eid = self._next_id
+            self._next_id += 1
+            self._entries[eid] = (scope, q, value, expires_at)
+            self._index.pop(scope, None)
+            while len(self._entries) > self.maxsize:
+                _, (old_scope, *_rest) = self._entries.popitem(last=False)
+                self._index.pop(old_scope, None)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+_ANSWER_CACHE = None
+_ANSWER_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _ANSWER_CACHE
+    if _ANSWER_CACHE is None:
+        with _ANSWER_CACHE_LOCK:
+            if _ANSWER_CACHE is None:
+                _ANSWER_CACHE = AnswerCache(
+                    settings.answer_cache_size,
+                    ttl_s=settings.answer_cache_ttl_s,
+                    path=settings.answer_cache_path,
+                )
+    return _ANSWER_CACHE
+
+
+_SEMANTIC_CACHE = None
+_SEMANTIC_CACHE_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    global _SEMANTIC_CACHE
+    if _SEMANTIC_CACHE is None:
+        with _SEMANTIC_CACHE_LOCK:
+            if _SEMANTIC_CACHE is None:
+                _SEMANTIC_CACHE = SemanticAnswerCache(
+                    settings.semantic_cache_size,
+                    threshold=settings.semantic_cache_threshold,
+                    ttl_s=settings.answer_cache_ttl_s,
+                )
+    return _SEMANTIC_CACHE
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {"enabled": settings.answer_cache}
+    if settings.answer_cache:
+        out.update(get_answer_cache().stats())
+    out["semantic"] = get_semantic_cache().stats() if settings.semantic_cache else {"enabled": False}
+    return out
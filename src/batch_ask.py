@@ -0,0 +1,134 @@
+"""
+Many questions about one contract in one request (/ask/batch).
+
+Instead of N independent /ask pipelines, work is shared across the batch:
+1. every question is embedded in one encode() call (cached vectors reused);
+2. precomputed clause answers and the exact-answer cache are checked;
+3. vector searches for the remaining questions run concurrently;
+4. the union of retrieved chunk ids is hydrated in one SQLite read;
+5. Gemini calls run concurrently, at most settings.batch_llm_concurrency at a time.
+
+Each question then gets the same per-question stages as /ask (MMR, rerank,
+neighbours, context packing, prompt), so answers match what /ask would give
+and are stored in the same answer cache.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from src.answer_cache import get_answer_cache
+from src.clause_extraction import lookup_clause_answer_async
+from src.config import settings
+from src.db import run_read
+from src.diversify import retrieval_options
+from src.documents import fetch_chunks_by_ids
+from src.rag import _answer_text, _cache_key, _collect, _prepare_events, _retrieve, get_llm
+from src.retrieval import embed_queries_async
+
+
+async def rag_answer_batch(
+    questions: List[str],
+    *,
+    doc_id: Optional[str] = None,
+    top_k: int = 8,
+    mmr: Optional[bool] = None,
+    mmr_lambda: Optional[float] = None,
+    neighbors: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Returns {"answers": [...], "timings": {...}, "counts": {...}}; answers are
+    in question order and shaped like rag_answer_async results.
+    """
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    def mark(stage: str) -> None:
+        timings[stage] = round((time.perf_counter() - t0) * 1000, 1)
+
+    options = retrieval_options(mmr=mmr, mmr_lambda=mmr_lambda, neighbors=neighbors)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+
+    vectors = await embed_queries_async(questions)
+    mark("embed_done")
+
+    # Precomputed answers first: clause table (doc-scoped), then the exact-answer cache.
+    cache = get_answer_cache() if settings.answer_cache else None
+    keys = [_cache_key(q, doc_id, top_k, options) for q in questions]
+    if settings.clause_answers and doc_id:
+        clauses = await asyncio.gather(
+            *(lookup_clause_answer_async(q, doc_id=doc_id, vector=v) for q, v in zip(questions, vectors))
+        )
+        for i, clause in enumerate(clauses):
+            results[i] = clause
+    if cache is not None:
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                hit = cache.get(key)
+                if hit is not None:
+                    results[i] = {**hit, "cache": "exact"}
+    # Repeated questions in one checklist are answered once.
+    first_by_key: Dict[str, int] = {}
+    dupes: Dict[int, int] = {}
+    for i, r in enumerate(results):
+        if r is None:
+            dupes[i] = first_by_key.setdefault(keys[i], i)
+    todo = [i for i, first in dupes.items() if first == i]
+    mark("lookup_done")
+
+    retrieved = await asyncio.gather(
+        *(_retrieve(questions[i], doc_id=doc_id, top_k=top_k, options=options, vector=vectors[i]) for i in todo)
+    )
+    matches_by_q: Dict[int, List[Any]] = {}
+    diversified: Dict[int, Optional[Dict[str, Any]]] = {}
+    for i, (matches, report) in zip(todo, retrieved):
+        matches_by_q[i], diversified[i] = matches, report
+    mark("retrieval_done")
+
+    union = list(dict.fromkeys(m["id"] for i in todo for m in matches_by_q[i]))
+    by_id = {c["chunk_id"]: c for c in await run_read(fetch_chunks_by_ids, union)}
+    mark("hydration_done")
+
+    async def prepare(i: int) -> Dict[str, Any]:
+        # Same post-hydration stages as /ask (rerank, sources, neighbours, prompt).
+        chunks = [by_id[m["id"]] for m in matches_by_q[i] if m["id"] in by_id]
+        return await _collect(
+            _prepare_events(
+                questions[i], matches_by_q[i], chunks,
+                doc_id=doc_id, top_k=top_k, options=options, diversified=diversified[i],
+            )
+        )
+
+    prepared = dict(zip(todo, await asyncio.gather(*(prepare(i) for i in todo))))
+    mark("prompts_done")
+
+    sem = asyncio.Semaphore(settings.batch_llm_concurrency)
+
+    async def generate(i: int) -> None:
+        result = prepared[i]["result"]
+        results[i] = result
+        try:
+            async with sem:
+                ai_msg = await get_llm().ainvoke(prepared[i]["prompt"])
+        except Exception as e:
+            # One failed call shouldn't sink the other answers in the batch.
+            result["error"] = repr(e)
+            return
+        result["answer"] = _answer_text(ai_msg)
+        if cache is not None:
+            cache.put(keys[i], result)
+
+    await asyncio.gather(*(generate(i) for i in todo))
+    for i, first in dupes.items():
+        results[i] = results[first]
+    mark("generation_done")
+
+    counts = {
+        "questions": len(questions),
+        "clause": sum(1 for r in results if r.get("clause")),
+        "cached": sum(1 for r in results if r.get("cache")),
+        "generated": sum(1 for i in todo if results[i].get("error") is None),
+        "failed": sum(1 for i in todo if results[i].get("error") is not None),
+        "chunks_hydrated": len(by_id),
+    }
+    answers = [{"question": q, **r} for q, r in zip(questions, results)]
+    return {"doc_id": doc_id, "answers": answers, "timings": timings, "counts": counts}
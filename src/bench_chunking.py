@@ -0,0 +1,152 @@
+"""
+Benchmark: character chunker vs structure-aware chunker.
+
+On a sample of contracts from the SQLite DB, for each chunker:
+  docs/s, MB/s  - chunking throughput (tokenizer time included for "structure")
+  chunks        - chunks produced, and mean/max embedder tokens per chunk
+  truncated     - share of chunks longer than the embedder's window (their
+                  tail is never embedded)
+  whole         - share of CUAD answer spans that fall entirely inside one chunk
+  hit@k         - share of annotated questions where a doc-scoped search over
+                  that contract's chunks returns a chunk overlapping an answer
+                  span in the top k (query = the CUAD category, as in
+                  clause_extraction)
+
+    python -m src.bench_chunking --docs 50 --k 4
+    python -m src.bench_chunking --no-retrieval   # throughput only, no embedder
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from src.chunking import chunk_document, get_chunk_tokenizer
+from src.clause_extraction import category_query, parse_label
+from src.config import settings
+from src.db import get_read_conn
+from src.documents import fetch_annotations_for_doc, get_document_text
+
+CHUNKERS = ["chars", "structure"]
+
+
+def load_docs(n: int) -> List[Tuple[str, str]]:
+    with get_read_conn() as conn:
+        rows = conn.execute(
+            text("SELECT doc_id, raw_path FROM documents ORDER BY doc_id LIMIT :n"), {"n": n}
+        ).fetchall()
+    docs = []
+    for doc_id, raw_path in rows:
+        try:
+            body = get_document_text(doc_id)
+        except KeyError:
+            # Inline-storage DBs keep no document text; read the source file.
+            from src.ingest_cuad_to_sqlite import load_contract_text
+
+            body = load_contract_text(Path(raw_path))
+        docs.append((doc_id, body))
+    return docs
+
+
+def gold_spans(doc_id: str, body: str) -> List[Tuple[str, List[Tuple[int, int]]]]:
+    """
+    (question, [(start, end), ...]) for each annotation with answers, as
+    offsets into the full contract text.
+    """
+    out = []
+    for a in fetch_annotations_for_doc(doc_id, limit=10_000):
+        if not a["answer_texts"]:
+            continue
+        base = 0 if a["context"] == body else body.find(a["context"] or "\0")
+        if base < 0:
+            continue
+        spans = [(base + s, base + s + len(t)) for t, s in zip(a["answer_texts"], a["answer_starts"])]
+        out.append((category_query(*parse_label(a["label"])), spans))
+    return out
+
+
+def run(chunker: str, docs: List[Tuple[str, str]], golds: Dict[str, list], *, k: int, retrieval: bool) -> Dict:
+    t0 = time.perf_counter()
+    chunked = {
+        doc_id: chunk_document(body, chunker=chunker, chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+        for doc_id, body in docs
+    }
+    elapsed = time.perf_counter() - t0
+    n_chars = sum(len(body) for _, body in docs)
+    all_chunks = [c for cs in chunked.values() for c in cs]
+
+    window = settings.chunk_tokens
+    encs = get_chunk_tokenizer().encode_batch([c["text"] for c in all_chunks], add_special_tokens=False)
+    lengths = np.array([len(e.ids) for e in encs] or [0])
+
+    n_spans = whole = 0
+    for doc_id, qs in golds.items():
+        bounds = [(c["start_char"], c["end_char"]) for c in chunked[doc_id]]
+        for _, spans in qs:
+            for s, e in spans:
+                n_spans += 1
+                whole += any(cs <= s and e <= ce for cs, ce in bounds)
+
+    row = {
+        "chunker": chunker,
+        "docs_s": len(docs) / elapsed,
+        "mb_s": n_chars / elapsed / 1e6,
+        "chunks": len(all_chunks),
+        "tok_mean": float(lengths.mean()),
+        "tok_max": int(lengths.max()),
+        "truncated": float((lengths > window).mean()),
+        "whole": whole / n_spans if n_spans else 0.0,
+        "hit": None,
+    }
+    if retrieval:
+        from src.retrieval import get_embedder
+
+        model = get_embedder()
+        hits = total = 0
+        for doc_id, qs in golds.items():
+            chunks = chunked[doc_id]
+            if not qs or not chunks:
+                continue
+            vecs = np.asarray(model.encode([c["text"] for c in chunks], batch_size=64, normalize_embeddings=True))
+            qvecs = np.asarray(model.encode([q for q, _ in qs], batch_size=64, normalize_embeddings=True))
+            top = np.argsort(-(qvecs @ vecs.T), axis=1)[:, :k]
+            for (_, spans), idx in zip(qs, top):
+                total += 1
+                hits += any(
+                    chunks[i]["start_char"] < e and s < chunks[i]["end_char"] for i in idx for s, e in spans
+                )
+        row["hit"] = hits / total if total else 0.0
+    return row
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare chunkers: throughput, token fit, answer-span retrieval.")
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--chunkers", nargs="+", default=CHUNKERS, choices=CHUNKERS)
+    ap.add_argument("--no-retrieval", action="store_true", help="skip embedding (throughput and span stats only)")
+    args = ap.parse_args()
+
+    docs = load_docs(args.docs)
+    golds = {doc_id: gold_spans(doc_id, body) for doc_id, body in docs}
+    get_chunk_tokenizer()  # load outside the timed section
+    print(
+        f"docs={len(docs)} questions={sum(len(q) for q in golds.values())} "
+        f"chunk_size={settings.chunk_size}/{settings.chunk_overlap} "
+        f"chunk_tokens={settings.chunk_tokens}/{settings.chunk_overlap_tokens} k={args.k}"
+    )
+    print(f"{'chunker':<10} {'docs/s':>8} {'MB/s':>6} {'chunks':>7} {'tok_mean':>8} {'tok_max':>7} {'truncated':>9} {'whole':>6} {'hit@k':>6}")
+    for chunker in args.chunkers:
+        r = run(chunker, docs, golds, k=args.k, retrieval=not args.no_retrieval)
+        hit = "-" if r["hit"] is None else f"{r['hit']:.3f}"
+        print(
+            f"{r['chunker']:<10} {r['docs_s']:>8.1f} {r['mb_s']:>6.2f} {r['chunks']:>7} {r['tok_mean']:>8.1f} "
+            f"{r['tok_max']:>7} {r['truncated']:>9.1%} {r['whole']:>6.1%} {hit:>6}"
+        )
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    main()
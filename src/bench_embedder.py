@@ -0,0 +1,116 @@
+"""
+Benchmark: query-embedder backends (torch vs onnx vs onnx-int8).
+
+Each backend runs in its own subprocess so load time and RSS are measured
+from a clean interpreter:
+  load_ms   - import + model load
+  first_ms  - first encode (lazy init inside the runtime)
+  rss_mb    - resident memory after the timed queries
+  p50/p99   - single-query encode latency
+  min_cos   - agreement with the torch vectors on the same queries
+
+    python -m src.bench_embedder --queries 300
+    python -m src.bench_embedder --backends torch onnx-int8
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def worker(backend: str, queries: int) -> dict:
+    t0 = time.perf_counter()
+    from src.config import settings
+
+    settings.embedder_backend = backend
+    from src.onnx_embedder import CHECK_SENTENCES
+    from src.retrieval import load_local_embedder
+
+    model = load_local_embedder()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    t1 = time.perf_counter()
+    model.encode(["first query"], batch_size=1, normalize_embeddings=True)
+    first_ms = (time.perf_counter() - t1) * 1000
+
+    lat = []
+    for i in range(queries):
+        q = CHECK_SENTENCES[i % len(CHECK_SENTENCES)] + f" ({i})"
+        t = time.perf_counter()
+        model.encode([q], batch_size=1, normalize_embeddings=True)
+        lat.append((time.perf_counter() - t) * 1000)
+
+    vecs = model.encode(CHECK_SENTENCES, normalize_embeddings=True)
+    return {
+        "backend": backend,
+        "load_ms": load_ms,
+        "first_ms": first_ms,
+        "rss_mb": _rss_mb(),
+        "p50_ms": statistics.median(lat),
+        "p99_ms": _percentile(lat, 99),
+        "vectors": np.asarray(vecs, dtype=np.float32).tolist(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.queries)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, "-m", "src.bench_embedder", "--worker", backend, "--queries", str(args.queries)],
+            capture_output=True,
+            text=True,
+            env=dict(os.environ),
+        )
+        if proc.returncode != 0:
+            print(f"{backend:<10} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    ref = np.asarray(results["torch"]["vectors"]) if "torch" in results else None
+    for backend, r in results.items():
+        cos = ""
+        if ref is not None:
+            cos = f" min_cos={float((ref * np.asarray(r['vectors'])).sum(axis=1).min()):.5f}"
+        print(
+            f"{backend:<10} load={r['load_ms']:8.1f}ms first={r['first_ms']:7.1f}ms "
+            f"rss={r['rss_mb']:7.1f}MB p50={r['p50_ms']:6.2f}ms p99={r['p99_ms']:6.2f}ms{cos}"
+        )
+
+
+if __name__ == "__main__":
+    main()
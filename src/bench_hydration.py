@@ -0,0 +1,125 @@
+"""
+Benchmark: chunk hydration (fetch_chunks_by_ids) before and after the
+read-only serving engine.
+
+  legacy  - named-parameter IN clause built per call, run inside
+            engine.begin() on the default engine (the original code path)
+  current - documents.fetch_chunks_by_ids: json_each + one prepared
+            statement, read-only per-thread connections with mmap
+
+Runs against settings.sqlite_path (or --db) with random top_k id sets.
+
+    python -m src.bench_hydration --requests 2000 --concurrency 8 --top-k 12
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from src.config import settings
+
+
+def legacy_fetch_chunks_by_ids(chunk_ids):
+    # Verbatim copy of the pre-read-engine implementation.
+    from src.db import get_conn
+
+    if not chunk_ids:
+        return []
+
+    params = {}
+    placeholders = []
+    for i, cid in enumerate(chunk_ids):
+        key = f"id{i}"
+        params[key] = cid
+        placeholders.append(f":{key}")
+
+    sql = f"""
+    SELECT chunk_id, doc_id, chunk_index, start_char, end_char, text
+    FROM chunks
+    WHERE chunk_id IN ({", ".join(placeholders)})
+    """
+
+    with get_conn() as conn:
+        rows = conn.execute(text(sql), params).fetchall()
+        by_id = {r[0]: r for r in rows}
+    ordered = []
+    for cid in chunk_ids:
+        if cid in by_id:
+            r = by_id[cid]
+            ordered.append({
+                "chunk_id": r[0],
+                "doc_id": r[1],
+                "chunk_index": int(r[2]),
+                "start_char": int(r[3]),
+                "end_char": int(r[4]),
+                "text": r[5],
+            })
+    return ordered
+
+
+def _percentile(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def run(name, fn, id_sets, *, concurrency: int):
+    def one(ids):
+        t0 = time.perf_counter()
+        fn(ids)
+        return (time.perf_counter() - t0) * 1000
+
+    # Warm both paths (connections, statement caches, page cache) first.
+    for ids in id_sets[:50]:
+        fn(ids)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        lat = list(ex.map(one, id_sets))
+    wall = time.perf_counter() - t0
+
+    print(
+        f"{name:<8} p50={statistics.median(lat):7.3f}ms "
+        f"p99={_percentile(lat, 99):7.3f}ms "
+        f"throughput={len(id_sets) / wall:8.1f} req/s"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=None, help="default: settings.sqlite_path")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--top-k", type=int, default=12)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.db:
+        settings.sqlite_path = os.path.abspath(args.db)
+
+    from src.db import get_read_conn
+    from src.documents import fetch_chunks_by_ids
+
+    with get_read_conn() as conn:
+        all_ids = [r[0] for r in conn.execute(text("SELECT chunk_id FROM chunks")).fetchall()]
+    if not all_ids:
+        raise SystemExit("chunks table is empty; run ingestion first.")
+
+    rng = random.Random(args.seed)
+    id_sets = [rng.sample(all_ids, min(args.top_k, len(all_ids))) for _ in range(args.requests)]
+    assert [c["chunk_id"] for c in legacy_fetch_chunks_by_ids(id_sets[0])] == id_sets[0]
+    assert [c["chunk_id"] for c in fetch_chunks_by_ids(id_sets[0])] == id_sets[0]
+
+    print(
+        f"db={settings.sqlite_path} chunks={len(all_ids)} top_k={args.top_k} "
+        f"requests={args.requests} concurrency={args.concurrency} immutable={settings.sqlite_immutable}"
+    )
+    run("legacy", legacy_fetch_chunks_by_ids, id_sets, concurrency=args.concurrency)
+    run("current", fetch_chunks_by_ids, id_sets, concurrency=args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: new Pinecone client per query (old pinecone_query) vs the shared
+process-wide index handle (get_pinecone_index).
+
+Runs against a local HTTP stand-in for the Pinecone data plane, so no API key
+or network is needed. The stand-in sleeps once per *new* TCP connection to
+model the TLS handshake, and once per request to model server time.
+
+    python -m src.bench_pinecone_client --concurrency 16 --requests 400
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pinecone import Pinecone
+
+from src.config import settings
+from src.retrieval import build_pinecone_index, pinecone_index_query
+
+
+class _FakePineconeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real service
+    handshake_s = 0.0
+    server_s = 0.0
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.handshake_s)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server_s)
+        top_k = int(body.get("topK", 8))
+        payload = json.dumps(
+            {
+                "matches": [
+                    {"id": f"chunk-{i}", "score": 1.0 - i / 100, "metadata": {"doc_id": "bench"}}
+                    for i in range(top_k)
+                ],
+                "namespace": body.get("namespace", ""),
+                "usage": {"readUnits": 1},
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.do_POST()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_pinecone(*, handshake_ms: float, server_ms: float):
+    handler = type(
+        "Handler",
+        (_FakePineconeHandler,),
+        {"handshake_s": handshake_ms / 1000.0, "server_s": server_ms / 1000.0},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _percentile(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def run(name, query_fn, *, concurrency: int, requests: int, dim: int):
+    vec = [random.random() for _ in range(dim)]
+    lat = []
+
+    def one(_):
+        t0 = time.perf_counter()
+        query_fn(vec)
+        return (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        lat = list(ex.map(one, range(requests)))
+    wall = time.perf_counter() - t0
+
+    print(
+        f"{name:<10} p50={statistics.median(lat):7.2f}ms "
+        f"p99={_percentile(lat, 99):7.2f}ms "
+        f"throughput={requests / wall:7.1f} req/s"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--handshake-ms", type=float, default=30.0)
+    ap.add_argument("--server-ms", type=float, default=5.0)
+    ap.add_argument("--dim", type=int, default=384)
+    args = ap.parse_args()
+
+    # The stand-in ignores the key, but the SDK refuses to build a client without one.
+    settings.pinecone_api_key = settings.pinecone_api_key or "bench"
+
+    server, host = start_fake_pinecone(handshake_ms=args.handshake_ms, server_ms=args.server_ms)
+    print(f"fake pinecone at {host} (handshake={args.handshake_ms}ms, server={args.server_ms}ms)")
+    print(f"concurrency={args.concurrency} requests={args.requests} pool_maxsize={settings.pinecone_pool_maxsize}")
+
+    def per_call(vec):
+        # What pinecone_query used to do on every request.
+        pc = Pinecone(api_key=settings.pinecone_api_key)
+        index = pc.Index(host=host)
+        pinecone_index_query(index, vec, top_k=8)
+
+    shared_index = build_pinecone_index(host=host)
+
+    def shared(vec):
+        pinecone_index_query(shared_index, vec, top_k=8)
+
+    run("per-call", per_call, concurrency=args.concurrency, requests=args.requests, dim=args.dim)
+    run("shared", shared, concurrency=args.concurrency, requests=args.requests, dim=args.dim)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
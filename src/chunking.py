@@ -1,5 +1,10 @@
 import hashlib
-from typing import List, Dict
+import re
+import threading
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+from src.config import settings
 
 
 def make_chunk_id(doc_id: str, chunk_index: int, start_char: int, end_char: int) -> str:
@@ -7,6 +12,14 @@ def make_chunk_id(doc_id: str, chunk_index: int, start_char: int, end_char: int)
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
 
 
+def content_hash(text: str) -> str:
+    """
+    Hash of the chunk text itself; chunk_id only covers position, so this is
+    what tells a delta sync that a chunk needs re-embedding.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
 def chunk_text(text: str, *, chunk_size: int, chunk_overlap: int) -> List[Dict]:
     """
     Simple character chunking:
@@ -40,3 +53,164 @@ def chunk_text(text: str, *, chunk_size: int, chunk_overlap: int) -> List[Dict]:
         i += 1
 
     return chunks
+
+
+# -----------------------------
+# Structure-aware chunking (settings.chunker="structure")
+# -----------------------------
+# One precompiled scanner finds every candidate boundary in a single pass.
+# Each alternative is a boundary kind; stronger kinds are preferred split points:
+#   heading   ARTICLE/Section/Exhibit lines and short ALL-CAPS title lines
+#   clause    numbered clauses at line start: "1.", "12.3", "(a)", "(iv)", "b)"
+#   para      blank line
+#   sentence  end punctuation followed by a capitalised/numbered start, or a line break
+_BOUNDARY_RE = re.compile(
+    r"""
+    (?P<heading>^[ \t]*(?:(?:ARTICLE|Article|SECTION|Section|EXHIBIT|Exhibit|SCHEDULE|Schedule|ANNEX|Annex)
+                          [ \t]+[0-9IVXLC]+\b|[A-Z][A-Z0-9 ,&'\-]{3,80}$))
+   |(?P<clause>^[ \t]*(?:\d{1,3}(?:\.\d{1,3})*\.?|\([a-zA-Z0-9]{1,4}\)|[a-z]\))[ \t]+(?=\S))
+   |(?P<para>\n[ \t]*\n)
+   |(?P<sentence>(?<=[.!?;:])["')\]]?(?:[ \t]*\n|[ \t]+(?=[A-Z0-9("])))
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+_LEVELS = {"heading": 3, "clause": 2, "para": 2, "sentence": 1}
+
+_TOKENIZER = None
+_TOKENIZER_LOCK = threading.Lock()
+
+
+def get_chunk_tokenizer():
+    """
+    The query embedder's own tokenizer (tokenizer.json next to the
+    sentence-transformers model), so chunk sizes are measured in the tokens
+    the embedder will actually see. Loaded once per process.
+    """
+    global _TOKENIZER
+    if _TOKENIZER is not None:
+        return _TOKENIZER
+    with _TOKENIZER_LOCK:
+        if _TOKENIZER is None:
+            from tokenizers import Tokenizer
+
+            path = Path(settings.local_embedding_model) / "tokenizer.json"
+            if not path.exists():
+                raise FileNotFoundError(f"{path} not found; run bake_embedder.py or set CHUNKER=chars.")
+            tok = Tokenizer.from_file(str(path))
+            tok.no_truncation()
+            tok.no_padding()
+            _TOKENIZER = tok
+    return _TOKENIZER
+
+
+def scan_units(text: str) -> List[Tuple[int, int, int]]:
+    """
+    Split `text` into (start, end, level) units at every boundary the scanner
+    finds; `level` is the strength of the boundary the unit starts at.
+    """
+    cuts = {0: 3}
+    for m in _BOUNDARY_RE.finditer(text):
+        kind = m.lastgroup
+        pos = m.start() if kind in ("heading", "clause") else m.end()
+        if 0 < pos < len(text) and cuts.get(pos, 0) < _LEVELS[kind]:
+            cuts[pos] = _LEVELS[kind]
+    starts = sorted(cuts)
+    ends = starts[1:] + [len(text)]
+    return [(s, e, cuts[s]) for s, e in zip(starts, ends) if text[s:e].strip()]
+
+
+def _split_long(text: str, start: int, end: int, offsets: List[Tuple[int, int]], max_tokens: int) -> List[Tuple[int, int]]:
+    # A single unit over budget (a run-on clause or table): cut every max_tokens
+    # tokens, backing off to the preceding whitespace so words stay whole.
+    pieces = []
+    lo = start
+    for j in range(max_tokens, len(offsets), max_tokens):
+        cut = start + offsets[j][0]
+        back = cut
+        while back > lo and not text[back - 1].isspace():
+            back -= 1
+        cut = back if back > lo else cut
+        if cut > lo:
+            pieces.append((lo, cut))
+            lo = cut
+    pieces.append((lo, end))
+    return pieces
+
+
+def chunk_structured(text: str, *, max_tokens: int, overlap_tokens: int = 0, min_tokens: int = 0) -> List[Dict]:
+    """
+    Clause-aware chunking: pack whole sentences/clauses greedily up to
+    max_tokens (embedder tokens, counted in one batched tokenizer call), start
+    a new chunk at a heading once the current one has min_tokens, and repeat
+    up to overlap_tokens of trailing sentences at the start of the next chunk.
+    Same output shape as chunk_text; start/end are trimmed of whitespace.
+    """
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be > 0")
+    if overlap_tokens < 0 or overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be >=0 and < max_tokens")
+
+    units = scan_units(text)
+    if not units:
+        return []
+    encs = get_chunk_tokenizer().encode_batch([text[s:e] for s, e, _ in units], add_special_tokens=False)
+
+    spans: List[Tuple[int, int, int, int]] = []  # (start, end, n_tokens, level)
+    for (s, e, level), enc in zip(units, encs):
+        n = len(enc.ids)
+        if n <= max_tokens:
+            spans.append((s, e, n, level))
+            continue
+        for i, (ps, pe) in enumerate(_split_long(text, s, e, enc.offsets, max_tokens)):
+            spans.append((ps, pe, min(n, max_tokens), level if i == 0 else 0))
+
+    groups: List[List[int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, (_, _, n, level) in enumerate(spans):
+        full = cur_tokens + n > max_tokens
+        at_heading = level >= 3 and cur_tokens >= min_tokens
+        if cur and (full or at_heading):
+            groups.append(cur)
+            # Carry trailing units into the next chunk, never the whole chunk.
+            carry: List[int] = []
+            carried = 0
+            if not at_heading:
+                for j in reversed(cur[1:]):
+                    if carried + spans[j][2] > overlap_tokens or carried + spans[j][2] + n > max_tokens:
+                        break
+                    carry.insert(0, j)
+                    carried += spans[j][2]
+            cur, cur_tokens = carry, carried
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        groups.append(cur)
+
+    chunks = []
+    for g in groups:
+        start, end = spans[g[0]][0], spans[g[-1]][1]
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start == end:
+            continue
+        chunks.append({"chunk_index": len(chunks), "start_char": start, "end_char": end, "text": text[start:end]})
+    return chunks
+
+
+def chunk_document(text: str, *, chunker: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
+    """
+    Ingest entry point: "chars" (fixed character windows) or "structure".
+    """
+    if chunker == "chars":
+        return chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if chunker == "structure":
+        return chunk_structured(
+            text,
+            max_tokens=settings.chunk_tokens,
+            overlap_tokens=settings.chunk_overlap_tokens,
+            min_tokens=settings.chunk_min_tokens,
+        )
+    raise ValueError(f"Unknown chunker: {chunker!r} (expected 'chars' or 'structure')")
@@ -0,0 +1,411 @@
+"""
+Precomputed CUAD clause answers (clause_answers table).
+
+Most questions are one of the 41 CUAD categories asked about one contract.
+The batch job answers every category for every contract once:
+- from the `annotations` table (CUAD ground truth) where the contract has one;
+- otherwise with batched retrieval + Gemini (same prompt as /ask).
+
+At serving time match_category() maps a question onto a category (embedding
+match against the category name + CUAD description, plus a boost when the
+category name appears verbatim) and lookup_clause_answer() returns the stored
+answer for (doc_id, category) without a retrieval or LLM call. Anything that
+doesn't clear settings.clause_match_threshold falls through to live RAG.
+
+    python -m src.clause_extraction                    # fill missing rows
+    python -m src.clause_extraction --doc-id <id> --force
+    python -m src.clause_extraction --annotations-only # no Gemini calls
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from src.config import settings
+from src.db import get_conn, get_read_conn, init_schema, run_read
+
+# CUAD labels look like:
+#   Highlight the parts (if any) of this contract related to "Governing Law" that
+#   should be reviewed by a lawyer. Details: Which state/country's law governs ...
+_LABEL_RE = re.compile(r'related to "(?P<category>[^"]+)"(?:.*?Details:\s*(?P<details>.*))?', re.S)
+
+NOT_FOUND_ANSWER = 'This contract has no "{category}" clause (per the CUAD annotations).'
+
+CLAUSE_ANSWERS_DDL = """
+CREATE TABLE IF NOT EXISTS clause_answers (
+    doc_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    found INTEGER NOT NULL,
+    spans_json TEXT NOT NULL,
+    chunk_ids_json TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fingerprint TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (doc_id, category),
+    FOREIGN KEY (doc_id) REFERENCES documents(doc_id)
+);
+"""
+
+_UPSERT_SQL = text("""
+INSERT INTO clause_answers
+    (doc_id, category, question, answer, found, spans_json, chunk_ids_json, source, fingerprint)
+VALUES
+    (:doc_id, :category, :question, :answer, :found, :spans_json, :chunk_ids_json, :source, :fingerprint)
+ON CONFLICT(doc_id, category) DO UPDATE SET
+    question = excluded.question,
+    answer = excluded.answer,
+    found = excluded.found,
+    spans_json = excluded.spans_json,
+    chunk_ids_json = excluded.chunk_ids_json,
+    source = excluded.source,
+    fingerprint = excluded.fingerprint,
+    created_at = CURRENT_TIMESTAMP
+""")
+
+_LOOKUP_SQL = text("""
+SELECT category, answer, found, spans_json, chunk_ids_json, source
+FROM clause_answers
+WHERE doc_id = :doc_id AND category = :category
+""")
+
+
+def parse_label(label: str) -> Tuple[str, str]:
+    """
+    (category, details) from a CUAD question; labels in another format are
+    used whole as the category.
+    """
+    m = _LABEL_RE.search(label or "")
+    if not m:
+        return label.strip(), ""
+    return m.group("category").strip(), (m.group("details") or "").strip()
+
+
+def category_query(category: str, details: str) -> str:
+    # What both the matcher and the RAG fallback embed: short and question-like,
+    # without CUAD's shared "Highlight the parts ..." boilerplate.
+    return f"{category}. {details}" if details else category
+
+
+def ensure_clause_table() -> None:
+    with get_conn() as conn:
+        conn.execute(text(CLAUSE_ANSWERS_DDL))
+
+
+def _has_clause_table(conn) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clause_answers'")
+    ).first() is not None
+
+
+# -----------------------------
+# Serving: question -> category -> stored answer
+# -----------------------------
+class CategoryMatcher:
+    """
+    Nearest CUAD category for a question vector. Category vectors are built
+    once from category_query(); names are also matched verbatim (word
+    boundaries, case-insensitive) and add settings.clause_match_lexical_boost.
+    """
+
+    def __init__(self, categories: Dict[str, str], vectors: np.ndarray, *, threshold: float, lexical_boost: float):
+        self.categories = list(categories)
+        self.queries = [categories[c] for c in self.categories]
+        self.vectors = vectors
+        self.threshold = threshold
+        self.lexical_boost = lexical_boost
+        self._name_res = [re.compile(rf"\b{re.escape(c.lower())}\b") for c in self.categories]
+
+    def match(self, question: str, vector) -> Optional[Dict[str, Any]]:
+        if not self.categories:
+            return None
+        q = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        lowered = question.lower()
+        for i, name_re in enumerate(self._name_res):
+            if name_re.search(lowered):
+                scores[i] += self.lexical_boost
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < self.threshold:
+            return None
+        return {"category": self.categories[best], "score": round(score, 4)}
+
+
+_MATCHER = None
+_MATCHER_LOCK = threading.Lock()
+
+
+def _build_category_matcher() -> CategoryMatcher:
+    from src.retrieval import get_embedder
+
+    with get_read_conn() as conn:
+        labels = []
+        if _has_clause_table(conn):
+            labels = [r[0] for r in conn.execute(text("SELECT DISTINCT question FROM clause_answers")).fetchall()]
+    categories: Dict[str, str] = {}
+    for label in labels:
+        category, details = parse_label(label)
+        categories.setdefault(category, category_query(category, details))
+    if categories:
+        vectors = get_embedder().encode(
+            list(categories.values()), batch_size=settings.embed_batch_size, normalize_embeddings=True
+        )
+        vectors = np.asarray(vectors, dtype=np.float32)
+    else:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    return CategoryMatcher(
+        categories,
+        vectors,
+        threshold=settings.clause_match_threshold,
+        lexical_boost=settings.clause_match_lexical_boost,
+    )
+
+
+def get_category_matcher() -> CategoryMatcher:
+    """
+    Built once from the clause_answers table. An empty matcher (table missing
+    or not yet extracted) is not kept, so it is rebuilt once the table has rows.
+    """
+    global _MATCHER
+    if _MATCHER is None:
+        with _MATCHER_LOCK:
+            if _MATCHER is None:
+                matcher = _build_category_matcher()
+                if not matcher.categories:
+                    return matcher
+                _MATCHER = matcher
+    return _MATCHER
+
+
+def match_category(question: str, vector) -> Optional[Dict[str, Any]]:
+    return get_category_matcher().match(question, vector)
+
+
+def fetch_clause_answer(doc_id: str, category: str) -> Optional[Dict[str, Any]]:
+    from src.documents import fetch_chunks_by_ids
+
+    with get_read_conn() as conn:
+        row = conn.execute(_LOOKUP_SQL, {"doc_id": doc_id, "category": category}).first()
+    if row is None:
+        return None
+    r = dict(row._mapping)
+    chunk_ids = json.loads(r["chunk_ids_json"])
+    if r["source"] == "annotation":
+        sources = [
+            {"chunk_id": f"CUAD: {category}", "doc_id": doc_id, "chunk_index": i, "text": span, "score": None}
+            for i, span in enumerate(json.loads(r["spans_json"]))
+        ]
+    else:
+        sources = [
+            {"chunk_id": c["chunk_id"], "doc_id": c["doc_id"], "chunk_index": c["chunk_index"], "text": c["text"], "score": None}
+            for c in fetch_chunks_by_ids(chunk_ids)
+        ]
+    return {
+        "answer": r["answer"],
+        "citations": [],
+        "sources": sources,
+        "retrieved_chunk_ids": chunk_ids,
+        "doc_id_filter": doc_id,
+        "cache": None,
+        "context": None,
+        "clause": {"category": category, "source": r["source"], "found": bool(r["found"])},
+        "debug": None,
+    }
+
+
+def lookup_clause_answer(question: str, *, doc_id: Optional[str], vector) -> Optional[Dict[str, Any]]:
+    """
+    Stored answer when `question` is a CUAD category question about `doc_id`, else None.
+    """
+    if not settings.clause_answers or not doc_id:
+        return None
+    m = match_category(question, vector)
+    if m is None:
+        return None
+    res = fetch_clause_answer(doc_id, m["category"])
+    if res is not None:
+        res["clause"]["score"] = m["score"]
+    return res
+
+
+async def lookup_clause_answer_async(question: str, *, doc_id: Optional[str], vector) -> Optional[Dict[str, Any]]:
+    if not settings.clause_answers or not doc_id:
+        return None
+    m = await run_read(match_category, question, vector)
+    if m is None:
+        return None
+    res = await run_read(fetch_clause_answer, doc_id, m["category"])
+    if res is not None:
+        res["clause"]["score"] = m["score"]
+    return res
+
+
+# -----------------------------
+# Batch job
+# -----------------------------
+def load_categories() -> Dict[str, str]:
+    """
+    category -> full CUAD label, from the annotations table.
+    """
+    with get_conn() as conn:
+        labels = [r[0] for r in conn.execute(text("SELECT DISTINCT label FROM annotations ORDER BY label")).fetchall()]
+    out: Dict[str, str] = {}
+    for label in labels:
+        out.setdefault(parse_label(label)[0], label)
+    return out
+
+
+def annotation_rows(doc_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Ground-truth rows for one contract. An annotation with no answer spans
+    means the annotators found no such clause, which is an answer too.
+    """
+    with get_conn() as conn:
+        rows = conn.execute(
+            text("SELECT label, answer_texts_json FROM annotations WHERE doc_id = :doc_id"), {"doc_id": doc_id}
+        ).fetchall()
+    out = {}
+    for label, answer_texts_json in rows:
+        category = parse_label(label)[0]
+        spans = list(dict.fromkeys(t.strip() for t in json.loads(answer_texts_json) if t.strip()))
+        out[category] = {
+            "doc_id": doc_id,
+            "category": category,
+            "question": label,
+            "answer": "\n".join(spans) if spans else NOT_FOUND_ANSWER.format(category=category),
+            "found": int(bool(spans)),
+            "spans_json": json.dumps(spans, ensure_ascii=False),
+            "chunk_ids_json": "[]",
+            "source": "annotation",
+            "fingerprint": None,
+        }
+    return out
+
+
+def rag_rows(doc_id: str, pending: Dict[str, str], *, top_k: int, concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Answer the `pending` categories (category -> label) for one contract:
+    one batched encode, concurrent retrievals, one hydration over the union of
+    chunk ids, and Gemini calls batched with bounded concurrency.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from src.documents import fetch_chunks_by_ids
+    from src.hybrid import retrieve
+    from src.rag import _build_prompt, _answer_text, get_llm, prompt_fingerprint
+    from src.retrieval import get_embedder
+
+    categories = list(pending)
+    queries = [category_query(*parse_label(pending[c])) for c in categories]
+    vectors = get_embedder().encode(queries, batch_size=settings.embed_batch_size, normalize_embeddings=True)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(
+            lambda qv: retrieve(qv[0], top_k=top_k, doc_id=doc_id, vector=[float(x) for x in qv[1]]),
+            zip(queries, vectors),
+        ))
+    matches = [r.get("matches", []) for r in results]
+    by_id = {c["chunk_id"]: c for c in fetch_chunks_by_ids(list(dict.fromkeys(m["id"] for ms in matches for m in ms)))}
+
+    prompts = []
+    for q, ms in zip(queries, matches):
+        chunks = [by_id[m["id"]] for m in ms if m["id"] in by_id]
+        prompts.append(_build_prompt(q, ms, chunks)[0])
+    answers = get_llm().batch(prompts, config={"max_concurrency": concurrency})
+
+    fingerprint = prompt_fingerprint()
+    rows = []
+    for category, ms, ai_msg in zip(categories, matches, answers):
+        answer = _answer_text(ai_msg)
+        rows.append({
+            "doc_id": doc_id,
+            "category": category,
+            "question": pending[category],
+            "answer": answer,
+            "found": int("cannot find the answer" not in answer.lower()),
+            "spans_json": "[]",
+            "chunk_ids_json": json.dumps([m["id"] for m in ms]),
+            "source": "rag",
+            "fingerprint": fingerprint,
+        })
+    return rows
+
+
+def existing_categories(doc_id: str) -> set:
+    with get_conn() as conn:
+        rows = conn.execute(text("SELECT category FROM clause_answers WHERE doc_id = :doc_id"), {"doc_id": doc_id}).fetchall()
+    return {r[0] for r in rows}
+
+
+def extract_all(
+    *,
+    doc_ids: Optional[List[str]] = None,
+    force: bool = False,
+    annotations_only: bool = False,
+    top_k: int = 8,
+    concurrency: int = 0,
+) -> Dict[str, int]:
+    init_schema()
+    ensure_clause_table()
+    concurrency = concurrency or settings.clause_batch_concurrency
+
+    categories = load_categories()
+    if not categories:
+        raise RuntimeError("No annotations in the DB; ingest CUAD first (python -m src.ingest_cuad_to_sqlite).")
+    if doc_ids is None:
+        with get_conn() as conn:
+            doc_ids = [r[0] for r in conn.execute(text("SELECT doc_id FROM documents ORDER BY doc_id")).fetchall()]
+
+    counts = {"docs": 0, "annotation": 0, "rag": 0, "skipped": 0}
+    t0 = time.perf_counter()
+    for i, doc_id in enumerate(doc_ids, 1):
+        done = set() if force else existing_categories(doc_id)
+        rows = [r for c, r in annotation_rows(doc_id).items() if c not in done]
+        covered = done | {r["category"] for r in rows}
+        pending = {c: label for c, label in categories.items() if c not in covered}
+
+        if pending and not annotations_only:
+            rows += rag_rows(doc_id, pending, top_k=top_k, concurrency=concurrency)
+        else:
+            counts["skipped"] += len(pending)
+
+        if rows:
+            with get_conn() as conn:
+                conn.execute(_UPSERT_SQL, rows)
+        for r in rows:
+            counts[r["source"]] += 1
+        counts["docs"] += 1
+        if i % 50 == 0:
+            print(f"[clause_answers] {i}/{len(doc_ids)} docs {counts} elapsed={time.perf_counter() - t0:.1f}s")
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Precompute per-contract answers for the CUAD categories.")
+    ap.add_argument("--doc-id", action="append", help="only these contracts (repeatable)")
+    ap.add_argument("--force", action="store_true", help="recompute rows that already exist")
+    ap.add_argument("--annotations-only", action="store_true", help="only store CUAD ground truth; no Gemini calls")
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--concurrency", type=int, default=0, help="parallel retrievals / Gemini calls (default: settings)")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    counts = extract_all(
+        doc_ids=args.doc_id,
+        force=args.force,
+        annotations_only=args.annotations_only,
+        top_k=args.top_k,
+        concurrency=args.concurrency,
+    )
+    print(f"✅ clause_answers: {counts} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
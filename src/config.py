@@ -13,24 +13,172 @@ class Settings(BaseSettings):
     )
 
     # Accept upper-case env vars (Cloud Run / deploy.sh)
-    pinecone_api_key: str = Field(validation_alias="PINECONE_API_KEY")
+    # Optional when vector_backend="local" (no live Pinecone needed)
+    pinecone_api_key: str = Field(default="", validation_alias="PINECONE_API_KEY")
     gemini_api_key: str = Field(validation_alias="GEMINI_API_KEY")
 
     # Let Cloud Run override DB path
     sqlite_path: str = Field(default=str(ROOT / "data" / "contractrag.db"), validation_alias="SQLITE_PATH")
 
     raw_data_dir: str = str(ROOT / "data" / "raw")
+
+    # Cold-start DB fetch (src/db_artifact.py). gs://bucket/object or a local path;
+    # empty = use GCS_DB_BUCKET + GCS_DB_OBJECT from deploy.sh (or nothing for local dev)
+    db_artifact_uri: str = Field(default="", validation_alias="DB_ARTIFACT_URI")
+    db_download_workers: int = 8
+    # How long a request waits for the DB to become ready before returning 503
+    db_ready_wait_s: float = 30.0
     
     pinecone_index_name: str = "contractiq-384"
     pinecone_namespace: str = "cuad-chunks-v2"
     pinecone_metric: str = "cosine"
+    # Optional: index host (e.g. "contractiq-384-xxxx.svc.pinecone.io") skips the describe_index lookup
+    pinecone_index_host: str = Field(default="", validation_alias="PINECONE_INDEX_HOST")
+    pinecone_pool_threads: int = 4
+    pinecone_pool_maxsize: int = 16
+    vector_warmup: bool = True
+    # Load the embedder + one dummy encode at startup (in parallel with the DB download)
+    embedder_warmup: bool = True
+
+    # "pinecone" or "local" (memory-mapped NumPy index built by `python -m src.local_index`)
+    vector_backend: str = Field(default="pinecone", validation_alias="VECTOR_BACKEND")
+    local_index_dir: str = Field(default=str(ROOT / "data" / "local_index"), validation_alias="LOCAL_INDEX_DIR")
+    local_index_mode: str = "exact"  # "exact" or "ivf"
+    local_index_nprobe: int = 8
+    # doc_id-scoped questions: search the contract's vectors in-process (per-doc LRU)
+    # instead of a filtered remote query. Vectors come from the local index when
+    # one exists ("auto"), else are fetched from Pinecone once per contract.
+    doc_fast_path: bool = Field(default=True, validation_alias="DOC_FAST_PATH")
+    doc_vector_cache_size: int = 64
+    doc_vector_negative_ttl_s: float = 60.0  # docs with no vectors aren't retried sooner
+    doc_vector_source: str = "auto"  # "auto", "local" or "pinecone"
+    pinecone_fetch_batch: int = 200
+
+    # Hybrid retrieval: dense + SQLite FTS5 BM25, merged with reciprocal rank fusion
+    hybrid_retrieval: bool = Field(default=False, validation_alias="HYBRID_RETRIEVAL")
+    hybrid_candidates: int = 30  # per-retriever candidates before fusion
+    rrf_k: int = 60
+    hybrid_dense_weight: float = 1.0
+    hybrid_lexical_weight: float = 1.0
 
     local_embedding_model: str = "/app/models/all-MiniLM-L6-v2"
     force_cpu: bool = True
+    # Query embedder: "torch" (sentence-transformers), "onnx" or "onnx-int8"
+    # (ONNX Runtime graphs exported by bake_embedder.py; indexes stay torch-built)
+    embedder_backend: str = Field(default="torch", validation_alias="EMBEDDER_BACKEND")
+    onnx_threads: int = 0  # 0 = ONNX Runtime default
     embed_batch_size: int = 64
 
+    # Pipelined embed -> upsert (python -m src.upsert_chunks_to_pinecone)
+    upsert_workers: int = 4
+    pipeline_queue_size: int = 4
+
+    # Query-embedding cache (LRU + optional TTL; 0 = no expiry)
+    embed_cache_size: int = 4096
+    embed_cache_ttl_s: float = 0
+    # Optional SQLite file for a persistent tier (point at a mounted volume to survive cold starts)
+    embed_cache_path: str = Field(default="", validation_alias="EMBED_CACHE_PATH")
+    # Embed the CUAD category questions at startup
+    embed_cache_prewarm: bool = True
+
+    # Exact-answer cache for rag_answer (key: question, doc_id, top_k, prompt, corpus version)
+    answer_cache: bool = Field(default=True, validation_alias="ANSWER_CACHE")
+    answer_cache_size: int = 1024
+    answer_cache_ttl_s: float = 86400
+    # Optional SQLite file for a persistent tier
+    answer_cache_path: str = Field(default="", validation_alias="ANSWER_CACHE_PATH")
+    # Bump to invalidate every cached answer without a redeploy of the DB
+    answer_cache_version: str = Field(default="", validation_alias="ANSWER_CACHE_VERSION")
+
+    # Semantic answer cache: reuse an answer for a paraphrased question (same doc_id/top_k)
+    # when the query embeddings' cosine similarity is >= the threshold. Opt-in.
+    semantic_cache: bool = Field(default=False, validation_alias="SEMANTIC_CACHE")
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_size: int = 2048
+
+    # Precomputed CUAD clause answers (python -m src.clause_extraction): a question that
+    # matches a category (cosine to "<category>. <CUAD description>", + boost when the
+    # name appears verbatim) about a doc_id is answered from clause_answers.
+    # Off by default: the threshold hasn't been checked on paraphrased or
+    # off-category questions, and a false match returns raw annotation spans.
+    clause_answers: bool = Field(default=False, validation_alias="CLAUSE_ANSWERS")
+    clause_match_threshold: float = Field(default=0.75, validation_alias="CLAUSE_MATCH_THRESHOLD")
+    clause_match_lexical_boost: float = 0.1
+    clause_batch_concurrency: int = 8
+
+    # Post-retrieval diversification (defaults; /ask can override per request):
+    # MMR over mmr_fetch_factor x k candidates using their stored vectors, and
+    # +/-neighbor_window chunks around each winner (one SQLite query)
+    mmr: bool = Field(default=False, validation_alias="MMR")
+    mmr_lambda: float = 0.5
+    mmr_fetch_factor: int = 3
+    neighbor_window: int = Field(default=0, validation_alias="NEIGHBOR_WINDOW")
+    neighbor_window_max: int = 2
+
+    # Cross-encoder reranking (opt-in): over-fetch rerank_candidates, keep the best
+    # rerank_top_n; falls back to retrieval order if scoring exceeds rerank_budget_ms
+    rerank: bool = Field(default=False, validation_alias="RERANK")
+    rerank_model: str = Field(default="/app/models/ms-marco-MiniLM-L-6-v2", validation_alias="RERANK_MODEL")
+    rerank_candidates: int = 30
+    rerank_top_n: int = 6
+    rerank_batch_size: int = 16
+    rerank_max_length: int = 512
+    rerank_budget_ms: float = Field(default=400.0, validation_alias="RERANK_BUDGET_MS")
+    rerank_cache_size: int = 16384
+    rerank_workers: int = 2
+
+    # Prompt context: merge overlapping chunks of a doc into spans, drop near-duplicate
+    # spans, and pack the best ones into a token budget (estimated as chars / chars_per_token).
+    # The default budget holds the default /ask top_k=12 x chunk_size=1200 chars, so
+    # only neighbour expansion or larger top_k can push chunks out (reported per answer).
+    context_builder: bool = Field(default=True, validation_alias="CONTEXT_BUILDER")
+    context_token_budget: int = Field(default=3600, validation_alias="CONTEXT_TOKEN_BUDGET")
+    context_dedupe_threshold: float = 0.9
+    context_chars_per_token: float = 4.0
+
+    # /ask/batch: many questions about one contract in one request
+    batch_max_questions: int = 64
+    batch_llm_concurrency: int = Field(default=8, validation_alias="BATCH_LLM_CONCURRENCY")
+
+    # Micro-batching of concurrent query embeddings
+    embed_batching: bool = True
+    embed_batch_max_size: int = 32
+    embed_batch_max_wait_ms: float = 2.0
+    embed_batch_timeout_s: float = 30.0  # callers give up on a stuck batch instead of hanging
+
+    # Async request path: bounded pools for blocking work
+    embed_executor_workers: int = 2
+    vector_query_workers: int = 32
+    sqlite_reader_threads: int = 8
+
+    # Read-only serving connections (db.get_read_conn)
+    # Only enable immutable when nothing writes the DB while the app runs
+    sqlite_immutable: bool = Field(default=False, validation_alias="SQLITE_IMMUTABLE")
+    sqlite_mmap_size: int = 268435456  # 256 MiB
+    sqlite_read_cache_kib: int = 16384  # per connection
+    sqlite_read_pool_size: int = 64  # pooled read connections kept open (bursts open more)
+
+    # "chars": fixed chunk_size-character windows with chunk_overlap (default)
+    # "structure": whole sentences/numbered clauses packed up to chunk_tokens
+    #              embedder tokens, breaking at section headings (src/chunking.py)
+    chunker: str = Field(default="chars", validation_alias="CHUNKER")
     chunk_size: int = 1200
     chunk_overlap: int = 200
+    chunk_tokens: int = 240  # all-MiniLM-L6-v2 truncates at 256 incl. [CLS]/[SEP]
+    chunk_overlap_tokens: int = 32
+    chunk_min_tokens: int = 64  # don't break at a heading before this many tokens
+
+    # "inline": chunks.text holds the chunk text (default)
+    # "offsets": each contract is stored once, compressed, in documents.text_z and
+    #            chunk text is sliced from it by (start_char, end_char)
+    chunk_storage: str = Field(default="inline", validation_alias="CHUNK_STORAGE")
+    doc_text_codec: str = "zlib"  # or "zstd" (needs the zstandard package)
+    doc_text_cache_size: int = 64  # decompressed documents kept per process
+
+    # Bulk ingestion (python -m src.ingest_cuad_to_sqlite)
+    ingest_workers: int = 0  # 0 = os.cpu_count()
+    ingest_batch_rows: int = 5000
+    bulk_cache_size_kib: int = 262144
 
     gemini_model: str = "gemini-2.5-flash"
 
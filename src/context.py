@@ -0,0 +1,189 @@
+"""
+Token-budgeted context assembly for the RAG prompt.
+
+Retrieved chunks overlap (chunk_overlap chars between neighbours) and often
+come back as runs of adjacent chunks from the same contract. Instead of
+pasting every chunk into the prompt:
+
+1. chunks of the same doc whose [start_char, end_char) touch or overlap are
+   merged into one contiguous span (overlap text appears once);
+2. spans that are near-duplicates of a better-ranked span (boilerplate shared
+   across contracts, re-chunked copies) are dropped;
+3. spans are packed by score (the rerank score when the matches were
+   reranked, else the retrieval score) into settings.context_token_budget.
+
+build_context() returns prompt-ready items ({"chunk_id", "text"}, where
+chunk_id lists every merged chunk so citations still resolve) plus a report
+with the tokens saved versus the naive prompt.
+"""
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.config import settings
+
+_WORD_RE = re.compile(r"\w+")
+
+_STATS_LOCK = threading.Lock()
+_STATS = {"requests": 0, "tokens_naive": 0, "tokens_packed": 0, "tokens_saved": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    # Gemini averages ~4 characters per token on English prose; an estimate is
+    # all the budget needs (the exact count isn't known before the call).
+    return math.ceil(len(text) / settings.context_chars_per_token)
+
+
+def _get(m, key: str):
+    return m.get(key) if isinstance(m, dict) else getattr(m, key, None)
+
+
+def merge_spans(chunks: Sequence[Dict], scores: Dict[str, float]) -> List[Dict]:
+    """
+    Merge touching/overlapping chunks of the same doc. A span's score is its
+    best member's score and its rank the best member's retrieval rank.
+    """
+    by_doc: Dict[str, List[Tuple[int, Dict]]] = {}
+    for rank, c in enumerate(chunks):
+        by_doc.setdefault(c["doc_id"], []).append((rank, c))
+
+    spans = []
+    for doc_id, items in by_doc.items():
+        items.sort(key=lambda rc: rc[1]["start_char"])
+        cur: Optional[Dict] = None
+        for rank, c in items:
+            score = scores.get(c["chunk_id"])
+            score = float(score) if score is not None else 0.0
+            if cur is not None and c["start_char"] <= cur["end_char"]:
+                if c["end_char"] > cur["end_char"]:
+                    cur["text"] += c["text"][cur["end_char"] - c["start_char"]:]
+                    cur["end_char"] = c["end_char"]
+                cur["chunk_ids"].append(c["chunk_id"])
+                cur["score"] = max(cur["score"], score)
+                cur["rank"] = min(cur["rank"], rank)
+                continue
+            if cur is not None:
+                spans.append(cur)
+            cur = {
+                "doc_id": doc_id,
+                "start_char": c["start_char"],
+                "end_char": c["end_char"],
+                "text": c["text"],
+                "chunk_ids": [c["chunk_id"]],
+                "score": score,
+                "rank": rank,
+            }
+        if cur is not None:
+            spans.append(cur)
+
+    # Best first: score, then retrieval rank (RRF/BM25 scores aren't comparable to cosine, rank always is)
+    spans.sort(key=lambda s: (-s["score"], s["rank"]))
+    return spans
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def drop_near_duplicates(spans: List[Dict], threshold: float) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Keep a span unless its 5-word-shingle set overlaps a kept one by >= threshold
+    (containment of the smaller set, so a span inside a longer one also counts).
+    `spans` must be best-first. Returns (kept, dropped).
+    """
+    kept: List[Tuple[Dict, set]] = []
+    dropped: List[Dict] = []
+    for s in spans:
+        sh = _shingles(s["text"])
+        dup = False
+        for _, ksh in kept:
+            inter = len(sh & ksh)
+            if inter and inter / min(len(sh), len(ksh)) >= threshold:
+                dup = True
+                break
+        if dup:
+            dropped.append(s)
+        else:
+            kept.append((s, sh))
+    return [s for s, _ in kept], dropped
+
+
+def pack(spans: List[Dict], budget: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Greedy by score. A span that doesn't fit is skipped (a smaller one may);
+    the best span is truncated rather than dropped if it alone exceeds the budget.
+    Returns (packed, skipped).
+    """
+    out: List[Dict] = []
+    used = 0
+    skipped: List[Dict] = []
+    for s in spans:
+        t = estimate_tokens(s["text"])
+        if used + t <= budget:
+            out.append(s)
+            used += t
+        elif not out:
+            max_chars = int(budget * settings.context_chars_per_token)
+            cut = s["text"].rfind(" ", 0, max_chars)
+            out.append({**s, "text": s["text"][: cut if cut > 0 else max_chars], "truncated": True})
+            used = budget
+        else:
+            skipped.append(s)
+    return out, skipped
+
+
+def build_context(chunks: List[Dict], matches: Sequence[Any], *, budget: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Returns (prompt_chunks, report). With settings.context_builder off, the
+    chunks are passed through unchanged (the report still shows their size).
+    """
+    naive = sum(estimate_tokens(c["text"]) for c in chunks)
+    if not settings.context_builder or not chunks:
+        return list(chunks), {"tokens_naive": naive, "tokens_packed": naive, "tokens_saved": 0, "chunks": len(chunks)}
+
+    budget = budget or settings.context_token_budget
+    # Reranked matches are ranked by the cross-encoder, not by the retrieval
+    # score they still carry (which would undo the rerank order).
+    key = "rerank_score" if any(_get(m, "rerank_score") is not None for m in matches) else "score"
+    scores = {_get(m, "id"): _get(m, key) for m in matches}
+    spans = merge_spans(chunks, scores)
+    n_merged = len(spans)
+    spans, dupes = drop_near_duplicates(spans, settings.context_dedupe_threshold)
+    spans, skipped = pack(spans, budget)
+
+    prompt_chunks = [{"chunk_id": ", ".join(s["chunk_ids"]), "doc_id": s["doc_id"], "text": s["text"]} for s in spans]
+    packed = sum(estimate_tokens(s["text"]) for s in spans)
+    report = {
+        "tokens_naive": naive,
+        "tokens_packed": packed,
+        "tokens_saved": naive - packed,
+        "budget": budget,
+        "chunks": len(chunks),
+        "spans": len(spans),
+        "merged_spans": n_merged,
+        "dropped_duplicates": len(dupes),
+        "dropped_budget": len(skipped),
+        # Retrieved chunks the model never sees, so callers can tell a miss from a drop
+        "dropped_chunk_ids": {
+            "duplicate": [cid for s in dupes for cid in s["chunk_ids"]],
+            "budget": [cid for s in skipped for cid in s["chunk_ids"]],
+        },
+        "truncated_chunk_ids": [cid for s in spans if s.get("truncated") for cid in s["chunk_ids"]],
+    }
+    with _STATS_LOCK:
+        _STATS["requests"] += 1
+        _STATS["tokens_naive"] += naive
+        _STATS["tokens_packed"] += packed
+        _STATS["tokens_saved"] += naive - packed
+    return prompt_chunks, report
+
+
+def context_stats() -> Dict:
+    with _STATS_LOCK:
+        s = dict(_STATS)
+    s["saved_ratio"] = (s["tokens_saved"] / s["tokens_naive"]) if s["tokens_naive"] else 0.0
+    return s
@@ -1,9 +1,25 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text
+from functools import partial
+from pathlib import Path
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import QueuePool
 from src.config import settings
 
 _ENGINE = None
 
+# Serving-path reads: read-only URI, pooled connections (each used by one thread
+# at a time), no transactions.
+_READ_ENGINE = None
+_READ_ENGINE_LOCK = threading.Lock()
+
+# Dedicated threads for SQLite reads on the async request path, so hydration
+# never competes with (or waits behind) the request threadpool.
+_READ_EXECUTOR = None
+_READ_EXECUTOR_LOCK = threading.Lock()
+
 
 def get_engine():
     global _ENGINE
@@ -19,14 +35,136 @@ def get_conn():
         yield conn
 
 
-def init_schema():
+def _read_uri() -> str:
+    # immutable=1 also skips file locking and change detection; only safe when
+    # nothing writes the DB while serving (true on Cloud Run, see deploy.sh).
+    uri = f"file:{Path(settings.sqlite_path).resolve().as_posix()}?mode=ro"
+    if settings.sqlite_immutable:
+        uri += "&immutable=1"
+    return f"sqlite:///{uri}&uri=true"
+
+
+def get_read_engine():
+    global _READ_ENGINE
+    if _READ_ENGINE is None:
+        with _READ_ENGINE_LOCK:
+            if _READ_ENGINE is None:
+                engine = create_engine(
+                    _read_uri(),
+                    future=True,
+                    # A connection is checked out by one thread at a time and only ever
+                    # closed by the thread holding it; bursts past pool_size open overflow
+                    # connections instead of sharing or evicting ones in use.
+                    poolclass=QueuePool,
+                    pool_size=settings.sqlite_read_pool_size,
+                    max_overflow=-1,
+                    # sqlite3's per-connection statement cache: hot queries are prepared once per connection
+                    connect_args={"check_same_thread": False, "cached_statements": 256},
+                )
+
+                @event.listens_for(engine, "connect")
+                def _tune(dbapi_conn, _record):
+                    cur = dbapi_conn.cursor()
+                    cur.execute("PRAGMA query_only=ON")
+                    cur.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+                    cur.execute(f"PRAGMA cache_size=-{settings.sqlite_read_cache_kib}")
+                    cur.execute("PRAGMA temp_store=MEMORY")
+                    cur.close()
+
+                _READ_ENGINE = engine
+    return _READ_ENGINE
+
+
+@contextmanager
+def get_read_conn():
+    """
+    Read-only connection for the serving path. Unlike get_conn() this never
+    opens a write transaction; pysqlite runs plain SELECTs in autocommit.
+    """
+    with get_read_engine().connect() as conn:
+        yield conn
+
+
+def get_read_executor() -> ThreadPoolExecutor:
+    global _READ_EXECUTOR
+    if _READ_EXECUTOR is None:
+        with _READ_EXECUTOR_LOCK:
+            if _READ_EXECUTOR is None:
+                _READ_EXECUTOR = ThreadPoolExecutor(
+                    settings.sqlite_reader_threads, thread_name_prefix="sqlite-read"
+                )
+    return _READ_EXECUTOR
+
+
+async def run_read(fn, *args, **kwargs):
+    """
+    Run a blocking DB read (e.g. fetch_chunks_by_ids) on the reader pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_read_executor(), partial(fn, *args, **kwargs))
+
+
+# Secondary indexes + FTS triggers. Kept separate from the tables so bulk
+# ingestion can load first and index once at the end.
+INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);",
+    "CREATE INDEX IF NOT EXISTS idx_ann_doc_id ON annotations(doc_id);",
+    "CREATE INDEX IF NOT EXISTS idx_ann_label ON annotations(label);",
+]
+
+# BM25 lexical index over chunks.text (external content; triggers keep it in sync)
+FTS_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text,
+    content='chunks',
+    content_rowid='rowid',
+    tokenize='porter unicode61'
+);
+"""
+
+FTS_TRIGGER_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+        INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text);
+    END;
+    """,
+]
+
+DROP_FTS_TRIGGER_DDL = [
+    "DROP TRIGGER IF EXISTS chunks_fts_ai;",
+    "DROP TRIGGER IF EXISTS chunks_fts_ad;",
+    "DROP TRIGGER IF EXISTS chunks_fts_au;",
+]
+
+DROP_FOR_BULK_DDL = DROP_FTS_TRIGGER_DDL + [
+    "DROP INDEX IF EXISTS idx_chunks_doc_id;",
+    "DROP INDEX IF EXISTS idx_ann_doc_id;",
+    "DROP INDEX IF EXISTS idx_ann_label;",
+]
+
+
+def init_schema(with_indexes: bool = True):
     ddl_documents = """
     CREATE TABLE IF NOT EXISTS documents (
         doc_id TEXT PRIMARY KEY,
         title TEXT NOT NULL,
         source TEXT NOT NULL,
         raw_path TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        text_z BLOB,
+        text_codec TEXT,
+        n_chars INTEGER
     );
     """
 
@@ -38,6 +176,7 @@ def init_schema():
         start_char INTEGER NOT NULL,
         end_char INTEGER NOT NULL,
         text TEXT NOT NULL,
+        content_hash TEXT,
         FOREIGN KEY (doc_id) REFERENCES documents(doc_id)
     );
     """
@@ -48,20 +187,130 @@ def init_schema():
         doc_id TEXT NOT NULL,
         label TEXT NOT NULL,
         context TEXT,
+        context_id TEXT,
         answer_texts_json TEXT NOT NULL,
         answer_starts_json TEXT NOT NULL,
         FOREIGN KEY (doc_id) REFERENCES documents(doc_id)
     );
     """
 
-    ddl_idx_1 = "CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);"
-    ddl_idx_2 = "CREATE INDEX IF NOT EXISTS idx_ann_doc_id ON annotations(doc_id);"
-    ddl_idx_3 = "CREATE INDEX IF NOT EXISTS idx_ann_label ON annotations(label);"
+    # Each CUAD paragraph context is stored once; annotations reference it by
+    # context_id (annotations.context is only populated by older ingests).
+    ddl_contexts = """
+    CREATE TABLE IF NOT EXISTS contexts (
+        context_id TEXT PRIMARY KEY,
+        doc_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        text_z BLOB,
+        text_codec TEXT,
+        FOREIGN KEY (doc_id) REFERENCES documents(doc_id)
+    );
+    """
 
     with get_conn() as conn:
         conn.execute(text(ddl_documents))
         conn.execute(text(ddl_chunks))
         conn.execute(text(ddl_annotations))
-        conn.execute(text(ddl_idx_1))
-        conn.execute(text(ddl_idx_2))
-        conn.execute(text(ddl_idx_3))
+        conn.execute(text(ddl_contexts))
+        conn.execute(text(FTS_DDL))
+        add_missing_columns(conn, "annotations", {"context_id": "TEXT"})
+        add_missing_columns(conn, "chunks", {"content_hash": "TEXT"})
+        add_missing_columns(conn, "documents", {"text_z": "BLOB", "text_codec": "TEXT", "n_chars": "INTEGER"})
+        add_missing_columns(conn, "contexts", {"text_z": "BLOB", "text_codec": "TEXT"})
+
+    if with_indexes:
+        create_indexes()
+
+
+def add_missing_columns(conn, table: str, columns: dict) -> None:
+    """
+    Tiny forward-only migration: ALTER TABLE ... ADD COLUMN for columns an older DB lacks.
+    """
+    existing = {r[1] for r in conn.execute(text(f"PRAGMA table_info({table})")).fetchall()}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {decl}"))
+
+
+def create_indexes():
+    with get_conn() as conn:
+        for ddl in INDEX_DDL:
+            conn.execute(text(ddl))
+        # In offsets mode chunks.text is '' so the triggers would index nothing;
+        # ingest repopulates chunks_fts from the stored documents (rebuild_fts) instead.
+        trigger_ddl = DROP_FTS_TRIGGER_DDL if settings.chunk_storage == "offsets" else FTS_TRIGGER_DDL
+        for ddl in trigger_ddl:
+            conn.execute(text(ddl))
+
+
+def drop_indexes_for_bulk_load():
+    """
+    Drop secondary indexes and FTS triggers; call create_indexes() + rebuild_fts() afterwards.
+    """
+    with get_conn() as conn:
+        for ddl in DROP_FOR_BULK_DDL:
+            conn.execute(text(ddl))
+
+
+@contextmanager
+def bulk_load_connection():
+    """
+    Raw sqlite3 connection tuned for a one-shot rebuild: no journal, no fsync,
+    big page cache. Durability is irrelevant here (a crash means re-run ingest).
+    """
+    raw = get_engine().raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("PRAGMA journal_mode=OFF")
+        cur.execute("PRAGMA synchronous=OFF")
+        cur.execute(f"PRAGMA cache_size=-{settings.bulk_cache_size_kib}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+        yield raw
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        cur = raw.cursor()
+        cur.execute("PRAGMA journal_mode=DELETE")
+        cur.execute("PRAGMA synchronous=FULL")
+        cur.close()
+        raw.close()
+
+
+def rebuild_fts():
+    """
+    (Re)build chunks_fts from the chunks table, e.g. for a DB created before the FTS index existed.
+    Chunks stored as offsets only (text = '') are indexed from the decompressed document.
+    """
+    from src.documents import decompress_text
+
+    init_schema()
+    with get_conn() as conn:
+        n_offsets = conn.execute(text("SELECT COUNT(*) FROM chunks WHERE text = ''")).scalar()
+        if not n_offsets:
+            conn.execute(text("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')"))
+            return
+
+        conn.execute(text("INSERT INTO chunks_fts(chunks_fts) VALUES ('delete-all')"))
+        rows = conn.execute(
+            text("SELECT rowid, doc_id, start_char, end_char, text FROM chunks ORDER BY doc_id, chunk_index")
+        ).fetchall()
+        # Documents are read on this connection: once delete-all holds the write
+        # lock, a read through another connection (get_document_text) fails with
+        # "database is locked". Rows are ordered by doc, so one text is held at a time.
+        doc_id, body = None, ""
+        params = []
+        for r in rows:
+            chunk_text = r[4]
+            if not chunk_text:
+                if r[1] != doc_id:
+                    doc_id = r[1]
+                    blob, codec = conn.execute(
+                        text("SELECT text_z, text_codec FROM documents WHERE doc_id = :doc_id"), {"doc_id": doc_id}
+                    ).fetchone()
+                    body = decompress_text(blob, codec)
+                chunk_text = body[r[2]:r[3]]
+            params.append({"rowid": r[0], "text": chunk_text})
+        conn.execute(text("INSERT INTO chunks_fts(rowid, text) VALUES (:rowid, :text)"), params)
@@ -0,0 +1,435 @@
+"""
+Compressed SQLite artifact for cold starts.
+
+deploy.sh packs the DB into independently compressed frames plus a small JSON
+manifest and uploads both next to the plain DB object:
+
+    gs://bucket/db/contractrag.db.z              concatenated frames
+    gs://bucket/db/contractrag.db.manifest.json  codec, sizes, per-frame + whole-file sha256
+
+At startup the frames are fetched with parallel ranged reads, decompressed
+and verified in the worker threads, and written with pwrite at their raw
+offsets into a temp file. The assembled file is checked against the
+manifest's sha256 (a frame list that misses a range would leave a hole that
+no frame check sees) before it is renamed into place. A stamp file next to the
+DB records the manifest generation + sha256, so a warm container (or a second
+worker process) skips the download entirely. Without a manifest we fall back
+to the old single-stream download of the plain object.
+
+Sources are pluggable: gs://bucket/object (google-cloud-storage, which also
+honours STORAGE_EMULATOR_HOST for a local fake GCS server) or a plain
+filesystem path / file:// URI as a stand-in.
+
+    python -m src.db_artifact pack data/contractrag.db data/contractrag.db.z
+    python -m src.db_artifact fetch file:///path/to/contractrag.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from src.config import settings
+
+MANIFEST_SUFFIX = ".manifest.json"
+ARTIFACT_SUFFIX = ".z"
+STAMP_SUFFIX = ".artifact.json"
+DEFAULT_FRAME_SIZE = 8 * 1024 * 1024
+
+
+# -----------------------------
+# Codecs
+# -----------------------------
+def default_codec() -> str:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return "zlib"
+    return "zstd"
+
+
+def _compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, 6)
+    raise ValueError(f"Unknown artifact codec: {codec!r}")
+
+
+def _decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    raise ValueError(f"Unknown artifact codec: {codec!r}")
+
+
+# -----------------------------
+# Sources
+# -----------------------------
+class LocalBlobSource:
+    """
+    Filesystem stand-in for a bucket: object names are paths under `root`.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name
+
+    def exists(self, name: str) -> bool:
+        return self._path(name).is_file()
+
+    def generation(self, name: str) -> str:
+        st = self._path(name).stat()
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """
+        Bytes [start, end) of the object (end=None reads to EOF).
+        """
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start)
+
+    def download_to(self, name: str, path: Path) -> None:
+        shutil.copyfile(self._path(name), path)
+
+
+class GCSBlobSource:
+    def __init__(self, bucket: str):
+        from google.cloud import storage
+
+        self.client = storage.Client()
+        self.bucket = self.client.bucket(bucket)
+
+    def exists(self, name: str) -> bool:
+        return self.bucket.blob(name).exists()
+
+    def generation(self, name: str) -> str:
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket.name}/{name}")
+        return str(blob.generation)
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        # GCS ranges are inclusive; checksums can't be validated on partial reads
+        # (frames carry their own sha256).
+        blob = self.bucket.blob(name)
+        if start == 0 and end is None:
+            return blob.download_as_bytes()
+        return blob.download_as_bytes(start=start, end=None if end is None else end - 1, checksum=None)
+
+    def download_to(self, name: str, path: Path) -> None:
+        # Streamed to disk; the whole DB never sits in memory.
+        self.bucket.blob(name).download_to_filename(str(path))
+
+
+def parse_gs_uri(gs_uri: str) -> Tuple[str, str]:
+    """
+    Parse gs://bucket/path/to/object into (bucket, object).
+    """
+    u = urlparse(gs_uri)
+    if u.scheme != "gs":
+        raise ValueError(f"Expected gs://... URI, got: {gs_uri}")
+    bucket = u.netloc
+    obj = u.path.lstrip("/")
+    if not bucket or not obj:
+        raise ValueError(f"Invalid gs uri: {gs_uri}")
+    return bucket, obj
+
+
+def source_from_uri(uri: str):
+    """
+    gs://bucket/obj -> (GCSBlobSource, obj); file:///dir/obj or /dir/obj -> (LocalBlobSource, obj).
+    """
+    if uri.startswith("gs://"):
+        bucket, obj = parse_gs_uri(uri)
+        return GCSBlobSource(bucket), obj
+    path = Path(urlparse(uri).path if uri.startswith("file://") else uri)
+    return LocalBlobSource(str(path.parent)), path.name
+
+
+def configured_source():
+    """
+    DB_ARTIFACT_URI, else GCS_DB_BUCKET + GCS_DB_OBJECT (deploy.sh), else CONTRACTIQ_DB_GCS_URI.
+    Returns (source, object_name) or (None, None) for local dev.
+    """
+    if settings.db_artifact_uri:
+        return source_from_uri(settings.db_artifact_uri)
+
+    bucket = os.getenv("GCS_DB_BUCKET")
+    obj = os.getenv("GCS_DB_OBJECT")
+    gs_uri = os.getenv("CONTRACTIQ_DB_GCS_URI")
+    if (not bucket or not obj) and gs_uri:
+        bucket, obj = parse_gs_uri(gs_uri)
+    if not bucket or not obj:
+        return None, None
+    return GCSBlobSource(bucket), obj
+
+
+# -----------------------------
+# Pack (deploy time)
+# -----------------------------
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def pack(db_path: str, artifact_path: str, *, codec: Optional[str] = None, frame_size: int = DEFAULT_FRAME_SIZE) -> Dict:
+    """
+    Write <artifact_path> (frames) and <db name>.manifest.json next to it.
+    Frames compress in parallel; order in the file is preserved.
+    """
+    codec = codec or default_codec()
+    src = Path(db_path)
+    out = Path(artifact_path)
+    n_bytes = src.stat().st_size
+    ranges = [(off, min(frame_size, n_bytes - off)) for off in range(0, n_bytes, frame_size)]
+
+    def work(r):
+        off, length = r
+        with open(src, "rb") as f:
+            f.seek(off)
+            raw = f.read(length)
+        return _compress(raw, codec), hashlib.sha256(raw).hexdigest()
+
+    frames = []
+    comp_off = 0
+    with open(out, "wb") as f, ThreadPoolExecutor(os.cpu_count() or 1) as ex:
+        for (raw_off, raw_len), (blob, digest) in zip(ranges, ex.map(work, ranges)):
+            f.write(blob)
+            frames.append([comp_off, len(blob), raw_off, raw_len, digest])
+            comp_off += len(blob)
+
+    manifest = {
+        "version": 1,
+        "artifact": out.name,
+        "codec": codec,
+        "frame_size": frame_size,
+        "n_bytes": n_bytes,
+        "compressed_bytes": comp_off,
+        "sha256": _file_sha256(src),
+        "frames": frames,
+    }
+    manifest_path = out.with_name(src.name + MANIFEST_SUFFIX)
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    return {"artifact": str(out), "manifest": str(manifest_path), **{k: manifest[k] for k in ("codec", "n_bytes", "compressed_bytes")}}
+
+
+# -----------------------------
+# Fetch (startup)
+# -----------------------------
+def _stamp_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + STAMP_SUFFIX)
+
+
+def _read_stamp(dest: Path) -> Dict:
+    try:
+        return json.loads(_stamp_path(dest).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(dest: Path, **fields) -> None:
+    _stamp_path(dest).write_text(json.dumps(fields), encoding="utf-8")
+
+
+def published_identity(dest: str) -> Optional[str]:
+    """
+    Identity of the published DB that `dest` was fetched from (manifest
+    sha256, else the object generation), stable across re-downloads. None
+    when there's no stamp or it doesn't describe the file on disk (e.g. the
+    DB was re-ingested locally after the fetch).
+    """
+    dest_p = Path(dest)
+    stamp = _read_stamp(dest_p)
+    try:
+        size = dest_p.stat().st_size
+    except OSError:
+        return None
+    if not stamp or stamp.get("n_bytes") != size:
+        return None
+    if stamp.get("sha256"):
+        return f"sha256:{stamp['sha256']}"
+    if stamp.get("generation"):
+        return f"generation:{stamp['generation']}"
+    return None
+
+
+def _fetch_frames(source, manifest: Dict, artifact_name: str, tmp: Path, workers: int) -> None:
+    codec = manifest["codec"]
+    fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, manifest["n_bytes"])
+
+        def work(frame):
+            comp_off, comp_len, raw_off, raw_len, digest = frame
+            raw = _decompress(source.read(artifact_name, comp_off, comp_off + comp_len), codec)
+            if len(raw) != raw_len or hashlib.sha256(raw).hexdigest() != digest:
+                raise RuntimeError(f"DB artifact frame at offset {raw_off} failed verification")
+            os.pwrite(fd, raw, raw_off)
+            return raw_len
+
+        with ThreadPoolExecutor(max(1, workers), thread_name_prefix="db-fetch") as ex:
+            for _ in ex.map(work, manifest["frames"]):
+                pass
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fetch_db(source, obj: str, dest: str, *, workers: Optional[int] = None) -> Dict:
+    """
+    Make `dest` an up-to-date copy of the DB published as `obj`.
+    Returns {"mode": "skipped"|"artifact"|"plain", "bytes": ..., "seconds": ...}.
+    """
+    t0 = time.perf_counter()
+    dest_p = Path(dest)
+    dest_p.parent.mkdir(parents=True, exist_ok=True)
+    stamp = _read_stamp(dest_p)
+    have = dest_p.stat().st_size if dest_p.exists() else 0
+    tmp = dest_p.with_name(f"{dest_p.name}.part{os.getpid()}")
+
+    manifest_name = obj + MANIFEST_SUFFIX
+    if source.exists(manifest_name):
+        generation = source.generation(manifest_name)
+        if have and stamp.get("generation") == generation and stamp.get("n_bytes") == have:
+            return {"mode": "skipped", "bytes": have, "seconds": time.perf_counter() - t0}
+
+        manifest = json.loads(source.read(manifest_name))
+        if have == manifest["n_bytes"] and stamp.get("sha256") == manifest["sha256"]:
+            # Re-uploaded but identical content: just refresh the stamp.
+            _write_stamp(dest_p, generation=generation, sha256=manifest["sha256"], n_bytes=have)
+            return {"mode": "skipped", "bytes": have, "seconds": time.perf_counter() - t0}
+
+        artifact_name = str(Path(obj).with_name(manifest["artifact"]))
+        try:
+            _fetch_frames(source, manifest, artifact_name, tmp, workers or settings.db_download_workers)
+            if _file_sha256(tmp) != manifest["sha256"]:
+                raise RuntimeError(f"Assembled DB from {artifact_name} does not match the manifest sha256")
+            os.replace(tmp, dest_p)
+        finally:
+            tmp.unlink(missing_ok=True)
+        _write_stamp(dest_p, generation=generation, sha256=manifest["sha256"], n_bytes=manifest["n_bytes"])
+        return {
+            "mode": "artifact",
+            "bytes": manifest["n_bytes"],
+            "compressed_bytes": manifest["compressed_bytes"],
+            "seconds": time.perf_counter() - t0,
+        }
+
+    # Legacy: plain DB object, single stream.
+    generation = source.generation(obj)
+    if have and stamp.get("generation") == generation and stamp.get("n_bytes") == have:
+        return {"mode": "skipped", "bytes": have, "seconds": time.perf_counter() - t0}
+    try:
+        source.download_to(obj, tmp)
+        n_bytes = tmp.stat().st_size
+        if n_bytes == 0:
+            raise RuntimeError("SQLite DB download failed or produced an empty file.")
+        os.replace(tmp, dest_p)
+    finally:
+        tmp.unlink(missing_ok=True)
+    _write_stamp(dest_p, generation=generation, sha256=None, n_bytes=n_bytes)
+    return {"mode": "plain", "bytes": n_bytes, "seconds": time.perf_counter() - t0}
+
+
+# -----------------------------
+# Readiness
+# -----------------------------
+class DBReadiness:
+    """
+    Startup state of the SQLite DB, so the server can accept connections (and
+    answer /healthz) while the download runs in the background.
+    """
+
+    def __init__(self):
+        self.state = "pending"  # pending -> downloading -> ready | failed
+        self.error: Optional[str] = None
+        self.detail: Dict = {}
+        self._event = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._event.wait(timeout)
+        return self.ready
+
+    def run(self, fn) -> None:
+        self.state = "downloading"
+        try:
+            self.detail = fn() or {}
+            self.state = "ready"
+        except Exception as e:
+            self.state = "failed"
+            self.error = repr(e)
+        finally:
+            self._event.set()
+
+    def as_dict(self) -> Dict:
+        return {"ready": self.ready, "state": self.state, "error": self.error, **self.detail}
+
+
+DB_READINESS = DBReadiness()
+
+
+def ensure_sqlite_db() -> Dict:
+    """
+    Cloud Run: fetch the configured DB into settings.sqlite_path.
+    Local dev (nothing configured): no-op, the local settings.sqlite_path is used.
+    """
+    source, obj = configured_source()
+    if source is None:
+        return {"mode": "local"}
+    result = fetch_db(source, obj, settings.sqlite_path)
+    print(f"SQLite DB {result['mode']}: {result['bytes']} bytes in {result['seconds']:.2f}s")
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pack or fetch the compressed SQLite DB artifact.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="compress a DB into <artifact> + <db>.manifest.json")
+    p.add_argument("db_path")
+    p.add_argument("artifact_path", nargs="?", help="default: <db_path>.z")
+    p.add_argument("--codec", choices=["zstd", "zlib"], default=None)
+    p.add_argument("--frame-mib", type=int, default=DEFAULT_FRAME_SIZE // (1024 * 1024))
+    f = sub.add_parser("fetch", help="download a published DB (gs://... or a local path)")
+    f.add_argument("uri")
+    f.add_argument("--dest", default=None, help="default: settings.sqlite_path")
+    args = ap.parse_args()
+
+    if args.cmd == "pack":
+        result = pack(
+            args.db_path,
+            args.artifact_path or args.db_path + ARTIFACT_SUFFIX,
+            codec=args.codec,
+            frame_size=args.frame_mib * 1024 * 1024,
+        )
+        print(f"✅ Packed: {result}")
+    else:
+        source, obj = source_from_uri(args.uri)
+        result = fetch_db(source, obj, args.dest or settings.sqlite_path)
+        print(f"✅ Fetched: {result}")
+
+
+if __name__ == "__main__":
+    main()
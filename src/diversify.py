@@ -0,0 +1,136 @@
+"""
+Post-retrieval diversification and neighbour expansion.
+
+Character chunks overlap, so a vector query often spends several top-k slots
+on neighbours of the same clause. Two optional stages, configurable per
+request (retrieval_options):
+
+- MMR: over-fetch settings.mmr_fetch_factor x k candidates with their stored
+  vectors (include_values; no extra embedding calls) and pick k by Maximal
+  Marginal Relevance: lambda * relevance - (1 - lambda) * max cosine to the
+  chunks already picked. Relevance is the retriever's score, min-max scaled
+  over the candidates, so it works for dense and RRF-fused scores alike.
+- Neighbour window: add each winner's +/-n chunks (by chunk_index) in one
+  batched SQLite query, so the prompt gets the whole clause even when it
+  straddles a chunk boundary. The context builder then merges them into
+  contiguous spans.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import settings
+from src.documents import fetch_chunk_ranges
+
+
+def retrieval_options(
+    *, mmr: Optional[bool] = None, mmr_lambda: Optional[float] = None, neighbors: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Per-request overrides on top of the settings defaults.
+    """
+    lam = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+    n = settings.neighbor_window if neighbors is None else neighbors
+    return {
+        "mmr": settings.mmr if mmr is None else bool(mmr),
+        "mmr_lambda": round(min(max(float(lam), 0.0), 1.0), 3),
+        "neighbors": min(max(int(n), 0), settings.neighbor_window_max),
+    }
+
+
+def fetch_k(k: int, options: Dict[str, Any]) -> int:
+    return k * settings.mmr_fetch_factor if options["mmr"] else k
+
+
+def _get(m, key: str):
+    return m.get(key) if isinstance(m, dict) else getattr(m, key, None)
+
+
+def _as_dict(m) -> Dict[str, Any]:
+    # Pinecone returns ScoredVector objects; downstream code only needs these fields.
+    d = dict(m) if isinstance(m, dict) else {"id": _get(m, "id"), "score": _get(m, "score"), "metadata": _get(m, "metadata")}
+    d.pop("values", None)
+    d["metadata"] = dict(d.get("metadata") or {})
+    return d
+
+
+def mmr_select(matches: List[Any], *, k: int, lambda_: float) -> Tuple[List[Dict], Dict[str, Any]]:
+    """
+    Greedy MMR over `matches` (best first, each with "values" where the
+    backend returned them). Candidates without a vector (e.g. BM25-only hits)
+    get no redundancy penalty.
+    """
+    n = len(matches)
+    if n <= 1:
+        return [_as_dict(m) for m in matches], {"candidates": n, "kept": n, "reordered": 0}
+
+    scores = np.array([float(_get(m, "score") or 0.0) for m in matches], dtype=np.float32)
+    span = float(scores.max() - scores.min())
+    rel = (scores - scores.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+
+    vals = [_get(m, "values") for m in matches]
+    dim = next((len(v) for v in vals if v is not None and len(v)), 0)
+    vecs = np.zeros((n, dim), dtype=np.float32)
+    for i, v in enumerate(vals):
+        if v is not None and len(v) == dim:
+            vecs[i] = v
+    vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+    sim = vecs @ vecs.T
+
+    picked: List[int] = []
+    max_sim = np.zeros(n, dtype=np.float32)
+    remaining = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        mmr = lambda_ * rel - (1.0 - lambda_) * max_sim
+        mmr[~remaining] = -np.inf
+        i = int(np.argmax(mmr))
+        picked.append(i)
+        remaining[i] = False
+        max_sim = np.maximum(max_sim, sim[i])
+
+    out = []
+    for i in picked:
+        d = _as_dict(matches[i])
+        d["mmr_rank"] = len(out)
+        out.append(d)
+    reordered = sum(1 for pos, i in enumerate(picked) if pos != i)
+    return out, {"candidates": n, "kept": len(out), "reordered": reordered}
+
+
+def expand_neighbors(matches: List[Any], chunks: List[Dict], *, window: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Winners plus their +/-window neighbours, hydrated in one query. Neighbours
+    inherit the winner's score and rerank_score (so context packing ranks them
+    with it) and are
+    marked with metadata["neighbor_of"]. Chunks come back grouped by doc in
+    chunk_index order; matches keep the winners first.
+    """
+    if window <= 0 or not chunks:
+        return [_as_dict(m) for m in matches], chunks
+
+    ranges = [(c["doc_id"], c["chunk_index"] - window, c["chunk_index"] + window) for c in chunks]
+    expanded = fetch_chunk_ranges(ranges)
+
+    winner_ids = {c["chunk_id"] for c in chunks}
+    by_pos = {(c["doc_id"], c["chunk_index"]): c["chunk_id"] for c in chunks}
+    score_by_id = {_get(m, "id"): _get(m, "score") for m in matches}
+    rerank_by_id = {_get(m, "id"): _get(m, "rerank_score") for m in matches}
+
+    out_matches = [_as_dict(m) for m in matches]
+    for c in expanded:
+        if c["chunk_id"] in winner_ids:
+            continue
+        owner = None
+        for d in range(1, window + 1):
+            owner = by_pos.get((c["doc_id"], c["chunk_index"] - d)) or by_pos.get((c["doc_id"], c["chunk_index"] + d))
+            if owner:
+                break
+        m = {
+            "id": c["chunk_id"],
+            "score": score_by_id.get(owner),
+            "metadata": {"doc_id": c["doc_id"], "chunk_index": c["chunk_index"], "neighbor_of": owner},
+        }
+        if rerank_by_id.get(owner) is not None:
+            m["rerank_score"] = rerank_by_id[owner]
+        out_matches.append(m)
+    return out_matches, expanded
@@ -0,0 +1,202 @@
+"""
+Doc-scoped in-process vector search.
+
+A question with a doc_id only ever scores one contract (tens to a few hundred
+chunks), yet with VECTOR_BACKEND=pinecone it was a filtered ANN query over
+the whole namespace. With settings.doc_fast_path on, the first question about
+a contract loads that contract's chunk vectors into a small NumPy matrix:
+- from the local memory-mapped index (a contiguous slice) when one exists;
+- otherwise with a Pinecone fetch by the doc's chunk ids (from SQLite).
+
+The matrix is kept in a per-doc LRU, so follow-up questions on the same
+contract are an exact dot product in-process with no remote call. Results have
+the same shape as Pinecone's query response.
+"""
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from src.cache import LRUTTLCache
+from src.config import settings
+from src.db import get_read_conn
+
+_DOC_CACHE = LRUTTLCache(settings.doc_vector_cache_size)
+# Docs with nothing to load (unknown doc_id, no vectors upserted) are remembered
+# briefly so each request doesn't repeat the SQLite + Pinecone round trips.
+_MISSING = LRUTTLCache(settings.doc_vector_cache_size, ttl_s=settings.doc_vector_negative_ttl_s)
+
+# Striped load locks: concurrent first questions about one contract load it
+# once. A fixed set, never removed, so a waiter can't lose its lock to a newer
+# one and arbitrary doc_ids can't grow it.
+_LOAD_LOCKS = [threading.Lock() for _ in range(64)]
+
+_STATS_LOCK = threading.Lock()
+_STATS = {"loads": 0, "load_ms": 0.0, "queries": 0, "fallbacks": 0}
+
+
+class DocVectors:
+    """
+    One contract's chunk vectors (rows L2-normalised) plus the metadata the
+    matches carry.
+    """
+
+    def __init__(self, doc_id: str, ids: List[str], vectors: np.ndarray, meta: List[Dict[str, Any]], *, source: str):
+        self.doc_id = doc_id
+        self.ids = ids
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True) if len(vectors) else 1.0
+        self.vectors = np.ascontiguousarray(vectors / np.clip(norms, 1e-12, None), dtype=np.float32)
+        self.meta = meta
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def query(self, vector, *, top_k: int = 8, include_values: bool = False) -> Dict:
+        q = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ q
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return {"matches": [], "namespace": settings.pinecone_namespace}
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for i in top:
+            m = {"id": self.ids[i], "score": float(scores[i]), "metadata": dict(self.meta[i])}
+            if include_values:
+                m["values"] = self.vectors[i].tolist()
+            matches.append(m)
+        return {"matches": matches, "namespace": settings.pinecone_namespace}
+
+
+def _doc_chunk_rows(doc_id: str) -> List[tuple]:
+    with get_read_conn() as conn:
+        return conn.execute(
+            text("""
+            SELECT c.chunk_id, c.chunk_index, c.start_char, c.end_char, d.title
+            FROM chunks c
+            JOIN documents d ON d.doc_id = c.doc_id
+            WHERE c.doc_id = :doc_id
+            ORDER BY c.chunk_index
+            """),
+            {"doc_id": doc_id},
+        ).fetchall()
+
+
+def _meta(doc_id: str, row) -> Dict[str, Any]:
+    return {
+        "title": row[4],
+        "doc_id": doc_id,
+        "chunk_index": int(row[1]),
+        "start_char": int(row[2]),
+        "end_char": int(row[3]),
+        "source": "cuad-v1",
+    }
+
+
+def load_from_local_index(doc_id: str) -> Optional[DocVectors]:
+    from src.local_index import MANIFEST_FILE, get_local_index
+
+    if not (Path(settings.local_index_dir) / MANIFEST_FILE).exists():
+        return None
+    index = get_local_index()
+    rng = index.doc_ranges.get(doc_id)
+    if rng is None:
+        return None
+    lo, hi = rng
+    ids = [str(x) for x in index.ids[lo:hi]]
+    meta = [
+        {
+            "title": index.titles.get(doc_id, ""),
+            "doc_id": doc_id,
+            "chunk_index": int(index.chunk_index[r]),
+            "start_char": int(index.start_char[r]),
+            "end_char": int(index.end_char[r]),
+            "source": "cuad-v1",
+        }
+        for r in range(lo, hi)
+    ]
+    return DocVectors(doc_id, ids, np.array(index.vectors[lo:hi], dtype=np.float32), meta, source="local")
+
+
+def load_from_pinecone(doc_id: str) -> Optional[DocVectors]:
+    from src.retrieval import get_pinecone_index
+
+    rows = _doc_chunk_rows(doc_id)
+    if not rows:
+        return None
+    index = get_pinecone_index()
+    fetched: Dict[str, List[float]] = {}
+    ids = [r[0] for r in rows]
+    step = settings.pinecone_fetch_batch
+    for i in range(0, len(ids), step):
+        res = index.fetch(ids=ids[i:i + step], namespace=settings.pinecone_namespace)
+        for vid, v in (res.vectors or {}).items():
+            fetched[vid] = v.values
+    # Chunks that were never upserted simply aren't searchable, as with a remote query.
+    rows = [r for r in rows if r[0] in fetched]
+    if not rows:
+        return None
+    vectors = np.array([fetched[r[0]] for r in rows], dtype=np.float32)
+    return DocVectors(doc_id, [r[0] for r in rows], vectors, [_meta(doc_id, r) for r in rows], source="pinecone")
+
+
+def load_doc_vectors(doc_id: str) -> Optional[DocVectors]:
+    source = settings.doc_vector_source
+    if source in ("auto", "local"):
+        dv = load_from_local_index(doc_id)
+        if dv is not None or source == "local":
+            return dv
+    if source in ("auto", "pinecone"):
+        return load_from_pinecone(doc_id)
+    raise ValueError(f"Unknown doc_vector_source: {source!r} (expected 'auto', 'local' or 'pinecone')")
+
+
+def get_doc_vectors(doc_id: str) -> Optional[DocVectors]:
+    dv = _DOC_CACHE.get(doc_id)
+    if dv is not None or _MISSING.get(doc_id):
+        return dv
+    with _LOAD_LOCKS[hash(doc_id) % len(_LOAD_LOCKS)]:
+        dv = _DOC_CACHE.get(doc_id)
+        if dv is not None or _MISSING.get(doc_id):
+            return dv
+        t0 = time.perf_counter()
+        dv = load_doc_vectors(doc_id)
+        if dv is None:
+            _MISSING.put(doc_id, True)
+            return None
+        _DOC_CACHE.put(doc_id, dv)
+        with _STATS_LOCK:
+            _STATS["loads"] += 1
+            _STATS["load_ms"] += (time.perf_counter() - t0) * 1000
+    return dv
+
+
+def doc_query(vector, *, doc_id: str, top_k: int = 8, include_values: bool = False) -> Optional[Dict]:
+    """
+    In-process search of one contract, or None when its vectors can't be
+    loaded (the caller then runs the normal filtered query).
+    """
+    try:
+        dv = get_doc_vectors(doc_id)
+    except Exception as e:
+        print(f"doc fast path unavailable for {doc_id}:", repr(e))
+        dv = None
+    with _STATS_LOCK:
+        _STATS["queries" if dv is not None else "fallbacks"] += 1
+    if dv is None:
+        return None
+    return dv.query(vector, top_k=top_k, include_values=include_values)
+
+
+def doc_index_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        s = dict(_STATS)
+    s["enabled"] = settings.doc_fast_path
+    s["avg_load_ms"] = s["load_ms"] / s["loads"] if s["loads"] else 0.0
+    s["cache"] = _DOC_CACHE.stats()
+    s["missing"] = _MISSING.stats()
+    return s
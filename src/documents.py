@@ -1,17 +1,70 @@
 import hashlib
 import json
+import zlib
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List, Dict
 from sqlalchemy import text
 
 from src.config import settings
-from src.db import get_conn
+from src.db import get_read_conn
 
 
 def make_doc_id(title: str) -> str:
     return hashlib.sha256(title.encode("utf-8")).hexdigest()[:16]
 
 
+# -----------------------------
+# Compressed full-text storage (chunk_storage="offsets")
+# -----------------------------
+def compress_text(s: str, codec: Optional[str] = None) -> bytes:
+    codec = codec or settings.doc_text_codec
+    raw = s.encode("utf-8")
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, 9)
+    raise ValueError(f"Unknown doc_text_codec: {codec!r} (expected 'zlib' or 'zstd')")
+
+
+def decompress_text(blob: bytes, codec: str) -> str:
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    raise ValueError(f"Unknown text codec: {codec!r}")
+
+
+@lru_cache(maxsize=settings.doc_text_cache_size)
+def get_document_text(doc_id: str) -> str:
+    """
+    Full contract text, decompressed once per process and kept in an LRU.
+    """
+    with get_read_conn() as conn:
+        row = conn.execute(
+            text("SELECT text_z, text_codec FROM documents WHERE doc_id = :doc_id"), {"doc_id": doc_id}
+        ).fetchone()
+    if row is None or row[0] is None:
+        raise KeyError(f"No stored text for doc_id={doc_id}")
+    return decompress_text(row[0], row[1])
+
+
+def resolve_chunk_texts(rows: List[Dict]) -> List[Dict]:
+    """
+    In offsets mode chunks.text is '' and the text is sliced from the stored
+    document. Rows that already carry text are left alone, so this is safe on
+    DBs built in either mode.
+    """
+    for r in rows:
+        if not r.get("text"):
+            r["text"] = get_document_text(r["doc_id"])[r["start_char"]:r["end_char"]]
+    return rows
+
+
 def list_documents(limit: int = 10, offset: int = 0, q: Optional[str] = None) -> List[Dict]:
     sql = """
     SELECT doc_id, title, source, raw_path
@@ -26,7 +79,7 @@ def list_documents(limit: int = 10, offset: int = 0, q: Optional[str] = None) ->
         where = "WHERE title LIKE :q"
         params["q"] = f"%{q}%"
 
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         rows = conn.execute(text(sql.format(where=where)), params).fetchall()
 
     return [dict(r._mapping) for r in rows]
@@ -40,72 +93,106 @@ def fetch_chunks_for_doc(doc_id: str, limit: int = 20) -> List[Dict]:
     ORDER BY chunk_index
     LIMIT :limit
     """
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         rows = conn.execute(text(sql), {"doc_id": doc_id, "limit": limit}).fetchall()
-    return [dict(r._mapping) for r in rows]
+    return resolve_chunk_texts([dict(r._mapping) for r in rows])
+
+
+# One statement text for any number of ids (the list is bound as a single JSON
+# parameter), so the prepared statement is reused across calls. Rows come back
+# in request order.
+_FETCH_CHUNKS_BY_IDS_SQL = text("""
+SELECT c.chunk_id, c.doc_id, c.chunk_index, c.start_char, c.end_char, c.text
+FROM json_each(:ids) AS j
+JOIN chunks c ON c.chunk_id = j.value
+ORDER BY j.key
+""")
 
 
 def fetch_chunks_by_ids(chunk_ids: List[str]) -> List[Dict]:
-    """
-    Safe IN-clause with named parameters.
-    """
     if not chunk_ids:
         return []
 
-    params = {}
-    placeholders = []
-    for i, cid in enumerate(chunk_ids):
-        key = f"id{i}"
-        params[key] = cid
-        placeholders.append(f":{key}")
-
-    sql = f"""
-    SELECT chunk_id, doc_id, chunk_index, start_char, end_char, text
-    FROM chunks
-    WHERE chunk_id IN ({", ".join(placeholders)})
+    with get_read_conn() as conn:
+        rows = conn.execute(_FETCH_CHUNKS_BY_IDS_SQL, {"ids": json.dumps(list(chunk_ids))}).fetchall()
+    return resolve_chunk_texts([
+        {
+            "chunk_id": r[0],
+            "doc_id": r[1],
+            "chunk_index": int(r[2]),
+            "start_char": int(r[3]),
+            "end_char": int(r[4]),
+            "text": r[5],
+        }
+        for r in rows
+    ])
+
+
+# Neighbour windows: every (doc_id, chunk_index) wanted, bound as one JSON array
+# of [doc_id, lo, hi] ranges; one statement regardless of how many winners.
+_FETCH_CHUNK_RANGES_SQL = text("""
+SELECT c.chunk_id, c.doc_id, c.chunk_index, c.start_char, c.end_char, c.text
+FROM json_each(:ranges) AS j
+JOIN chunks c
+  ON c.doc_id = json_extract(j.value, '$[0]')
+ AND c.chunk_index BETWEEN json_extract(j.value, '$[1]') AND json_extract(j.value, '$[2]')
+ORDER BY c.doc_id, c.chunk_index
+""")
+
+
+def fetch_chunk_ranges(ranges: List[tuple]) -> List[Dict]:
     """
+    Chunks with chunk_index in [lo, hi] for each (doc_id, lo, hi), ordered by
+    (doc_id, chunk_index); overlapping ranges return a chunk once.
+    """
+    if not ranges:
+        return []
 
-    with get_conn() as conn:
-        rows = conn.execute(text(sql), params).fetchall()
-    # return [dict(r._mapping) for r in rows]
-        by_id = {r[0]: r for r in rows}
-    ordered = []
-    for cid in chunk_ids:
-        if cid in by_id:
-            r = by_id[cid]
-            ordered.append({
-                "chunk_id": r[0],
-                "doc_id": r[1],
-                "chunk_index": int(r[2]),
-                "start_char": int(r[3]),
-                "end_char": int(r[4]),
-                "text": r[5],
-            })
-    return ordered
-
+    with get_read_conn() as conn:
+        rows = conn.execute(_FETCH_CHUNK_RANGES_SQL, {"ranges": json.dumps([list(r) for r in ranges])}).fetchall()
+    seen = set()
+    out = []
+    for r in rows:
+        if r[0] in seen:
+            continue
+        seen.add(r[0])
+        out.append({
+            "chunk_id": r[0],
+            "doc_id": r[1],
+            "chunk_index": int(r[2]),
+            "start_char": int(r[3]),
+            "end_char": int(r[4]),
+            "text": r[5],
+        })
+    return resolve_chunk_texts(out)
 
 
 def fetch_annotations_for_doc(doc_id: str, label_contains: Optional[str] = None, limit: int = 20) -> List[Dict]:
     sql = """
-    SELECT annotation_id, doc_id, label, context, answer_texts_json, answer_starts_json
-    FROM annotations
-    WHERE doc_id = :doc_id
+    SELECT a.annotation_id, a.doc_id, a.label, COALESCE(a.context, ctx.text) AS context,
+           a.answer_texts_json, a.answer_starts_json, ctx.text_z, ctx.text_codec
+    FROM annotations a
+    LEFT JOIN contexts ctx ON ctx.context_id = a.context_id
+    WHERE a.doc_id = :doc_id
     {label_filter}
-    ORDER BY label
+    ORDER BY a.label
     LIMIT :limit
     """
     label_filter = ""
     params = {"doc_id": doc_id, "limit": limit}
     if label_contains:
-        label_filter = "AND label LIKE :label"
+        label_filter = "AND a.label LIKE :label"
         params["label"] = f"%{label_contains}%"
 
-    with get_conn() as conn:
+    with get_read_conn() as conn:
         rows = conn.execute(text(sql.format(label_filter=label_filter)), params).fetchall()
 
     out = []
     for r in rows:
         d = dict(r._mapping)
+        blob, codec = d.pop("text_z"), d.pop("text_codec")
+        if not d["context"] and blob is not None:
+            d["context"] = decompress_text(blob, codec)
         d["answer_texts"] = json.loads(d["answer_texts_json"])
         d["answer_starts"] = json.loads(d["answer_starts_json"])
         out.append(d)
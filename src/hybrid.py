@@ -0,0 +1,216 @@
+import asyncio
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.db import get_read_conn, rebuild_fts, run_read
+from src.retrieval import vector_query, vector_query_async
+
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['-][A-Za-z0-9]+)*")
+
+# Question words carry no lexical signal ("what is the ...") and only slow BM25 down.
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be by can could did do does for from has have how i if in is it its
+    me my of on or shall should so that the their there these this to under was what when
+    where which who whom why will with would you your contract agreement party parties
+    """.split()
+)
+
+_FTS_AVAILABLE = None
+_FTS_LOCK = threading.Lock()
+
+
+def fts_available() -> bool:
+    """
+    Older DBs (built before chunks_fts existed) and DBs whose FTS index was never
+    populated (bulk load without rebuild_fts) fall back to dense-only retrieval.
+    Only a populated index is remembered, so one filled in later is picked up.
+    """
+    global _FTS_AVAILABLE
+    if not _FTS_AVAILABLE:
+        with _FTS_LOCK:
+            if not _FTS_AVAILABLE:
+                _FTS_AVAILABLE = _fts_populated()
+    return _FTS_AVAILABLE
+
+
+def _fts_populated() -> bool:
+    with get_read_conn() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'")
+        ).fetchone()
+        if exists is None:
+            return False
+        # chunks_fts is external-content, so selecting from it reads the chunks
+        # table even when nothing is indexed; the docsize shadow table has one
+        # row per indexed chunk.
+        return conn.execute(text("SELECT 1 FROM chunks_fts_docsize LIMIT 1")).fetchone() is not None
+
+
+def build_fts_query(question: str) -> str:
+    """
+    Turn free text into an FTS5 MATCH expression: quoted terms OR-ed together
+    (quoting keeps hyphens and FTS operators in user text from being parsed).
+    """
+    terms = []
+    for w in _WORD_RE.findall(question):
+        lw = w.lower()
+        if lw in _STOPWORDS or len(lw) < 2:
+            continue
+        terms.append('"' + w.replace('"', "") + '"')
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def lexical_search(question: str, *, top_k: int = 8, doc_id: Optional[str] = None) -> Dict:
+    """
+    BM25 over chunks_fts. Returns Pinecone-shaped matches; score is -bm25 (higher is better).
+    """
+    q = build_fts_query(question)
+    if not q:
+        return {"matches": []}
+
+    doc_filter = "AND c.doc_id = :doc_id" if doc_id is not None else ""
+    sql = f"""
+    SELECT c.chunk_id, c.doc_id, c.chunk_index, c.start_char, c.end_char, bm25(chunks_fts) AS rank
+    FROM chunks_fts
+    JOIN chunks c ON c.rowid = chunks_fts.rowid
+    WHERE chunks_fts MATCH :q
+    {doc_filter}
+    ORDER BY rank
+    LIMIT :limit
+    """
+    params = {"q": q, "limit": top_k}
+    if doc_id is not None:
+        params["doc_id"] = doc_id
+
+    with get_read_conn() as conn:
+        rows = conn.execute(text(sql), params).fetchall()
+
+    return {
+        "matches": [
+            {
+                "id": r[0],
+                "score": -float(r[5]),
+                "metadata": {"doc_id": r[1], "chunk_index": r[2], "start_char": r[3], "end_char": r[4]},
+            }
+            for r in rows
+        ]
+    }
+
+
+def _match_id(m):
+    return m["id"] if isinstance(m, dict) else getattr(m, "id", None)
+
+
+def _match_values(m):
+    return m.get("values") if isinstance(m, dict) else getattr(m, "values", None)
+
+
+def _match_metadata(m) -> Dict:
+    md = m.get("metadata") if isinstance(m, dict) else getattr(m, "metadata", None)
+    return dict(md or {})
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[Sequence[str]], *, weights: Optional[Sequence[float]] = None, k: int = 60
+) -> List[tuple]:
+    """
+    score(id) = sum_i weight_i / (k + rank_i(id)), rank starting at 1.
+    Returns [(id, score), ...] best first.
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    scores: Dict[str, float] = {}
+    for ids, w in zip(ranked_lists, weights):
+        for rank, cid in enumerate(ids, start=1):
+            scores[cid] = scores.get(cid, 0.0) + w / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def fuse_matches(dense: Dict, lexical: Dict, *, top_k: int) -> Dict:
+    dense_m = dense.get("matches", []) or []
+    lex_m = lexical.get("matches", []) or []
+
+    fused = reciprocal_rank_fusion(
+        [[_match_id(m) for m in dense_m], [_match_id(m) for m in lex_m]],
+        weights=[settings.hybrid_dense_weight, settings.hybrid_lexical_weight],
+        k=settings.rrf_k,
+    )
+
+    by_id: Dict[str, Dict] = {}
+    for m in lex_m:
+        by_id[_match_id(m)] = {"metadata": _match_metadata(m), "lexical_score": m["score"]}
+    for m in dense_m:
+        entry = by_id.setdefault(_match_id(m), {"metadata": {}})
+        entry["metadata"] = _match_metadata(m) or entry["metadata"]
+        entry["dense_score"] = m["score"] if isinstance(m, dict) else getattr(m, "score", None)
+        entry["values"] = _match_values(m)
+
+    matches = []
+    for cid, score in fused[:top_k]:
+        entry = by_id[cid]
+        matches.append(
+            {
+                "id": cid,
+                "score": score,
+                "metadata": entry["metadata"],
+                "dense_score": entry.get("dense_score"),
+                "lexical_score": entry.get("lexical_score"),
+            }
+        )
+        if entry.get("values"):
+            matches[-1]["values"] = entry["values"]
+    return {"matches": matches}
+
+
+def retrieve(
+    question: str,
+    *,
+    top_k: int = 8,
+    doc_id: Optional[str] = None,
+    vector: Optional[List[float]] = None,
+    include_values: bool = False,
+) -> Dict:
+    """
+    Dense-only unless settings.hybrid_retrieval is on (and the DB has chunks_fts),
+    in which case dense and BM25 candidates are merged with RRF.
+    `vector` is the already-computed query embedding, if the caller has one;
+    include_values asks the vector backend for the dense matches' stored vectors.
+    """
+    if not settings.hybrid_retrieval or not fts_available():
+        return vector_query(question, top_k=top_k, doc_id=doc_id, vector=vector, include_values=include_values)
+
+    n = max(top_k, settings.hybrid_candidates)
+    dense = vector_query(question, top_k=n, doc_id=doc_id, vector=vector, include_values=include_values)
+    lexical = lexical_search(question, top_k=n, doc_id=doc_id)
+    return fuse_matches(dense, lexical, top_k=top_k)
+
+
+async def retrieve_async(
+    question: str,
+    *,
+    top_k: int = 8,
+    doc_id: Optional[str] = None,
+    vector: Optional[List[float]] = None,
+    include_values: bool = False,
+) -> Dict:
+    if not settings.hybrid_retrieval or not await run_read(fts_available):
+        return await vector_query_async(
+            question, top_k=top_k, doc_id=doc_id, vector=vector, include_values=include_values
+        )
+
+    n = max(top_k, settings.hybrid_candidates)
+    dense, lexical = await asyncio.gather(
+        vector_query_async(question, top_k=n, doc_id=doc_id, vector=vector, include_values=include_values),
+        run_read(lexical_search, question, top_k=n, doc_id=doc_id),
+    )
+    return fuse_matches(dense, lexical, top_k=top_k)
+
+
+if __name__ == "__main__":
+    rebuild_fts()
+    print("✅ Rebuilt chunks_fts")
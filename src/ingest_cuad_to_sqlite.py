@@ -1,14 +1,26 @@
+import argparse
+import hashlib
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from huggingface_hub import snapshot_download
 from sqlalchemy import text
 
 from src.config import settings
-from src.db import init_schema, get_conn
-from src.documents import make_doc_id
-from src.chunking import chunk_text, make_chunk_id
+from src.db import (
+    bulk_load_connection,
+    create_indexes,
+    drop_indexes_for_bulk_load,
+    get_conn,
+    init_schema,
+    rebuild_fts,
+)
+from src.documents import compress_text, make_doc_id
+from src.chunking import chunk_document, content_hash, make_chunk_id
 
 
 REPO_ID = "theatticusproject/cuad"
@@ -47,121 +59,408 @@ def load_contract_text(txt_path: Path) -> str:
     return txt_path.read_text(encoding="utf-8", errors="ignore")
 
 
-def iter_cuad_annotations(root: Path):
+def iter_cuad_docs(json_path: Path):
     """
-    Yields (title, paragraph_context, question, answers_list)
-    answers_list: list of {"text": str, "answer_start": int}
+    Yields the entries of CUAD_v1.json["data"] one at a time.
+
+    With ijson installed the file is parsed incrementally, so peak memory is
+    one contract (~100 KB) instead of several times the ~40 MB file.
+    Without it we fall back to json.load.
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is None:
+        with open(json_path, "rb") as f:
+            obj = json.load(f)
+        yield from obj.get("data", [])
+        return
+
+    with open(json_path, "rb") as f:
+        yield from ijson.items(f, "data.item", use_float=True)
+
+
+def make_context_id(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_cuad_paragraphs(root: Path):
+    """
+    Yields (title, paragraph_context, qas) — one per paragraph, so each context
+    string is seen (and stored) once rather than once per question.
     """
     json_path = root / "CUAD_v1" / "CUAD_v1.json"
-    obj = json.loads(json_path.read_text(encoding="utf-8"))
 
     # SQuAD-like structure:
     # obj["data"] -> list of docs
     # doc["title"], doc["paragraphs"] -> each has "context" + "qas"
-    for doc in obj.get("data", []):
+    for doc in iter_cuad_docs(json_path):
         title = doc.get("title")
         for para in doc.get("paragraphs", []):
-            context = para.get("context", "")
-            for qa in para.get("qas", []):
-                question = qa.get("question", "")
-                answers = qa.get("answers", [])
-                yield title, context, question, answers
+            yield title, para.get("context", ""), para.get("qas", [])
 
 
-def main():
-    init_schema()
+def iter_cuad_annotations(root: Path):
+    """
+    Yields (title, paragraph_context, question, answers_list)
+    answers_list: list of {"text": str, "answer_start": int}
+    """
+    for title, context, qas in iter_cuad_paragraphs(root):
+        for qa in qas:
+            question = qa.get("question", "")
+            answers = qa.get("answers", [])
+            yield title, context, question, answers
 
-    root = download_cuad_snapshot()
-    txt_map = index_txt_files(root)
+
+# Re-ingest keeps chunk rows (and rowids) when nothing changed and updates
+# text + content_hash in place when a contract was edited (or the storage mode
+# switched between inline text and offsets-only).
+_CHUNK_UPSERT = """
+INSERT INTO chunks (chunk_id, doc_id, chunk_index, start_char, end_char, text, content_hash)
+VALUES ({values})
+ON CONFLICT(chunk_id) DO UPDATE SET
+    text = excluded.text,
+    content_hash = excluded.content_hash
+WHERE chunks.content_hash IS NOT excluded.content_hash
+   OR length(chunks.text) != length(excluded.text)
+"""
+CHUNK_UPSERT_SQL = _CHUNK_UPSERT.format(
+    values=":chunk_id, :doc_id, :chunk_index, :start_char, :end_char, :text, :content_hash"
+)
+CHUNK_UPSERT_SQL_QMARK = _CHUNK_UPSERT.format(values="?, ?, ?, ?, ?, ?, ?")
+
+# In offsets mode the full text lives (compressed) on the document row;
+# otherwise text_z stays NULL and chunks carry their own text.
+_DOC_UPSERT = """
+INSERT INTO documents (doc_id, title, source, raw_path, text_z, text_codec, n_chars)
+VALUES ({values})
+ON CONFLICT(doc_id) DO UPDATE SET
+    raw_path = excluded.raw_path,
+    text_z = excluded.text_z,
+    text_codec = excluded.text_codec,
+    n_chars = excluded.n_chars
+"""
+DOC_UPSERT_SQL = _DOC_UPSERT.format(values=":doc_id, :title, :source, :raw_path, :text_z, :text_codec, :n_chars")
+DOC_UPSERT_SQL_QMARK = _DOC_UPSERT.format(values="?, ?, ?, ?, ?, ?, ?")
+
+
+def stored_text_fields(full_text: str, storage: str, codec: str) -> Tuple[object, object, int]:
+    """
+    (text_z, text_codec, n_chars) for a documents row.
+    """
+    if storage == "offsets":
+        return compress_text(full_text, codec), codec, len(full_text)
+    return None, None, len(full_text)
+
+
+def chunk_row_text(chunk_str: str, storage: str) -> str:
+    # content_hash is always computed from the real text; only what's stored differs.
+    return "" if storage == "offsets" else chunk_str
+
+
+def delete_stale_chunks(cur, seen_chunk_ids: List[str], doc_ids: List[str]) -> int:
+    """
+    Remove chunks of re-ingested documents that the current chunking no longer
+    produces (e.g. after changing chunk_size). Their vectors are removed by
+    `python -m src.sync_vectors`.
+    """
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_seen (chunk_id TEXT PRIMARY KEY)")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_docs (doc_id TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM ingest_seen")
+    cur.execute("DELETE FROM ingest_docs")
+    cur.executemany("INSERT OR IGNORE INTO ingest_seen VALUES (?)", [(c,) for c in seen_chunk_ids])
+    cur.executemany("INSERT OR IGNORE INTO ingest_docs VALUES (?)", [(d,) for d in doc_ids])
+    cur.execute("""
+    DELETE FROM chunks
+    WHERE doc_id IN (SELECT doc_id FROM ingest_docs)
+      AND chunk_id NOT IN (SELECT chunk_id FROM ingest_seen)
+    """)
+    return cur.rowcount
+
+
+class Progress:
+    """
+    Throttled throughput reporter (one line every `every_s` seconds, plus a final line).
+    """
+
+    def __init__(self, label: str, total: int = 0, every_s: float = 2.0):
+        self.label = label
+        self.total = total
+        self.every_s = every_s
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+        self.counts: Dict[str, int] = {}
+
+    def add(self, **counts: int) -> None:
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+        now = time.perf_counter()
+        if now - self._last >= self.every_s:
+            self._last = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.perf_counter() - self.t0, 1e-9)
+        rates = " ".join(f"{k}={v} ({v / elapsed:,.0f}/s)" for k, v in self.counts.items())
+        of_total = f"/{self.total}" if self.total else ""
+        prefix = "✅ " if final else ""
+        first = next(iter(self.counts.values()), 0)
+        print(f"{prefix}[{self.label}] {first}{of_total} {rates} elapsed={elapsed:.1f}s")
+
+
+def _read_and_chunk(job: Tuple[str, str, str, int, int, str, str]) -> Tuple[tuple, List[tuple]]:
+    """
+    Process-pool worker: read one contract and return ready-to-insert document
+    and chunk rows (compression happens here too, off the writer thread).
+    """
+    title, path, chunker, chunk_size, chunk_overlap, storage, codec = job
+    doc_id = make_doc_id(title)
+    full_text = load_contract_text(Path(path))
+    doc_row = (doc_id, title, "cuad-v1", path, *stored_text_fields(full_text, storage, codec))
+    rows = []
+    for ch in chunk_document(full_text, chunker=chunker, chunk_size=chunk_size, chunk_overlap=chunk_overlap):
+        chunk_id = make_chunk_id(doc_id, ch["chunk_index"], ch["start_char"], ch["end_char"])
+        rows.append(
+            (
+                chunk_id,
+                doc_id,
+                ch["chunk_index"],
+                ch["start_char"],
+                ch["end_char"],
+                chunk_row_text(ch["text"], storage),
+                content_hash(ch["text"]),
+            )
+        )
+    return doc_row, rows
+
+
+def _annotation_row(title: str, context_id: str, question: str, answers: list) -> tuple:
+    doc_id = make_doc_id(title)
+    answer_texts = []
+    answer_starts = []
+    for a in answers or []:
+        t = a.get("text", "")
+        s = a.get("answer_start", None)
+        if t is not None and s is not None:
+            answer_texts.append(t)
+            answer_starts.append(int(s))
+    annotation_id = make_doc_id(f"{doc_id}::{question}")
+    return (
+        annotation_id,
+        doc_id,
+        question,
+        context_id,
+        json.dumps(answer_texts, ensure_ascii=False),
+        json.dumps(answer_starts, ensure_ascii=False),
+    )
+
+
+def insert_annotations(cur, root: Path, *, batch_rows: int) -> int:
+    """
+    Stream CUAD_v1.json into contexts + annotations with executemany.
+    Each paragraph context is stored once in `contexts` (compressed in offsets
+    mode); annotations point at it.
+    """
+    offsets = settings.chunk_storage == "offsets"
+    codec = settings.doc_text_codec
+    ctx_sql = "INSERT OR IGNORE INTO contexts (context_id, doc_id, text, text_z, text_codec) VALUES (?, ?, ?, ?, ?)"
+    ann_sql = """
+    INSERT OR IGNORE INTO annotations
+    (annotation_id, doc_id, label, context_id, answer_texts_json, answer_starts_json)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+    n_anns = 0
+    progress = Progress("annotations")
+    ann_rows: List[tuple] = []
+    for title, context, qas in iter_cuad_paragraphs(root):
+        if not title:
+            continue
+        context_id = make_context_id(context)
+        if offsets:
+            ctx_row = (context_id, make_doc_id(title), "", compress_text(context, codec), codec)
+        else:
+            ctx_row = (context_id, make_doc_id(title), context, None, None)
+        cur.execute(ctx_sql, ctx_row)
+        for qa in qas:
+            ann_rows.append(_annotation_row(title, context_id, qa.get("question", ""), qa.get("answers", [])))
+        n_anns += len(qas)
+        progress.add(annotations=len(qas))
+        if len(ann_rows) >= batch_rows:
+            cur.executemany(ann_sql, ann_rows)
+            ann_rows.clear()
+    cur.executemany(ann_sql, ann_rows)
+    progress.report(final=True)
+    return n_anns
+
+
+def ingest_bulk(root: Path, txt_map: Dict[str, Path], *, workers: int = 0) -> Tuple[int, int, int]:
+    """
+    High-throughput load: contracts are read + chunked in a process pool, rows
+    go in with executemany inside one transaction per table group, and
+    secondary indexes / FTS are (re)built once at the end.
+    """
+    init_schema(with_indexes=False)
+    drop_indexes_for_bulk_load()
+
+    workers = workers or settings.ingest_workers or os.cpu_count() or 1
+    batch_rows = settings.ingest_batch_rows
+    jobs = [
+        (
+            title,
+            str(p),
+            settings.chunker,
+            settings.chunk_size,
+            settings.chunk_overlap,
+            settings.chunk_storage,
+            settings.doc_text_codec,
+        )
+        for title, p in txt_map.items()
+    ]
+
+    doc_sql = DOC_UPSERT_SQL_QMARK
+    chunk_sql = CHUNK_UPSERT_SQL_QMARK
+
+    n_docs = n_chunks = 0
+    seen_chunk_ids: List[str] = []
+    seen_doc_ids: List[str] = []
+    progress = Progress("documents", total=len(jobs))
+    with bulk_load_connection() as raw:
+        cur = raw.cursor()
+        doc_rows: List[tuple] = []
+        chunk_rows: List[tuple] = []
+
+        def flush():
+            cur.executemany(doc_sql, doc_rows)
+            cur.executemany(chunk_sql, chunk_rows)
+            seen_doc_ids.extend(r[0] for r in doc_rows)
+            seen_chunk_ids.extend(r[0] for r in chunk_rows)
+            doc_rows.clear()
+            chunk_rows.clear()
+
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for doc_row, rows in ex.map(_read_and_chunk, jobs, chunksize=8):
+                doc_rows.append(doc_row)
+                chunk_rows.extend(rows)
+                n_docs += 1
+                n_chunks += len(rows)
+                progress.add(docs=1, chunks=len(rows))
+                if len(chunk_rows) >= batch_rows:
+                    flush()
+        flush()
+        progress.report(final=True)
+
+        removed = delete_stale_chunks(cur, seen_chunk_ids, seen_doc_ids)
+        if removed:
+            print(f"removed {removed} stale chunks (run `python -m src.sync_vectors` to drop their vectors)")
+
+        n_anns = insert_annotations(cur, root, batch_rows=batch_rows)
+        cur.close()
+
+    t0 = time.perf_counter()
+    create_indexes()
+    rebuild_fts()
+    print(f"indexes + FTS built in {time.perf_counter() - t0:.1f}s")
+
+    return n_docs, n_chunks, n_anns
+
+
+def ingest_serial(root: Path, txt_map: Dict[str, Path]) -> Tuple[int, int, int]:
+    init_schema()
 
     # 1) Insert documents + chunks (from full_contract_txt)
     inserted_docs = 0
     inserted_chunks = 0
+    progress = Progress("documents", total=len(txt_map))
+    seen_chunk_ids: List[str] = []
+    storage, codec = settings.chunk_storage, settings.doc_text_codec
 
     with get_conn() as conn:
         for title, txt_path in txt_map.items():
             doc_id = make_doc_id(title)
+            full_text = load_contract_text(txt_path)
 
             # documents
+            text_z, text_codec, n_chars = stored_text_fields(full_text, storage, codec)
             conn.execute(
-                text("""
-                INSERT OR IGNORE INTO documents (doc_id, title, source, raw_path)
-                VALUES (:doc_id, :title, :source, :raw_path)
-                """),
-                {"doc_id": doc_id, "title": title, "source": "cuad-v1", "raw_path": str(txt_path)},
+                text(DOC_UPSERT_SQL),
+                {
+                    "doc_id": doc_id,
+                    "title": title,
+                    "source": "cuad-v1",
+                    "raw_path": str(txt_path),
+                    "text_z": text_z,
+                    "text_codec": text_codec,
+                    "n_chars": n_chars,
+                },
             )
 
             # chunks
-            full_text = load_contract_text(txt_path)
-            chunks = chunk_text(
+            chunks = chunk_document(
                 full_text,
+                chunker=settings.chunker,
                 chunk_size=settings.chunk_size,
                 chunk_overlap=settings.chunk_overlap,
             )
 
             for ch in chunks:
                 chunk_id = make_chunk_id(doc_id, ch["chunk_index"], ch["start_char"], ch["end_char"])
+                seen_chunk_ids.append(chunk_id)
                 conn.execute(
-                    text("""
-                    INSERT OR IGNORE INTO chunks
-                    (chunk_id, doc_id, chunk_index, start_char, end_char, text)
-                    VALUES (:chunk_id, :doc_id, :chunk_index, :start_char, :end_char, :text)
-                    """),
+                    text(CHUNK_UPSERT_SQL),
                     {
                         "chunk_id": chunk_id,
                         "doc_id": doc_id,
                         "chunk_index": ch["chunk_index"],
                         "start_char": ch["start_char"],
                         "end_char": ch["end_char"],
-                        "text": ch["text"],
+                        "text": chunk_row_text(ch["text"], storage),
+                        "content_hash": content_hash(ch["text"]),
                     },
                 )
 
             inserted_docs += 1
-            print(f"inserted docs: {inserted_docs}")
             inserted_chunks += len(chunks)
-            print(f"inserted chunks: {inserted_chunks}")
+            progress.add(docs=1, chunks=len(chunks))
+
+        cur = conn.connection.cursor()
+        delete_stale_chunks(cur, seen_chunk_ids, [make_doc_id(t) for t in txt_map])
+        cur.close()
+    progress.report(final=True)
+    if storage == "offsets":
+        rebuild_fts()
 
     # 2) Insert annotations (from CUAD_v1.json)
     # Note: answer_start positions are relative to the paragraph "context" in CUAD_v1.json. :contentReference[oaicite:3]{index=3}
-    inserted_anns = 0
-    with get_conn() as conn:
-        for title, context, question, answers in iter_cuad_annotations(root):
-            if not title:
-                continue
-            doc_id = make_doc_id(title)
+    with bulk_load_connection() as raw:
+        cur = raw.cursor()
+        inserted_anns = insert_annotations(cur, root, batch_rows=settings.ingest_batch_rows)
+        cur.close()
 
-            # Normalize to lists
-            answer_texts = []
-            answer_starts = []
-            for a in answers or []:
-                t = a.get("text", "")
-                s = a.get("answer_start", None)
-                if t is not None and s is not None:
-                    answer_texts.append(t)
-                    answer_starts.append(int(s))
+    return inserted_docs, inserted_chunks, inserted_anns
 
-            annotation_id = make_doc_id(f"{doc_id}::{question}")  # reuse hash helper; good enough
 
-            conn.execute(
-                text("""
-                INSERT OR IGNORE INTO annotations
-                (annotation_id, doc_id, label, context, answer_texts_json, answer_starts_json)
-                VALUES (:annotation_id, :doc_id, :label, :context, :answer_texts_json, :answer_starts_json)
-                """),
-                {
-                    "annotation_id": annotation_id,
-                    "doc_id": doc_id,
-                    "label": question,  # CUAD question text as label
-                    "context": context,
-                    "answer_texts_json": json.dumps(answer_texts, ensure_ascii=False),
-                    "answer_starts_json": json.dumps(answer_starts, ensure_ascii=False),
-                },
-            )
-            inserted_anns += 1
+def main(*, serial: bool = False, workers: int = 0, chunker: Optional[str] = None):
+    t0 = time.perf_counter()
+    if chunker:
+        settings.chunker = chunker
+    root = download_cuad_snapshot()
+    txt_map = index_txt_files(root)
+
+    if serial:
+        docs, chunks, anns = ingest_serial(root, txt_map)
+    else:
+        docs, chunks, anns = ingest_bulk(root, txt_map, workers=workers)
 
-    print(f"✅ Done. docs={inserted_docs} chunks={inserted_chunks} annotations={inserted_anns}")
+    print(f"✅ Done. docs={docs} chunks={chunks} annotations={anns} in {time.perf_counter() - t0:.1f}s")
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Load CUAD contracts, chunks and annotations into SQLite.")
+    ap.add_argument("--serial", action="store_true", help="one INSERT per row (original, slow path)")
+    ap.add_argument("--workers", type=int, default=0, help="chunking processes (default: settings.ingest_workers or CPU count)")
+    ap.add_argument("--chunker", choices=["chars", "structure"], help="override settings.chunker (CHUNKER)")
+    args = ap.parse_args()
+    main(serial=args.serial, workers=args.workers, chunker=args.chunker)
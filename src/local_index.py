@@ -0,0 +1,275 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from src.config import settings
+from src.db import get_conn
+from src.documents import fetch_chunks_by_ids
+
+
+# Files written by build_local_index(); everything except the JSON sidecars is
+# a plain .npy so it can be memory-mapped straight from disk.
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+DOC_IDS_FILE = "doc_ids.npy"
+CHUNK_INDEX_FILE = "chunk_index.npy"
+START_CHAR_FILE = "start_char.npy"
+END_CHAR_FILE = "end_char.npy"
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_ORDER_FILE = "ivf_order.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+DOC_RANGES_FILE = "doc_ranges.json"
+TITLES_FILE = "titles.json"
+MANIFEST_FILE = "manifest.json"
+
+_LOCAL_INDEX = None
+_LOCAL_INDEX_LOCK = threading.Lock()
+
+
+class LocalVectorIndex:
+    """
+    In-process replacement for the Pinecone index.
+
+    Rows are sorted by doc_id at build time, so a doc_id filter is just a
+    contiguous slice of the matrix. Vectors are L2-normalised, so the dot
+    product is the cosine score Pinecone would return.
+
+    mode="exact" scores every row; mode="ivf" scores only the rows in the
+    `nprobe` inverted lists whose centroids are closest to the query.
+    """
+
+    def __init__(self, index_dir: str, *, mode: str = "exact", nprobe: int = 8):
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown local index mode: {mode!r} (expected 'exact' or 'ivf')")
+
+        d = Path(index_dir)
+        if not (d / MANIFEST_FILE).exists():
+            raise FileNotFoundError(
+                f"No local vector index at {d}. Build it with: python -m src.local_index"
+            )
+
+        self.index_dir = d
+        self.manifest = json.loads((d / MANIFEST_FILE).read_text(encoding="utf-8"))
+        self.vectors = np.load(d / VECTORS_FILE, mmap_mode="r")
+        self.ids = np.load(d / IDS_FILE, mmap_mode="r")
+        self.doc_ids = np.load(d / DOC_IDS_FILE, mmap_mode="r")
+        self.chunk_index = np.load(d / CHUNK_INDEX_FILE, mmap_mode="r")
+        self.start_char = np.load(d / START_CHAR_FILE, mmap_mode="r")
+        self.end_char = np.load(d / END_CHAR_FILE, mmap_mode="r")
+        self.doc_ranges = json.loads((d / DOC_RANGES_FILE).read_text(encoding="utf-8"))
+        self.titles = json.loads((d / TITLES_FILE).read_text(encoding="utf-8"))
+
+        self.mode = mode
+        self.nprobe = nprobe
+        if mode == "ivf":
+            if not (d / IVF_CENTROIDS_FILE).exists():
+                raise FileNotFoundError(f"Local index at {d} was built without IVF lists.")
+            self.ivf_centroids = np.load(d / IVF_CENTROIDS_FILE)
+            self.ivf_order = np.load(d / IVF_ORDER_FILE, mmap_mode="r")
+            self.ivf_offsets = np.load(d / IVF_OFFSETS_FILE)
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def dimension(self) -> int:
+        return int(self.vectors.shape[1])
+
+    def _candidate_rows(self, q: np.ndarray) -> np.ndarray:
+        cscores = self.ivf_centroids @ q
+        nprobe = min(self.nprobe, len(cscores))
+        lists = np.argpartition(-cscores, nprobe - 1)[:nprobe]
+        parts = [self.ivf_order[self.ivf_offsets[i]:self.ivf_offsets[i + 1]] for i in lists]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _match(self, row: int, score: float) -> Dict:
+        doc_id = str(self.doc_ids[row])
+        return {
+            "id": str(self.ids[row]),
+            "score": float(score),
+            "metadata": {
+                "title": self.titles.get(doc_id, ""),
+                "doc_id": doc_id,
+                "chunk_index": int(self.chunk_index[row]),
+                "start_char": int(self.start_char[row]),
+                "end_char": int(self.end_char[row]),
+                "source": "cuad-v1",
+            },
+        }
+
+    def query(self, vector, *, top_k: int = 8, doc_id: Optional[str] = None, include_values: bool = False) -> Dict:
+        """
+        Same response shape as Pinecone's index.query(): {"matches": [...], "namespace": ...}
+        """
+        q = np.asarray(vector, dtype=np.float32)
+
+        if doc_id is not None:
+            # Filtered search: one contract is at most a few hundred rows, so exact is cheapest.
+            rng = self.doc_ranges.get(doc_id)
+            if rng is None:
+                return {"matches": [], "namespace": settings.pinecone_namespace}
+            rows = np.arange(rng[0], rng[1])
+            scores = self.vectors[rng[0]:rng[1]] @ q
+        elif self.mode == "ivf":
+            rows = np.sort(self._candidate_rows(q))
+            scores = self.vectors[rows] @ q
+        else:
+            rows = None
+            scores = self.vectors @ q
+
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return {"matches": [], "namespace": settings.pinecone_namespace}
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            row = int(rows[i]) if rows is not None else int(i)
+            m = self._match(row, scores[i])
+            if include_values:
+                m["values"] = self.vectors[row].tolist()
+            matches.append(m)
+        return {"matches": matches, "namespace": settings.pinecone_namespace}
+
+
+def get_local_index() -> LocalVectorIndex:
+    global _LOCAL_INDEX
+    if _LOCAL_INDEX is None:
+        with _LOCAL_INDEX_LOCK:
+            if _LOCAL_INDEX is None:
+                _LOCAL_INDEX = LocalVectorIndex(
+                    settings.local_index_dir,
+                    mode=settings.local_index_mode,
+                    nprobe=settings.local_index_nprobe,
+                )
+    return _LOCAL_INDEX
+
+
+def _spherical_kmeans(x: np.ndarray, nlist: int, *, iters: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Plain k-means on the unit sphere (cosine). Good enough for IVF lists over ~50k rows.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = x[assign == c]
+            if len(members) == 0:
+                # re-seed empty lists so every centroid stays useful
+                centroids[c] = x[rng.integers(len(x))]
+                continue
+            v = members.sum(axis=0)
+            centroids[c] = v / max(np.linalg.norm(v), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def _build_ivf(d: Path, vectors: np.ndarray, nlist: int) -> None:
+    n = len(vectors)
+    # Train on a sample; assigning the full set is one matrix multiply.
+    sample = vectors if n <= 50 * nlist else vectors[np.random.default_rng(0).choice(n, 50 * nlist, replace=False)]
+    centroids = _spherical_kmeans(np.asarray(sample, dtype=np.float32), nlist)
+
+    assign = np.empty(n, dtype=np.int32)
+    step = 8192
+    for s in range(0, n, step):
+        assign[s:s + step] = np.argmax(vectors[s:s + step] @ centroids.T, axis=1)
+
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    counts = np.bincount(assign, minlength=nlist)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    np.save(d / IVF_CENTROIDS_FILE, centroids)
+    np.save(d / IVF_ORDER_FILE, order)
+    np.save(d / IVF_OFFSETS_FILE, offsets)
+
+
+def build_local_index(index_dir: Optional[str] = None, *, nlist: Optional[int] = None) -> Path:
+    """
+    Embed every row of the chunks table into a memory-mappable index directory.
+    nlist=None picks ~sqrt(N) IVF lists; nlist=0 skips IVF (exact search only).
+    """
+    from src.retrieval import load_local_embedder
+
+    d = Path(index_dir or settings.local_index_dir)
+    d.mkdir(parents=True, exist_ok=True)
+
+    with get_conn() as conn:
+        rows = conn.execute(
+            text("""
+            SELECT chunk_id, doc_id, chunk_index, start_char, end_char
+            FROM chunks
+            ORDER BY doc_id, chunk_index
+            """)
+        ).fetchall()
+        titles = {r[0]: r[1] for r in conn.execute(text("SELECT doc_id, title FROM documents")).fetchall()}
+
+    n = len(rows)
+    if n == 0:
+        raise RuntimeError("chunks table is empty; run ingestion first.")
+
+    # The index is built with the reference torch model, like the Pinecone
+    # upserts; EMBEDDER_BACKEND only picks how queries are embedded at serve time.
+    embedder = load_local_embedder(backend="torch")
+    dim = embedder.get_sentence_embedding_dimension()
+    print("Local embedding dim:", dim, "| chunks:", n)
+
+    vectors = np.lib.format.open_memmap(d / VECTORS_FILE, mode="w+", dtype=np.float32, shape=(n, dim))
+
+    batch = settings.embed_batch_size
+    t0 = time.time()
+    for s in range(0, n, batch):
+        ids = [r[0] for r in rows[s:s + batch]]
+        texts = {c["chunk_id"]: c["text"] for c in fetch_chunks_by_ids(ids)}
+        vecs = embedder.encode([texts[i] for i in ids], batch_size=min(64, batch), normalize_embeddings=True)
+        vectors[s:s + len(ids)] = vecs
+        print(f"embedded {s + len(ids)}/{n} chunks ({time.time() - t0:.1f}s)")
+    vectors.flush()
+
+    ids_arr = np.array([r[0] for r in rows])
+    doc_arr = np.array([r[1] for r in rows])
+    np.save(d / IDS_FILE, ids_arr)
+    np.save(d / DOC_IDS_FILE, doc_arr)
+    np.save(d / CHUNK_INDEX_FILE, np.array([r[2] for r in rows], dtype=np.int32))
+    np.save(d / START_CHAR_FILE, np.array([r[3] for r in rows], dtype=np.int64))
+    np.save(d / END_CHAR_FILE, np.array([r[4] for r in rows], dtype=np.int64))
+
+    doc_ranges: Dict[str, List[int]] = {}
+    for i, doc_id in enumerate(doc_arr.tolist()):
+        if doc_id not in doc_ranges:
+            doc_ranges[doc_id] = [i, i + 1]
+        else:
+            doc_ranges[doc_id][1] = i + 1
+    (d / DOC_RANGES_FILE).write_text(json.dumps(doc_ranges), encoding="utf-8")
+    (d / TITLES_FILE).write_text(json.dumps({k: titles.get(k, "") for k in doc_ranges}), encoding="utf-8")
+
+    if nlist is None:
+        nlist = int(np.sqrt(n))
+    nlist = min(nlist, n)
+    if nlist > 0:
+        _build_ivf(d, np.load(d / VECTORS_FILE, mmap_mode="r"), nlist)
+
+    manifest = {
+        "count": n,
+        "dimension": dim,
+        "metric": "cosine",
+        "embedding_model": settings.local_embedding_model,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+        "nlist": nlist,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    (d / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    print(f"✅ Local index built at {d}. chunks={n} nlist={nlist}")
+    return d
+
+
+if __name__ == "__main__":
+    build_local_index()
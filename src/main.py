@@ -1,21 +1,41 @@
 from __future__ import annotations
 
-import os
+import asyncio
+import json
+import threading
+import time
 from pathlib import Path
-from typing import Optional
-from urllib.parse import urlparse
+from typing import List, Optional
 
-from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse
+# Imported first so STARTUP.t0 marks the start of the app import.
+from src.startup import STARTUP
+
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from markupsafe import Markup, escape
-
-from google.cloud import storage
-
+from pydantic import BaseModel
+
+from src.answer_cache import answer_cache_stats
+from src.batch_ask import rag_answer_batch
+from src.clause_extraction import get_category_matcher
+from src.context import context_stats
+from src.doc_index import doc_index_stats
+from src.rerank import rerank_stats, warm_up_reranker
 from src.config import settings
+from src.db_artifact import DB_READINESS, ensure_sqlite_db
 from src.documents import list_documents
-from src.rag import rag_answer
+from src.rag import rag_answer_async, rag_answer_stream
+from src.retrieval import (
+    embed_batcher_stats,
+    prewarm_query_cache,
+    query_cache_stats,
+    warm_up_embedder,
+    warm_up_vector_backend,
+)
+
+STARTUP.mark("import src.main", STARTUP.t0, time.perf_counter())
 
 
 # --- Paths (project-root based) ---
@@ -54,64 +74,62 @@ if STATIC_DIR.exists():
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 
-def _parse_gs_uri(gs_uri: str) -> tuple[str, str]:
-    """
-    Parse gs://bucket/path/to/object into (bucket, object).
-    (Optional alternative to using GCS_DB_BUCKET + GCS_DB_OBJECT.)
-    """
-    u = urlparse(gs_uri)
-    if u.scheme != "gs":
-        raise ValueError(f"Expected gs://... URI, got: {gs_uri}")
-    bucket = u.netloc
-    obj = u.path.lstrip("/")
-    if not bucket or not obj:
-        raise ValueError(f"Invalid gs uri: {gs_uri}")
-    return bucket, obj
+def _warm_step(name: str, fn):
+    # Warm-ups never block startup; whatever fails is simply paid by the first request.
+    try:
+        with STARTUP.step(name):
+            return fn()
+    except Exception as e:
+        print(f"{name} failed:", repr(e))
 
 
-def _maybe_download_sqlite_db():
-    """
-    Cloud Run mode:
-      - deploy.sh sets SQLITE_PATH=/tmp/contractrag.db
-      - deploy.sh sets GCS_DB_BUCKET and GCS_DB_OBJECT
-      - this downloads gs://bucket/object -> SQLITE_PATH if file missing/empty
+def _warm_up_models():
+    if settings.embedder_warmup:
+        _warm_step("embedder_warmup", warm_up_embedder)
+    if settings.vector_warmup:
+        _warm_step("vector_warmup", warm_up_vector_backend)
+    if settings.rerank:
+        _warm_step("reranker_warmup", warm_up_reranker)
+
 
-    Local mode:
-      - no GCS_* env vars => no-op; app uses local settings.sqlite_path
+def _startup_background():
     """
-    dest = Path(settings.sqlite_path)
+    DB download and model/vector warm-up run in parallel, off the startup
+    event, so the server starts listening immediately; /healthz reports
+    not-ready until the DB is usable.
+    """
+    warm = threading.Thread(target=_warm_up_models, name="warmup", daemon=True)
+    warm.start()
 
-    # If DB is already present and non-empty, don't download.
-    if dest.exists() and dest.stat().st_size > 0:
+    with STARTUP.step("db_fetch"):
+        DB_READINESS.run(ensure_sqlite_db)
+    if not DB_READINESS.ready:
+        print("SQLite DB not available:", DB_READINESS.error)
         return
 
-    # Source of DB in GCS (matches your deploy.sh)
-    bucket = os.getenv("GCS_DB_BUCKET")
-    obj = os.getenv("GCS_DB_OBJECT")
+    warm.join()
+    if settings.embed_cache_prewarm:
+        n = _warm_step("query_cache_prewarm", prewarm_query_cache)
+        if n is not None:
+            print("Prewarmed query embeddings:", n)
+    if settings.clause_answers:
+        _warm_step("clause_matcher", get_category_matcher)
 
-    # Optional alternative: allow a single URI env var
-    gs_uri = os.getenv("CONTRACTIQ_DB_GCS_URI")
-    if (not bucket or not obj) and gs_uri:
-        bucket, obj = _parse_gs_uri(gs_uri)
 
-    # If nothing configured, do nothing (local dev).
-    if not bucket or not obj:
-        return
-
-    dest.parent.mkdir(parents=True, exist_ok=True)
+@app.on_event("startup")
+def startup_event():
+    STARTUP.mark("app_startup_event", STARTUP.t0, time.perf_counter())
+    threading.Thread(target=_startup_background, name="startup", daemon=True).start()
 
-    client = storage.Client()
-    b = client.bucket(bucket)
-    blob = b.blob(obj)
-    blob.download_to_filename(str(dest))
 
-    if not dest.exists() or dest.stat().st_size == 0:
-        raise RuntimeError("SQLite DB download failed or produced an empty file.")
+def _require_db():
+    if not DB_READINESS.wait(settings.db_ready_wait_s):
+        raise HTTPException(status_code=503, detail={"db": DB_READINESS.as_dict()})
 
 
-@app.on_event("startup")
-def startup_event():
-    _maybe_download_sqlite_db()
+async def _require_db_async():
+    if not DB_READINESS.ready:
+        await asyncio.to_thread(_require_db)
 
 
 def highlight_quote(quote: str, answer_span: str) -> Markup:
@@ -128,11 +146,32 @@ def highlight_quote(quote: str, answer_span: str) -> Markup:
 
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    db = DB_READINESS.as_dict()
+    if not db["ready"]:
+        return JSONResponse({"ok": False, "db": db}, status_code=503)
+    return {"ok": True, "db": db}
+
+
+@app.get("/debug/startup")
+def debug_startup():
+    return {"db": DB_READINESS.as_dict(), **STARTUP.report()}
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "answer_cache": answer_cache_stats(),
+        "context": context_stats(),
+        "rerank": rerank_stats(),
+        "doc_index": doc_index_stats(),
+        "query_embedding_cache": query_cache_stats(),
+        "embed_batcher": embed_batcher_stats(),
+    }
 
 
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
+    _require_db()
     docs = list_documents(limit=200)
     return templates.TemplateResponse(
         "index.html",
@@ -144,19 +183,26 @@ def home(request: Request):
 
 
 @app.post("/ask", response_class=HTMLResponse)
-def ask(
+async def ask(
     request: Request,
     question: str = Form(...),
     doc_id: Optional[str] = Form(None),
     top_k: int = Form(12),
+    mmr: Optional[bool] = Form(None),
+    mmr_lambda: Optional[float] = Form(None),
+    neighbors: Optional[int] = Form(None),
 ):
     doc_id = doc_id or None
+    await _require_db_async()
 
-    resp = rag_answer(
+    resp = await rag_answer_async(
         question,
         doc_id=doc_id,
         top_k=top_k,
         debug=False,
+        mmr=mmr,
+        mmr_lambda=mmr_lambda,
+        neighbors=neighbors,
     )
 
     # If citations come back in the future, keep safe HTML highlighting.
@@ -183,3 +229,71 @@ def ask(
             "citations": citations,  # ok if template ignores
         },
     )
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    doc_id: Optional[str] = None
+    top_k: int = 12
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    neighbors: Optional[int] = None
+
+
+@app.post("/ask/batch")
+async def ask_batch(req: AskBatchRequest):
+    """
+    JSON API for a checklist of questions (typically about one doc_id):
+    shared embedding, retrieval, hydration and bounded-concurrency generation.
+    """
+    questions = [q.strip() for q in req.questions if q and q.strip()]
+    if not questions:
+        raise HTTPException(status_code=400, detail="questions must contain at least one non-empty question")
+    if len(questions) > settings.batch_max_questions:
+        raise HTTPException(status_code=400, detail=f"at most {settings.batch_max_questions} questions per batch")
+    await _require_db_async()
+
+    return await rag_answer_batch(
+        questions,
+        doc_id=req.doc_id or None,
+        top_k=req.top_k,
+        mmr=req.mmr,
+        mmr_lambda=req.mmr_lambda,
+        neighbors=req.neighbors,
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(
+    question: str = Form(...),
+    doc_id: Optional[str] = Form(None),
+    top_k: int = Form(12),
+    mmr: Optional[bool] = Form(None),
+    mmr_lambda: Optional[float] = Form(None),
+    neighbors: Optional[int] = Form(None),
+):
+    """
+    Server-Sent Events version of /ask: sources first, then answer tokens.
+    """
+    doc_id = doc_id or None
+    await _require_db_async()
+
+    async def events():
+        try:
+            stream = rag_answer_stream(
+                question, doc_id=doc_id, top_k=top_k, mmr=mmr, mmr_lambda=mmr_lambda, neighbors=neighbors
+            )
+            async for event, data in stream:
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,196 @@
+"""
+ONNX Runtime backend for the sentence-transformers MiniLM embedder.
+
+bake_embedder.py exports the baked model to <model_dir>/onnx/model.onnx and
+a dynamically int8-quantized model_int8.onnx, and checks both against the
+PyTorch model on a fixed sentence set (min cosine must stay above the
+tolerance, so vectors already in the index remain comparable).
+
+At serving time OnnxEmbedder only needs onnxruntime + tokenizers + numpy, so
+neither torch nor sentence_transformers is imported. It mirrors the parts of
+the SentenceTransformer interface the app uses: encode() and
+get_sentence_embedding_dimension().
+
+No src.config import here: bake_embedder.py runs at image build time without
+the app's secrets.
+"""
+import inspect
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+ONNX_SUBDIR = "onnx"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+TOLERANCE_FILE = "tolerance.json"
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# Fixed check set: CUAD-style questions and clause text, short and long.
+CHECK_SENTENCES = [
+    "What is the governing law of this agreement?",
+    "Does the contract contain a non-compete clause?",
+    "Can either party terminate for convenience?",
+    "Is there a cap on liability?",
+    "Who are the parties to the agreement?",
+    "What is the expiration date of the contract?",
+    "Is there a most favored nation provision?",
+    "Does the agreement grant exclusivity to the distributor?",
+    "Are there audit rights?",
+    "Is consent required for assignment of the agreement?",
+    "This Agreement shall be governed by and construed in accordance with the laws of the State of Delaware.",
+    "Neither party shall be liable for any indirect, incidental, special or consequential damages arising out of this Agreement.",
+    "Licensee shall not, during the Term and for a period of two (2) years thereafter, engage in any business that competes with Licensor.",
+    "Either party may terminate this Agreement upon thirty (30) days prior written notice to the other party.",
+    "The Distributor shall have the exclusive right to sell the Products in the Territory during the Term.",
+    "IN WITNESS WHEREOF, the parties have executed this Agreement as of the Effective Date.",
+    "delaware",
+    "indemnification",
+]
+
+
+def onnx_paths(model_dir: str) -> Dict[str, Path]:
+    d = Path(model_dir) / ONNX_SUBDIR
+    return {"dir": d, "fp32": d / FP32_FILE, "int8": d / INT8_FILE, "tolerance": d / TOLERANCE_FILE}
+
+
+def _max_seq_length(model_dir: Path, default: int = 256) -> int:
+    cfg = model_dir / "sentence_bert_config.json"
+    if cfg.exists():
+        return int(json.loads(cfg.read_text(encoding="utf-8")).get("max_seq_length", default))
+    return default
+
+
+class OnnxEmbedder:
+    """
+    Mean-pooled BERT embeddings from an exported ONNX graph.
+    """
+
+    def __init__(self, model_dir: str, *, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        paths = onnx_paths(model_dir)
+        self.model_path = paths["int8" if quantized else "fp32"]
+        if not self.model_path.exists():
+            raise FileNotFoundError(f"{self.model_path} not found; run bake_embedder.py to export it.")
+
+        self.max_seq_length = _max_seq_length(self.model_dir)
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.model_path), opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self._dim = int(self.session.get_outputs()[0].shape[-1])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encs = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encs], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encs], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encs], dtype=np.int64),
+        }
+        feeds = {k: v for k, v in feeds.items() if k in self._inputs}
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        mask = feeds["attention_mask"][..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: Union[str, Sequence[str]],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        show_progress_bar: Optional[bool] = None,
+        convert_to_numpy: bool = True,
+        **_: object,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), self._dim), dtype=np.float32)
+        # Like sentence-transformers: batch by length so padding stays small.
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for s in range(0, len(order), batch_size):
+            idx = order[s:s + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+# -----------------------------
+# Build time (needs torch + transformers; used by bake_embedder.py)
+# -----------------------------
+def export_onnx(model_dir: str, *, opset: int = 17) -> Path:
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    paths = onnx_paths(model_dir)
+    paths["dir"].mkdir(parents=True, exist_ok=True)
+
+    model = AutoModel.from_pretrained(model_dir)
+    model.eval()
+    tok = AutoTokenizer.from_pretrained(model_dir)
+    enc = tok(["export sample"], return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    # Recent torch defaults to the dynamo exporter (needs onnxscript); the
+    # TorchScript exporter handles this BERT graph and dynamic_axes as-is.
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(enc[n] for n in INPUT_NAMES),
+            str(paths["fp32"]),
+            input_names=INPUT_NAMES,
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes={**{n: axes for n in INPUT_NAMES}, "last_hidden_state": axes},
+            opset_version=opset,
+            do_constant_folding=True,
+            **extra,
+        )
+    return paths["fp32"]
+
+
+def quantize_int8(model_dir: str) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    paths = onnx_paths(model_dir)
+    # Weights-only dynamic quantization of the MatMuls: most of the speedup,
+    # and keeps LayerNorm/softmax in fp32 for accuracy.
+    quantize_dynamic(
+        str(paths["fp32"]),
+        str(paths["int8"]),
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=["MatMul"],
+    )
+    return paths["int8"]
+
+
+def cosine_report(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
+
+
+def check_tolerance(reference_model, model_dir: str, *, quantized: bool, min_cosine: float) -> Dict[str, float]:
+    """
+    Compare OnnxEmbedder against the reference SentenceTransformer on CHECK_SENTENCES.
+    Raises ValueError if any sentence falls below `min_cosine`.
+    """
+    ref = reference_model.encode(CHECK_SENTENCES, normalize_embeddings=True)
+    cand = OnnxEmbedder(model_dir, quantized=quantized).encode(CHECK_SENTENCES, normalize_embeddings=True)
+    report = {**cosine_report(np.asarray(ref), cand), "threshold": min_cosine}
+    if report["min_cosine"] < min_cosine:
+        kind = "int8" if quantized else "fp32"
+        raise ValueError(f"ONNX {kind} embedder outside tolerance: {report}")
+    return report
@@ -1,19 +1,42 @@
+import asyncio
+import hashlib
+import threading
 from typing import Optional, Dict, List
-from langchain_google_genai import ChatGoogleGenerativeAI
 
+from src.clause_extraction import lookup_clause_answer_async
+from src.answer_cache import answer_cache_key, get_answer_cache, get_semantic_cache
 from src.config import settings
-from src.retrieval import pinecone_query
+from src.context import build_context
+from src.diversify import expand_neighbors, fetch_k, mmr_select, retrieval_options
+from src.rerank import rerank_async
+from src.hybrid import retrieve_async
+from src.retrieval import embed_query_async
 from src.documents import fetch_chunks_by_ids
+from src.db import run_read
 
 
-llm = ChatGoogleGenerativeAI(
-    model=settings.gemini_model,
-    temperature=0.0,
-    google_api_key=settings.gemini_api_key,
-)
+# Built on first use: importing langchain_google_genai is a large share of app import time.
+_LLM = None
+_LLM_LOCK = threading.Lock()
+
+
+def get_llm():
+    global _LLM
+    if _LLM is None:
+        with _LLM_LOCK:
+            if _LLM is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                _LLM = ChatGoogleGenerativeAI(
+                    model=settings.gemini_model,
+                    temperature=0.0,
+                    google_api_key=settings.gemini_api_key,
+                )
+    return _LLM
 
 import json
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
 
 def build_prompt_json(question: str, chunks: list[dict]) -> str:
     ctx = "\n---\n".join([f"[chunk_id={c['chunk_id']}]\n{c['text']}" for c in chunks])
@@ -178,17 +201,9 @@ def _get(m, key, default=None):
     return default
 
 
-def rag_answer(question: str, *, doc_id: Optional[str] = None, top_k: int = 8, debug: bool = False) -> Dict[str, Any]:
-    # 1) Retrieve
-    res = pinecone_query(question, top_k=top_k, doc_id=doc_id)
-    matches = res.get("matches", [])# if isinstance(res, dict) else []
-    print("MATCHES:", matches)
-    retrieved_ids = [m["id"] for m in matches]
-
-    # 2) Fetch chunk text (your ordered fetch_chunks_by_ids is perfect)
-    chunks = fetch_chunks_by_ids(retrieved_ids)
-
+def build_sources(matches: list, chunks: List[Dict], limit: int = 8) -> List[Dict]:
     chunk_map = {c["chunk_id"]: c for c in chunks}
+    retrieved_ids = [_get(m, "id") for m in matches]
     ordered_chunks = [chunk_map[cid] for cid in retrieved_ids if cid in chunk_map]
 
     # attach scores from pinecone matches (if present)
@@ -199,7 +214,7 @@ def rag_answer(question: str, *, doc_id: Optional[str] = None, top_k: int = 8, d
             score_by_id[cid] = _get(m, "score")
 
     sources = []
-    for c in ordered_chunks[: min(len(ordered_chunks), 8)]:  # show top 8 sources in UI
+    for c in ordered_chunks[: min(len(ordered_chunks), limit)]:  # show top 8 sources in UI
         sources.append({
             "chunk_id": c["chunk_id"],
             "doc_id": c["doc_id"],
@@ -207,20 +222,328 @@ def rag_answer(question: str, *, doc_id: Optional[str] = None, top_k: int = 8, d
             "text": c["text"],
             "score": score_by_id.get(c["chunk_id"]),
         })
-    # 3) Generate
-    prompt = build_prompt_2(question, chunks)
-    ai_msg = llm.invoke(prompt)
-    answer_text = ai_msg.content if hasattr(ai_msg, "content") else str(ai_msg)
-
-    return {
-        "answer": answer_text,
-        "citations": [],  # keep empty for now (UI will show "No citations")
-        "sources": sources,
-        "retrieved_chunk_ids": retrieved_ids,
-        "doc_id_filter": doc_id,
-        "debug": {"matches": matches} if debug else None,
+    return sources
+
+
+def _answer_text(ai_msg) -> str:
+    return ai_msg.content if hasattr(ai_msg, "content") else str(ai_msg)
+
+
+def prompt_fingerprint() -> str:
+    """
+    Identifies the prompt template + model, so editing either invalidates cached answers.
+    """
+    rendered = build_prompt_2("\x00question", [{"chunk_id": "\x00id", "text": "\x00text"}])
+    context = (
+        f"{settings.context_builder}|{settings.context_token_budget}|"
+        f"{settings.context_dedupe_threshold}|{settings.context_chars_per_token}|"
+        f"rerank={settings.rerank and settings.rerank_model}:{settings.rerank_candidates}:{settings.rerank_top_n}"
+    )
+    return hashlib.sha256(f"{settings.gemini_model}|{context}|{rendered}".encode("utf-8")).hexdigest()[:16]
+
+
+def _build_prompt(question: str, matches: list, chunks: List[Dict]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Prompt over the packed context (merged, de-duplicated spans within the
+    token budget) plus the context report for the response.
+    """
+    prompt_chunks, report = build_context(chunks, matches)
+    return build_prompt_2(question, prompt_chunks), report
+
+
+def _candidate_k(top_k: int) -> int:
+    # With reranking on, retrieval over-fetches and the cross-encoder picks the prompt chunks.
+    return max(top_k, settings.rerank_candidates) if settings.rerank else top_k
+
+
+def _rerank_top_n(top_k: int) -> int:
+    return min(top_k, settings.rerank_top_n)
+
+
+def _cache_key(question: str, doc_id: Optional[str], top_k: int, options: Dict[str, Any]) -> str:
+    fingerprint = f"{prompt_fingerprint()}|{json.dumps(options, sort_keys=True)}"
+    return answer_cache_key(question, doc_id=doc_id, top_k=top_k, prompt_fingerprint=fingerprint)
+
+
+def _semantic_scope(doc_id: Optional[str], top_k: int, options: Dict[str, Any]) -> tuple:
+    return (doc_id, int(top_k), prompt_fingerprint(), tuple(sorted(options.items())))
+
+
+async def _collect(events: AsyncIterator[Tuple[str, Any]]) -> Dict[str, Any]:
+    async for event, data in events:
+        if event == "prepared":
+            return data
+    raise RuntimeError("pipeline ended without a prompt")
+
+
+async def _retrieve(
+    question: str,
+    *,
+    doc_id: Optional[str],
+    top_k: int,
+    options: Dict[str, Any],
+    vector: Optional[List[float]] = None,
+) -> Tuple[list, Optional[Dict[str, Any]]]:
+    """
+    Candidates for the later stages: over-fetched for rerank / MMR, then MMR
+    when on. Returns (matches, mmr report or None).
+    """
+    k = _candidate_k(top_k)
+    res = await retrieve_async(
+        question, top_k=fetch_k(k, options), doc_id=doc_id, vector=vector, include_values=options["mmr"]
+    )
+    matches = res.get("matches", [])
+    if not options["mmr"]:
+        return matches, None
+    return mmr_select(matches, k=k, lambda_=options["mmr_lambda"])
+
+
+async def _prepare_events(
+    question: str,
+    matches: list,
+    chunks: List[Dict],
+    *,
+    doc_id: Optional[str],
+    top_k: int,
+    options: Dict[str, Any],
+    diversified: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Everything after hydration: rerank -> sources -> neighbours -> packed
+    prompt. Yields ("stage", name) and ("sources", {...}) as they happen, then
+    ("prepared", {"prompt", "matches", "result"}) where result is the response
+    without its answer. /ask/batch calls this directly after its shared
+    retrieval and hydration.
+    """
+    retrieved_ids = [m["id"] for m in matches]
+    reranked = None
+    if settings.rerank:
+        matches, chunks, reranked = await rerank_async(
+            question, matches, chunks, top_n=_rerank_top_n(top_k), top_k=top_k
+        )
+        yield "stage", "rerank_done"
+    sources = build_sources(matches, chunks)
+    yield "sources", {"sources": sources, "retrieved_chunk_ids": retrieved_ids}
+    if options["neighbors"]:
+        matches, chunks = await run_read(expand_neighbors, matches, chunks, window=options["neighbors"])
+        yield "stage", "neighbors_done"
+
+    prompt, context = _build_prompt(question, matches, chunks)
+    yield "prepared", {
+        "prompt": prompt,
+        "matches": matches,
+        "result": {
+            "answer": None,
+            "citations": [],  # keep empty for now (UI will show "No citations")
+            "sources": sources,
+            "retrieved_chunk_ids": retrieved_ids,
+            "doc_id_filter": doc_id,
+            "cache": None,
+            "context": context,
+            "rerank": reranked,
+            "mmr": diversified,
+            "neighbors": options["neighbors"],
+            "debug": None,
+        },
+    }
+
+
+async def _pipeline_events(
+    question: str,
+    *,
+    doc_id: Optional[str],
+    top_k: int,
+    options: Dict[str, Any],
+    vector: Optional[List[float]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    The one RAG pipeline behind /ask, /ask/stream and rag_answer:
+    retrieve -> MMR -> hydrate, then _prepare_events.
+    """
+    matches, diversified = await _retrieve(question, doc_id=doc_id, top_k=top_k, options=options, vector=vector)
+    yield "stage", "retrieval_done"
+
+    chunks = await run_read(fetch_chunks_by_ids, [m["id"] for m in matches])
+    yield "stage", "hydration_done"
+    async for event in _prepare_events(
+        question, matches, chunks, doc_id=doc_id, top_k=top_k, options=options, diversified=diversified
+    ):
+        yield event
+
+
+async def _rag_answer_async(
+    question: str,
+    *,
+    doc_id: Optional[str] = None,
+    top_k: int = 8,
+    options: Optional[Dict[str, Any]] = None,
+    debug: bool = False,
+    vector: Optional[List[float]] = None,
+) -> Dict[str, Any]:
+    options = options or retrieval_options()
+    prepared = await _collect(
+        _pipeline_events(question, doc_id=doc_id, top_k=top_k, options=options, vector=vector)
+    )
+    ai_msg = await get_llm().ainvoke(prepared["prompt"])
+    result = prepared["result"]
+    result["answer"] = _answer_text(ai_msg)
+    result["debug"] = {"matches": prepared["matches"]} if debug else None
+    return result
+
+
+async def _rag_answer_semantic_async(
+    question: str, *, doc_id: Optional[str], top_k: int, options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Semantic-cache layer: the query vector is computed once and used for both
+    the lookup and (on a miss) retrieval.
+    """
+    if not settings.semantic_cache:
+        return await _rag_answer_async(question, doc_id=doc_id, top_k=top_k, options=options)
+    vec = await embed_query_async(question)
+    scope = _semantic_scope(doc_id, top_k, options)
+    hit = get_semantic_cache().lookup(vec, scope)
+    if hit is not None:
+        return hit
+    res = await _rag_answer_async(question, doc_id=doc_id, top_k=top_k, options=options, vector=vec)
+    get_semantic_cache().add(vec, scope, res)
+    return res
+
+
+def rag_answer(
+    question: str,
+    *,
+    doc_id: Optional[str] = None,
+    top_k: int = 8,
+    debug: bool = False,
+    mmr: Optional[bool] = None,
+    mmr_lambda: Optional[float] = None,
+    neighbors: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Blocking wrapper around rag_answer_async for scripts and the CLI; don't
+    call it from inside a running event loop.
+    """
+    return asyncio.run(
+        rag_answer_async(
+            question, doc_id=doc_id, top_k=top_k, debug=debug, mmr=mmr, mmr_lambda=mmr_lambda, neighbors=neighbors
+        )
+    )
+
+
+async def rag_answer_async(
+    question: str,
+    *,
+    doc_id: Optional[str] = None,
+    top_k: int = 8,
+    debug: bool = False,
+    mmr: Optional[bool] = None,
+    mmr_lambda: Optional[float] = None,
+    neighbors: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Never blocks the event loop: embedding and vector/SQLite calls run on
+    bounded pools and Gemini is awaited via ainvoke. mmr / mmr_lambda /
+    neighbors override the settings defaults for this request (see
+    src/diversify.py).
+    """
+    options = retrieval_options(mmr=mmr, mmr_lambda=mmr_lambda, neighbors=neighbors)
+    if debug:
+        return await _rag_answer_async(question, doc_id=doc_id, top_k=top_k, options=options, debug=True)
+    if settings.clause_answers and doc_id:
+        clause = await lookup_clause_answer_async(question, doc_id=doc_id, vector=await embed_query_async(question))
+        if clause is not None:
+            return clause
+    compute = lambda: _rag_answer_semantic_async(question, doc_id=doc_id, top_k=top_k, options=options)
+    if not settings.answer_cache:
+        return await compute()
+    return await get_answer_cache().get_or_compute_async(_cache_key(question, doc_id, top_k, options), compute)
+
+
+async def rag_answer_stream(
+    question: str,
+    *,
+    doc_id: Optional[str] = None,
+    top_k: int = 8,
+    mmr: Optional[bool] = None,
+    mmr_lambda: Optional[float] = None,
+    neighbors: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of rag_answer_async. Yields (event, data) pairs:
+      timing  {"stage": ..., "ms": ...}   ms since the request started
+      sources {"sources": [...], "retrieved_chunk_ids": [...]}   as soon as hydration finishes
+      token   {"text": ...}               answer deltas from get_llm().astream
+      done    {"answer": ..., "timings": {...}}
+    """
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    options = retrieval_options(mmr=mmr, mmr_lambda=mmr_lambda, neighbors=neighbors)
+
+    def mark(stage: str) -> Tuple[str, Dict[str, Any]]:
+        timings[stage] = round((time.perf_counter() - t0) * 1000, 1)
+        return "timing", {"stage": stage, "ms": timings[stage]}
+
+    if settings.clause_answers and doc_id:
+        clause = await lookup_clause_answer_async(question, doc_id=doc_id, vector=await embed_query_async(question))
+        if clause is not None:
+            yield mark("clause_hit")
+            yield "sources", {"sources": clause["sources"], "retrieved_chunk_ids": clause["retrieved_chunk_ids"]}
+            yield "done", {
+                "answer": clause["answer"], "doc_id_filter": doc_id, "timings": timings, "cache": None, "clause": clause["clause"]
+            }
+            return
+
+    cache = get_answer_cache() if settings.answer_cache else None
+    key = _cache_key(question, doc_id, top_k, options) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        yield mark("cache_hit")
+        yield "sources", {"sources": cached["sources"], "retrieved_chunk_ids": cached["retrieved_chunk_ids"]}
+        yield "done", {"answer": cached["answer"], "doc_id_filter": doc_id, "timings": timings, "cache": "exact"}
+        return
+
+    vec = None
+    if settings.semantic_cache:
+        vec = await embed_query_async(question)
+        scope = _semantic_scope(doc_id, top_k, options)
+        hit = get_semantic_cache().lookup(vec, scope)
+        if hit is not None:
+            yield mark("cache_hit")
+            yield "sources", {"sources": hit["sources"], "retrieved_chunk_ids": hit["retrieved_chunk_ids"]}
+            yield "done", {"answer": hit["answer"], "doc_id_filter": doc_id, "timings": timings, "cache": "semantic"}
+            return
+
+    prepared = None
+    async for event, data in _pipeline_events(question, doc_id=doc_id, top_k=top_k, options=options, vector=vec):
+        if event == "stage":
+            yield mark(data)
+        elif event == "sources":
+            yield "sources", data
+        else:
+            prepared = data
+
+    parts: List[str] = []
+    async for msg in get_llm().astream(prepared["prompt"]):
+        delta = _answer_text(msg)
+        if not delta:
+            continue
+        if not parts:
+            yield mark("first_token")
+        parts.append(delta)
+        yield "token", {"text": delta}
+
+    yield mark("generation_done")
+    result = prepared["result"]
+    result["answer"] = "".join(parts)
+    if cache is not None:
+        cache.put(key, result)
+    if vec is not None:
+        get_semantic_cache().add(vec, scope, result)
+    yield "done", {
+        "answer": result["answer"], "doc_id_filter": doc_id, "timings": timings, "cache": None, "context": result["context"]
     }
 
 
 if __name__=="__main__":
-    rag_answer("what is the date")
\ No newline at end of file
+    print(rag_answer("what is the date"))
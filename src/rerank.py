@@ -0,0 +1,161 @@
+"""
+Optional cross-encoder reranking between retrieval and generation.
+
+With settings.rerank on, the pipelines over-fetch settings.rerank_candidates
+chunks, score every (question, chunk) pair with a small CPU cross-encoder and
+keep the best settings.rerank_top_n for the prompt.
+
+- Scores are cached per (query hash, chunk_id), so repeated or overlapping
+  questions only score new chunks.
+- Uncached pairs are scored in batches, best retrieval rank first, within
+  settings.rerank_budget_ms. If the budget runs out before every candidate is
+  scored, the stage falls back to the retrieval order (the scores computed so
+  far are still cached), so a slow CPU never makes an answer slower than that.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.cache import LRUTTLCache, normalize_text
+from src.config import settings
+
+_RERANKER = None
+_RERANKER_LOCK = threading.Lock()
+
+_RERANK_EXECUTOR = None
+_RERANK_EXECUTOR_LOCK = threading.Lock()
+
+_SCORE_CACHE = LRUTTLCache(settings.rerank_cache_size)
+
+_STATS_LOCK = threading.Lock()
+_STATS = {"requests": 0, "pairs_scored": 0, "pairs_cached": 0, "timed_out": 0}
+
+
+def get_reranker():
+    global _RERANKER
+    if _RERANKER is None:
+        with _RERANKER_LOCK:
+            if _RERANKER is None:
+                from sentence_transformers import CrossEncoder
+
+                _RERANKER = CrossEncoder(settings.rerank_model, device="cpu", max_length=settings.rerank_max_length)
+    return _RERANKER
+
+
+def get_rerank_executor() -> ThreadPoolExecutor:
+    global _RERANK_EXECUTOR
+    if _RERANK_EXECUTOR is None:
+        with _RERANK_EXECUTOR_LOCK:
+            if _RERANK_EXECUTOR is None:
+                _RERANK_EXECUTOR = ThreadPoolExecutor(settings.rerank_workers, thread_name_prefix="rerank")
+    return _RERANK_EXECUTOR
+
+
+def warm_up_reranker() -> None:
+    get_reranker().predict([("warm-up", "warm-up")], batch_size=1)
+
+
+def query_hash(question: str) -> str:
+    return hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()[:16]
+
+
+def _match_id(m):
+    return m["id"] if isinstance(m, dict) else getattr(m, "id", None)
+
+
+def rerank(
+    question: str,
+    matches: List[Any],
+    chunks: List[Dict],
+    *,
+    top_n: Optional[int] = None,
+    top_k: Optional[int] = None,
+    budget_ms: Optional[float] = None,
+) -> Tuple[List[Any], List[Dict], Dict[str, Any]]:
+    """
+    Returns (matches, chunks, report) cut to `top_n`, both in the new order,
+    each kept match a dict with its "rerank_score".
+    `chunks` is the hydrated list in retrieval order (fetch_chunks_by_ids).
+    If the budget runs out, the first `top_k` chunks (the caller's request
+    size, default top_n) are returned in retrieval order, as without rerank,
+    and the matches carry no rerank_score.
+    """
+    t0 = time.perf_counter()
+    top_n = top_n or settings.rerank_top_n
+    budget_s = (budget_ms if budget_ms is not None else settings.rerank_budget_ms) / 1000
+    qh = query_hash(question)
+
+    scores: Dict[str, float] = {}
+    todo: List[Dict] = []
+    for c in chunks:
+        s = _SCORE_CACHE.get((qh, c["chunk_id"]))
+        if s is None:
+            todo.append(c)
+        else:
+            scores[c["chunk_id"]] = s
+    n_cached = len(scores)
+
+    timed_out = False
+    batch_size = settings.rerank_batch_size
+    last_batch_s = 0.0
+    for i in range(0, len(todo), batch_size):
+        elapsed = time.perf_counter() - t0
+        if elapsed + last_batch_s > budget_s:
+            timed_out = True
+            break
+        batch = todo[i:i + batch_size]
+        tb = time.perf_counter()
+        out = get_reranker().predict([(question, c["text"]) for c in batch], batch_size=batch_size)
+        last_batch_s = time.perf_counter() - tb
+        for c, s in zip(batch, out):
+            scores[c["chunk_id"]] = float(s)
+            _SCORE_CACHE.put((qh, c["chunk_id"]), float(s))
+
+    if timed_out:
+        kept = chunks[:top_k or top_n]
+    else:
+        kept = sorted(chunks, key=lambda c: -scores[c["chunk_id"]])[:top_n]
+
+    by_id = {_match_id(m): m for m in matches}
+    kept_matches = []
+    for c in kept:
+        m = by_id.get(c["chunk_id"])
+        if m is None:
+            continue
+        if not timed_out:
+            # Context packing ranks by rerank_score when the matches carry one.
+            if not isinstance(m, dict):
+                m = {"id": m.id, "score": m.score, "metadata": dict(m.metadata or {})}
+            m = {**m, "rerank_score": scores[c["chunk_id"]]}
+        kept_matches.append(m)
+
+    report = {
+        "candidates": len(chunks),
+        "kept": len(kept),
+        "scored": len(scores) - n_cached,
+        "cached": n_cached,
+        "timed_out": timed_out,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+    with _STATS_LOCK:
+        _STATS["requests"] += 1
+        _STATS["pairs_scored"] += report["scored"]
+        _STATS["pairs_cached"] += n_cached
+        _STATS["timed_out"] += int(timed_out)
+    return kept_matches, kept, report
+
+
+async def rerank_async(question: str, matches: List[Any], chunks: List[Dict], **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_rerank_executor(), lambda: rerank(question, matches, chunks, **kwargs))
+
+
+def rerank_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        s = dict(_STATS)
+    s["enabled"] = settings.rerank
+    s["score_cache"] = _SCORE_CACHE.stats()
+    return s
@@ -1,8 +1,13 @@
+import asyncio
 import os
+import queue
 import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Dict, Optional
 
-from pinecone import Pinecone
+from src.cache import LRUTTLCache, SQLiteCacheTier, normalize_text
 from src.config import settings
 
 if settings.force_cpu:
@@ -14,18 +19,50 @@ LOCAL_MODEL_DIR = "/app/models/all-MiniLM-L6-v2"
 _EMBEDDER = None
 _EMBEDDER_LOCK = threading.Lock()
 
+# One Pinecone client + index handle per process: the index owns the urllib3
+# connection pool, so reusing it keeps TLS sessions alive between requests.
+_PINECONE_INDEX = None
+_PINECONE_LOCK = threading.Lock()
 
-def load_local_embedder():
+# Query text -> embedding. Keys are normalize_text(q); the disk tier (optional)
+# lets the cache survive restarts when EMBED_CACHE_PATH is on a persistent volume.
+_QUERY_CACHE = LRUTTLCache(settings.embed_cache_size, ttl_s=settings.embed_cache_ttl_s)
+_QUERY_CACHE_DISK = None
+_QUERY_CACHE_DISK_LOCK = threading.Lock()
+
+_EMBED_BATCHER = None
+_EMBED_BATCHER_LOCK = threading.Lock()
+
+# Bounded executors for the async path: CPU-bound encodes (when batching is off)
+# and blocking vector-index calls. Sized from Settings, created on first use.
+_EMBED_EXECUTOR = None
+_VECTOR_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def load_local_embedder(backend: Optional[str] = None):
     """
     Load the sentence-transformers embedder without any network calls.
 
     We prefer the baked local directory (LOCAL_MODEL_DIR). If it's not present,
     we fall back to settings.local_embedding_model (which might be a HF repo id),
     but in Cloud Run you *want* the baked dir to exist so this never hits HF.
-    """
-    from sentence_transformers import SentenceTransformer
 
+    settings.embedder_backend="onnx" / "onnx-int8" loads the graphs that
+    bake_embedder.py exported next to the model instead (no torch import).
+    `backend` overrides the setting (stored vectors are always built with "torch").
+    """
     model_path = LOCAL_MODEL_DIR if os.path.isdir(LOCAL_MODEL_DIR) else settings.local_embedding_model
+    backend = backend or settings.embedder_backend
+
+    if backend in ("onnx", "onnx-int8"):
+        from src.onnx_embedder import OnnxEmbedder
+
+        return OnnxEmbedder(model_path, quantized=backend == "onnx-int8", threads=settings.onnx_threads)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedder_backend: {backend!r}")
+
+    from sentence_transformers import SentenceTransformer
 
     # Try to force local-only loading when possible.
     # (Different versions of sentence-transformers may accept different kwargs.)
@@ -37,32 +74,386 @@ def load_local_embedder():
         return SentenceTransformer(model_path, device="cpu", local_files_only=True)
 
 
-def embed_query(q: str) -> List[float]:
+def get_embedder():
     global _EMBEDDER
     if _EMBEDDER is None:
         with _EMBEDDER_LOCK:
             if _EMBEDDER is None:
                 _EMBEDDER = load_local_embedder()
+    return _EMBEDDER
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embed requests into one encode() call.
+
+    submit() returns a Future. A single background worker takes the first
+    queued request, then keeps collecting for up to `max_wait_ms` or until it
+    has `max_batch_size` items, encodes them as one batch and resolves the
+    futures. Identical texts inside a batch are encoded once.
+    """
+
+    def __init__(self, encode_fn, *, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be > 0")
+        self._encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.batches = 0
+        self.encoded = 0
+        self.max_queue_depth = 0
+        self.last_batch_size = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        with self._lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return fut
+
+    def _collect(self) -> list:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    items.append(self._queue.get_nowait())
+                else:
+                    items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = [(t, f) for t, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not items:
+                continue
 
-    v = _EMBEDDER.encode([q], normalize_embeddings=True)[0]
-    return [float(x) for x in v]
+            # Everything is inside the try: this is the only worker thread, and a
+            # future left unresolved would block its caller.
+            try:
+                texts = list(dict.fromkeys(t for t, _ in items))
+                vecs = list(self._encode_fn(texts))
+                if len(vecs) != len(texts):
+                    raise RuntimeError(f"encoder returned {len(vecs)} vectors for {len(texts)} texts")
+                by_text = dict(zip(texts, vecs))
+                for t, f in items:
+                    f.set_result(by_text[t])
 
+                self.batches += 1
+                self.encoded += len(texts)
+                self.last_batch_size = len(items)
+            except Exception as e:
+                for _, f in items:
+                    if not f.done():
+                        f.set_exception(e)
 
-def pinecone_query(query: str, *, top_k: int = 8, doc_id: Optional[str] = None) -> Dict:
-    pc = Pinecone(api_key=settings.pinecone_api_key)
-    index = pc.Index(settings.pinecone_index_name)
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "avg_batch_size": (self.submitted - self._queue.qsize()) / self.batches if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+        }
 
-    vec = embed_query(query)
 
+def _encode_batch(texts: List[str]) -> List[List[float]]:
+    vecs = get_embedder().encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    return [[float(x) for x in v] for v in vecs]
+
+
+def get_embed_batcher() -> EmbeddingBatcher:
+    global _EMBED_BATCHER
+    if _EMBED_BATCHER is None:
+        with _EMBED_BATCHER_LOCK:
+            if _EMBED_BATCHER is None:
+                _EMBED_BATCHER = EmbeddingBatcher(
+                    _encode_batch,
+                    max_batch_size=settings.embed_batch_max_size,
+                    max_wait_ms=settings.embed_batch_max_wait_ms,
+                )
+    return _EMBED_BATCHER
+
+
+def _query_cache_disk() -> Optional[SQLiteCacheTier]:
+    global _QUERY_CACHE_DISK
+    if not settings.embed_cache_path:
+        return None
+    if _QUERY_CACHE_DISK is None:
+        with _QUERY_CACHE_DISK_LOCK:
+            if _QUERY_CACHE_DISK is None:
+                _QUERY_CACHE_DISK = SQLiteCacheTier(
+                    settings.embed_cache_path, "query_embeddings", ttl_s=settings.embed_cache_ttl_s
+                )
+    return _QUERY_CACHE_DISK
+
+
+def _disk_key(key: str) -> str:
+    # Vectors from a different model must never be served, so the model is part of the key
+    # (and the backend: ONNX/int8 vectors are close to, not identical with, the torch ones).
+    model = settings.local_embedding_model
+    if settings.embedder_backend != "torch":
+        model = f"{model}#{settings.embedder_backend}"
+    return f"{model}::{key}"
+
+
+def _cache_vector(key: str, v: List[float]) -> None:
+    _QUERY_CACHE.put(key, v)
+    disk = _query_cache_disk()
+    if disk is not None:
+        disk.put(_disk_key(key), array("f", v).tobytes())
+
+
+def _cached_vector(key: str) -> Optional[List[float]]:
+    v = _QUERY_CACHE.get(key)
+    if v is not None:
+        return v
+    disk = _query_cache_disk()
+    if disk is not None:
+        blob = disk.get(_disk_key(key))
+        if blob is not None:
+            v = array("f", blob).tolist()
+            _QUERY_CACHE.put(key, v)
+            return v
+    return None
+
+
+def embed_query(q: str) -> List[float]:
+    key = normalize_text(q)
+    v = _cached_vector(key)
+    if v is not None:
+        return v
+
+    if settings.embed_batching:
+        v = get_embed_batcher().submit(key).result(timeout=settings.embed_batch_timeout_s)
+    else:
+        v = _encode_batch([key])[0]
+    _cache_vector(key, v)
+    return v
+
+
+def _get_executor(name: str) -> ThreadPoolExecutor:
+    global _EMBED_EXECUTOR, _VECTOR_EXECUTOR
+    with _EXECUTOR_LOCK:
+        if name == "embed":
+            if _EMBED_EXECUTOR is None:
+                _EMBED_EXECUTOR = ThreadPoolExecutor(settings.embed_executor_workers, thread_name_prefix="embed")
+            return _EMBED_EXECUTOR
+        if _VECTOR_EXECUTOR is None:
+            _VECTOR_EXECUTOR = ThreadPoolExecutor(settings.vector_query_workers, thread_name_prefix="vector-query")
+        return _VECTOR_EXECUTOR
+
+
+async def embed_query_async(q: str) -> List[float]:
+    key = normalize_text(q)
+    v = _cached_vector(key)
+    if v is not None:
+        return v
+
+    if settings.embed_batching:
+        v = await asyncio.wait_for(
+            asyncio.wrap_future(get_embed_batcher().submit(key)), timeout=settings.embed_batch_timeout_s
+        )
+    else:
+        loop = asyncio.get_running_loop()
+        v = (await loop.run_in_executor(_get_executor("embed"), _encode_batch, [key]))[0]
+    _cache_vector(key, v)
+    return v
+
+
+def embed_queries(qs: List[str]) -> List[List[float]]:
+    """
+    Many queries at once (e.g. /ask/batch): cached vectors are reused and
+    everything else is embedded in a single encode() call.
+    """
+    keys = [normalize_text(q) for q in qs]
+    vecs = {k: _cached_vector(k) for k in dict.fromkeys(keys)}
+    todo = [k for k, v in vecs.items() if v is None]
+    if todo:
+        for k, v in zip(todo, _encode_batch(todo)):
+            _cache_vector(k, v)
+            vecs[k] = v
+    return [vecs[k] for k in keys]
+
+
+async def embed_queries_async(qs: List[str]) -> List[List[float]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor("embed"), embed_queries, qs)
+
+
+def prewarm_query_cache() -> int:
+    """
+    Embed the CUAD category questions (annotations.label) in one batch so the
+    most common queries never hit the model. Returns how many were added.
+    """
+    from sqlalchemy import text
+    from src.db import get_read_conn
+
+    with get_read_conn() as conn:
+        labels = [r[0] for r in conn.execute(text("SELECT DISTINCT label FROM annotations")).fetchall()]
+
+    keys = [k for k in dict.fromkeys(normalize_text(l) for l in labels) if k and _cached_vector(k) is None]
+    if not keys:
+        return 0
+
+    vecs = get_embedder().encode(keys, batch_size=settings.embed_batch_size, normalize_embeddings=True)
+    for k, v in zip(keys, vecs):
+        _cache_vector(k, [float(x) for x in v])
+    return len(keys)
+
+
+def query_cache_stats() -> Dict:
+    stats = _QUERY_CACHE.stats()
+    disk = _query_cache_disk()
+    stats["disk_entries"] = len(disk) if disk is not None else None
+    return stats
+
+
+def embed_batcher_stats() -> Optional[Dict]:
+    return _EMBED_BATCHER.stats() if _EMBED_BATCHER is not None else None
+
+
+def build_pinecone_index(*, host: Optional[str] = None):
+    """
+    Create a Pinecone index handle with a sized connection pool.
+    Passing `host` skips the describe_index lookup Pinecone otherwise does on first use.
+    """
+    from pinecone import Pinecone  # imported lazily: not needed with VECTOR_BACKEND=local
+
+    pc = Pinecone(api_key=settings.pinecone_api_key, pool_threads=settings.pinecone_pool_threads)
+    kwargs = {
+        "pool_threads": settings.pinecone_pool_threads,
+        "connection_pool_maxsize": settings.pinecone_pool_maxsize,
+    }
+    host = host or settings.pinecone_index_host
+    if host:
+        return pc.Index(host=host, **kwargs)
+    return pc.Index(settings.pinecone_index_name, **kwargs)
+
+
+def get_pinecone_index():
+    global _PINECONE_INDEX
+    if _PINECONE_INDEX is None:
+        with _PINECONE_LOCK:
+            if _PINECONE_INDEX is None:
+                _PINECONE_INDEX = build_pinecone_index()
+    return _PINECONE_INDEX
+
+
+def pinecone_index_query(
+    index, vec: List[float], *, top_k: int = 8, doc_id: Optional[str] = None, include_values: bool = False
+) -> Dict:
     flt = None
     if doc_id is not None:
         flt = {"doc_id": {"$eq": doc_id}}
 
-    res = index.query(
+    return index.query(
         namespace=settings.pinecone_namespace,
         vector=vec,
         top_k=top_k,
         include_metadata=True,
+        include_values=include_values,
         filter=flt,
     )
-    return res
+
+
+def vector_query_by_vector(
+    vec: List[float], *, top_k: int = 8, doc_id: Optional[str] = None, include_values: bool = False
+) -> Dict:
+    """
+    Query the configured backend with an already-computed query vector.
+    include_values=True also returns each match's stored vector (for MMR).
+    """
+    backend = settings.vector_backend
+    if backend == "local":
+        from src.local_index import get_local_index
+
+        return get_local_index().query(vec, top_k=top_k, doc_id=doc_id, include_values=include_values)
+    if backend == "pinecone":
+        if doc_id and settings.doc_fast_path:
+            from src.doc_index import doc_query
+
+            res = doc_query(vec, doc_id=doc_id, top_k=top_k, include_values=include_values)
+            if res is not None:
+                return res
+        return pinecone_index_query(
+            get_pinecone_index(), vec, top_k=top_k, doc_id=doc_id, include_values=include_values
+        )
+    raise ValueError(f"Unknown vector_backend: {backend!r} (expected 'pinecone' or 'local')")
+
+
+def vector_query(
+    query: str,
+    *,
+    top_k: int = 8,
+    doc_id: Optional[str] = None,
+    vector: Optional[List[float]] = None,
+    include_values: bool = False,
+) -> Dict:
+    """
+    Dispatch to the configured vector backend. Both return {"matches": [{"id", "score", "metadata"}, ...]}.
+    Pass `vector` when the caller already embedded `query`.
+    """
+    vec = vector if vector is not None else embed_query(query)
+    return vector_query_by_vector(vec, top_k=top_k, doc_id=doc_id, include_values=include_values)
+
+
+async def vector_query_async(
+    query: str,
+    *,
+    top_k: int = 8,
+    doc_id: Optional[str] = None,
+    vector: Optional[List[float]] = None,
+    include_values: bool = False,
+) -> Dict:
+    vec = vector if vector is not None else await embed_query_async(query)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor("vector"),
+        lambda: vector_query_by_vector(vec, top_k=top_k, doc_id=doc_id, include_values=include_values),
+    )
+
+
+def warm_up_vector_backend() -> None:
+    """
+    Called from the FastAPI startup event so the first /ask doesn't pay for
+    client construction, host lookup and the TLS handshake (or index mmap).
+    """
+    if settings.vector_backend == "local":
+        from src.local_index import get_local_index
+
+        get_local_index()
+        return
+
+    index = get_pinecone_index()
+    # Opens (and keeps alive) the first pooled connection.
+    index.describe_index_stats()
+
+
+def warm_up_embedder() -> None:
+    """
+    Load the model and run one dummy encode, so the first request pays for
+    neither the load nor the first-call setup (thread pools, allocations).
+    """
+    get_embedder().encode(["warm-up"], batch_size=1, normalize_embeddings=True)
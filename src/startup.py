@@ -0,0 +1,129 @@
+"""
+Startup cost breakdown.
+
+- StartupProfiler / STARTUP: wall-clock timings of the init steps the app runs
+  (DB fetch, embedder load, vector warm-up, ...), served at /debug/startup.
+- import_time_report(): runs `python -X importtime -c "import src.main"` in a
+  subprocess and aggregates the cost per top-level package.
+
+    python -m src.startup                 # import cost of src.main
+    python -m src.startup --module src.rag --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class StartupProfiler:
+    """
+    Records named steps relative to when this module was first imported
+    (i.e. roughly when `src.main` started importing).
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.steps: List[Dict] = []
+
+    def mark(self, name: str, start: float, end: float, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.steps.append(
+                {
+                    "step": name,
+                    "start_ms": round((start - self.t0) * 1000, 1),
+                    "ms": round((end - start) * 1000, 1),
+                    "thread": threading.current_thread().name,
+                    "error": error,
+                }
+            )
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.mark(name, start, time.perf_counter(), error=repr(e))
+            raise
+        self.mark(name, start, time.perf_counter())
+
+    def report(self) -> Dict:
+        with self._lock:
+            steps = sorted(self.steps, key=lambda s: s["start_ms"])
+        end_ms = max((s["start_ms"] + s["ms"] for s in steps), default=0.0)
+        return {"total_ms": round(end_ms, 1), "steps": steps}
+
+
+STARTUP = StartupProfiler()
+
+
+def _parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Lines look like: "import time:       312 |       1045 |   langchain_core.messages"
+    (indentation of the name = nesting depth). Returns one row per import.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]  # the single space after the separator
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append({"module": name.strip(), "self_us": int(self_us), "cum_us": int(cum_us), "depth": depth})
+    return rows
+
+
+def import_time_report(module: str = "src.main", *, top: int = 25) -> Dict:
+    """
+    Import `module` in a fresh interpreter with -X importtime and aggregate
+    self time per top-level package (all of langchain_core.* is one line,
+    regardless of which module imported it first).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    rows = _parse_importtime(proc.stderr)
+
+    by_pkg: Dict[str, int] = {}
+    for r in rows:
+        pkg = r["module"].split(".")[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0) + r["self_us"]
+
+    packages = sorted(by_pkg.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "interpreter_wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(r["self_us"] for r in rows) / 1000, 1),
+        "packages": [{"package": p, "ms": round(us / 1000, 1)} for p, us in packages],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-package import cost of the app module.")
+    ap.add_argument("--module", default="src.main")
+    ap.add_argument("--top", type=int, default=25)
+    args = ap.parse_args()
+
+    rep = import_time_report(args.module, top=args.top)
+    if not rep["ok"]:
+        print(f"import {args.module} failed: {rep['error']}")
+    print(f"import {rep['module']}: {rep['import_ms']:.1f}ms (interpreter wall {rep['interpreter_wall_ms']:.1f}ms)")
+    for p in rep["packages"]:
+        print(f"  {p['ms']:9.1f}ms  {p['package']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Delta sync between the chunks table and the vector index.
+
+Only chunks that are new, whose text changed (content_hash), or that were
+embedded with a different model are re-embedded and upserted. Vectors whose
+chunk no longer exists (e.g. after changing chunk_size) are deleted.
+The embedding_manifest table records what the index holds, so a sync costs
+O(changed) instead of O(corpus) and an interrupted sync just picks up the rest.
+
+    python -m src.sync_vectors            # apply
+    python -m src.sync_vectors --dry-run  # only report the plan
+"""
+import argparse
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.db import get_conn, init_schema
+from src.documents import resolve_chunk_texts
+from src.upsert_chunks_to_pinecone import (
+    ensure_manifest_table,
+    load_local_embedder,
+    model_fingerprint,
+    run_pipeline,
+)
+
+DELETE_BATCH = 1000
+
+
+def fetch_changed_batch_factory(index_name: str, namespace: str, fingerprint: str):
+    sql = """
+    SELECT c.rowid, c.chunk_id, c.doc_id, c.chunk_index, c.start_char, c.end_char, c.text, c.content_hash
+    FROM chunks c
+    LEFT JOIN embedding_manifest m
+      ON m.chunk_id = c.chunk_id AND m.index_name = :i AND m.namespace = :ns
+    WHERE c.rowid > :after
+      AND (m.chunk_id IS NULL
+           OR m.content_hash IS NOT c.content_hash
+           OR m.model_fingerprint != :fp)
+    ORDER BY c.rowid
+    LIMIT :limit
+    """
+
+    def fetch_changed_batch(after_rowid: int, limit: int) -> List[Dict]:
+        with get_conn() as conn:
+            rows = conn.execute(
+                text(sql),
+                {"i": index_name, "ns": namespace, "fp": fingerprint, "after": after_rowid, "limit": limit},
+            ).fetchall()
+        return resolve_chunk_texts([dict(r._mapping) for r in rows])
+
+    return fetch_changed_batch
+
+
+def sync_plan(index_name: str, namespace: str, fingerprint: str) -> Dict[str, int]:
+    with get_conn() as conn:
+        params = {"i": index_name, "ns": namespace, "fp": fingerprint}
+        new = conn.execute(text("""
+            SELECT COUNT(*) FROM chunks c
+            LEFT JOIN embedding_manifest m
+              ON m.chunk_id = c.chunk_id AND m.index_name = :i AND m.namespace = :ns
+            WHERE m.chunk_id IS NULL
+        """), params).scalar()
+        changed = conn.execute(text("""
+            SELECT COUNT(*) FROM chunks c
+            JOIN embedding_manifest m
+              ON m.chunk_id = c.chunk_id AND m.index_name = :i AND m.namespace = :ns
+            WHERE m.content_hash IS NOT c.content_hash OR m.model_fingerprint != :fp
+        """), params).scalar()
+        stale = conn.execute(text("""
+            SELECT COUNT(*) FROM embedding_manifest m
+            LEFT JOIN chunks c ON c.chunk_id = m.chunk_id
+            WHERE m.index_name = :i AND m.namespace = :ns AND c.chunk_id IS NULL
+        """), params).scalar()
+    return {"new": int(new), "changed": int(changed), "stale": int(stale)}
+
+
+def delete_stale_vectors(index, index_name: str, namespace: str) -> int:
+    deleted = 0
+    while True:
+        with get_conn() as conn:
+            ids = [
+                r[0]
+                for r in conn.execute(
+                    text("""
+                    SELECT m.chunk_id FROM embedding_manifest m
+                    LEFT JOIN chunks c ON c.chunk_id = m.chunk_id
+                    WHERE m.index_name = :i AND m.namespace = :ns AND c.chunk_id IS NULL
+                    LIMIT :limit
+                    """),
+                    {"i": index_name, "ns": namespace, "limit": DELETE_BATCH},
+                ).fetchall()
+            ]
+        if not ids:
+            return deleted
+
+        index.delete(ids=ids, namespace=namespace)
+        with get_conn() as conn:
+            conn.execute(
+                text("""
+                DELETE FROM embedding_manifest
+                WHERE index_name = :i AND namespace = :ns AND chunk_id = :chunk_id
+                """),
+                [{"i": index_name, "ns": namespace, "chunk_id": cid} for cid in ids],
+            )
+        deleted += len(ids)
+        print(f"deleted {deleted} stale vectors...")
+
+
+def sync(*, index=None, embedder=None, dry_run: bool = False) -> Dict[str, int]:
+    init_schema()
+    ensure_manifest_table()
+
+    if embedder is None:
+        embedder, dim = load_local_embedder()
+    else:
+        dim = embedder.get_sentence_embedding_dimension()
+    fingerprint = model_fingerprint(dim)
+    index_name = settings.pinecone_index_name
+    namespace = settings.pinecone_namespace
+
+    plan = sync_plan(index_name, namespace, fingerprint)
+    print(f"Sync plan for {index_name}/{namespace}: {plan}")
+    if dry_run:
+        return plan
+
+    if index is None:
+        from src.retrieval import get_pinecone_index
+        index = get_pinecone_index()
+
+    upserted = run_pipeline(
+        index,
+        embedder,
+        fingerprint=fingerprint,
+        namespace=namespace,
+        index_name=index_name,
+        fetch_batch=fetch_changed_batch_factory(index_name, namespace, fingerprint),
+        checkpoint=False,  # the manifest is the checkpoint
+    )
+    deleted = delete_stale_vectors(index, index_name, namespace)
+    return {**plan, "upserted": upserted, "deleted": deleted}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Embed/upsert only new or changed chunks and delete stale vectors.")
+    ap.add_argument("--dry-run", action="store_true", help="print what would change and exit")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    result = sync(dry_run=args.dry_run)
+    print(f"✅ Sync done: {result} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
+import argparse
+import hashlib
 import os
-from typing import List, Dict
+import queue
+import threading
+import time
+from typing import List, Dict, Optional
 from sqlalchemy import text
 from src.config import settings
 from src.db import get_conn
-
-from pinecone import Pinecone
+from src.documents import resolve_chunk_texts
 
 # Force CPU if needed (prevents accidental CUDA usage)
 if settings.force_cpu:
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
 
+_DONE = object()
+
 
 def doc_titles_map():
     with get_conn() as conn:
@@ -24,10 +30,18 @@ def load_local_embedder():
     return model, dim
 
 
+def model_fingerprint(dim: int) -> str:
+    """
+    Identifies the vector space. A checkpoint from a different model must not be resumed.
+    """
+    raw = f"{settings.local_embedding_model}::{dim}::normalized"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
 def fetch_chunk_batch(after_rowid: int, limit: int) -> List[Dict]:
     # We use sqlite rowid for paging: fast + simple.
     sql = """
-    SELECT rowid, chunk_id, doc_id, chunk_index, start_char, end_char, text
+    SELECT rowid, chunk_id, doc_id, chunk_index, start_char, end_char, text, content_hash
     FROM chunks
     WHERE rowid > :after
     ORDER BY rowid
@@ -35,57 +49,348 @@ def fetch_chunk_batch(after_rowid: int, limit: int) -> List[Dict]:
     """
     with get_conn() as conn:
         rows = conn.execute(text(sql), {"after": after_rowid, "limit": limit}).fetchall()
-    return [dict(r._mapping) for r in rows]
+    return resolve_chunk_texts([dict(r._mapping) for r in rows])
 
 
-def main():
-    embedder, dim = load_local_embedder()
-    print("Local embedding dim:", dim)
+# -----------------------------
+# Checkpoints
+# -----------------------------
+def _ensure_checkpoint_table():
+    with get_conn() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS upsert_checkpoints (
+            index_name TEXT NOT NULL,
+            namespace TEXT NOT NULL,
+            model_fingerprint TEXT NOT NULL,
+            last_rowid INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (index_name, namespace, model_fingerprint)
+        )
+        """))
 
-    pc = Pinecone(api_key=settings.pinecone_api_key)
-    index = pc.Index(settings.pinecone_index_name)
 
-    # Iterate chunks and upsert in batches
-    last_rowid = 0
-    total = 0
-    BATCH = settings.embed_batch_size
+def load_checkpoint(index_name: str, namespace: str, fingerprint: str) -> int:
+    _ensure_checkpoint_table()
+    with get_conn() as conn:
+        row = conn.execute(
+            text("""
+            SELECT last_rowid FROM upsert_checkpoints
+            WHERE index_name = :i AND namespace = :ns AND model_fingerprint = :fp
+            """),
+            {"i": index_name, "ns": namespace, "fp": fingerprint},
+        ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def save_checkpoint(index_name: str, namespace: str, fingerprint: str, last_rowid: int, total: int):
+    with get_conn() as conn:
+        conn.execute(
+            text("""
+            INSERT INTO upsert_checkpoints (index_name, namespace, model_fingerprint, last_rowid, total, updated_at)
+            VALUES (:i, :ns, :fp, :last, :total, CURRENT_TIMESTAMP)
+            ON CONFLICT(index_name, namespace, model_fingerprint)
+            DO UPDATE SET last_rowid = excluded.last_rowid, total = excluded.total, updated_at = CURRENT_TIMESTAMP
+            """),
+            {"i": index_name, "ns": namespace, "fp": fingerprint, "last": last_rowid, "total": total},
+        )
+
+
+def clear_checkpoint(index_name: str, namespace: str, fingerprint: str):
+    _ensure_checkpoint_table()
+    with get_conn() as conn:
+        conn.execute(
+            text("""
+            DELETE FROM upsert_checkpoints
+            WHERE index_name = :i AND namespace = :ns AND model_fingerprint = :fp
+            """),
+            {"i": index_name, "ns": namespace, "fp": fingerprint},
+        )
+
+
+# -----------------------------
+# Embedding manifest: what is in the vector index, from which text + model
+# -----------------------------
+def ensure_manifest_table():
+    with get_conn() as conn:
+        conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS embedding_manifest (
+            index_name TEXT NOT NULL,
+            namespace TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            content_hash TEXT,
+            model_fingerprint TEXT NOT NULL,
+            embedded_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (index_name, namespace, chunk_id)
+        )
+        """))
+
+
+def record_manifest(index_name: str, namespace: str, fingerprint: str, batch: List[Dict]):
+    with get_conn() as conn:
+        conn.execute(
+            text("""
+            INSERT INTO embedding_manifest (index_name, namespace, chunk_id, content_hash, model_fingerprint, embedded_at)
+            VALUES (:i, :ns, :chunk_id, :content_hash, :fp, CURRENT_TIMESTAMP)
+            ON CONFLICT(index_name, namespace, chunk_id) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                model_fingerprint = excluded.model_fingerprint,
+                embedded_at = CURRENT_TIMESTAMP
+            """),
+            [
+                {"i": index_name, "ns": namespace, "fp": fingerprint,
+                 "chunk_id": r["chunk_id"], "content_hash": r.get("content_hash")}
+                for r in batch
+            ],
+        )
+
+
+class _CheckpointTracker:
+    """
+    Upsert workers finish batches out of order; the checkpoint only advances
+    over the contiguous prefix of completed batches, so a resume never skips
+    a batch that was still in flight.
+    """
+
+    def __init__(self, index_name: str, namespace: str, fingerprint: str, start_rowid: int, persist: bool = True):
+        self.key = (index_name, namespace, fingerprint)
+        self.persist = persist
+        self.last_rowid = start_rowid
+        self.total = 0
+        self._next_seq = 0
+        self._done: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def complete(self, seq: int, last_rowid: int, n: int):
+        with self._lock:
+            self._done[seq] = (last_rowid, n)
+            advanced = False
+            while self._next_seq in self._done:
+                rowid, count = self._done.pop(self._next_seq)
+                self.last_rowid = rowid
+                self.total += count
+                self._next_seq += 1
+                advanced = True
+            if advanced:
+                if self.persist:
+                    save_checkpoint(*self.key, self.last_rowid, self.total)
+                print(f"upserted {self.total} chunks... last_rowid={self.last_rowid}")
+
+
+# -----------------------------
+# Local fake index (tests / dry runs)
+# -----------------------------
+class InMemoryIndex:
+    """
+    Minimal stand-in for a Pinecone index: upsert / fetch / delete / describe_index_stats.
+    """
+
+    def __init__(self, fail_every: int = 0):
+        self.namespaces: Dict[str, Dict[str, Dict]] = {}
+        self.upsert_calls = 0
+        self.fail_every = fail_every
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict], namespace: str = ""):
+        with self._lock:
+            self.upsert_calls += 1
+            if self.fail_every and self.upsert_calls % self.fail_every == 0:
+                raise ConnectionError("simulated upsert failure")
+            ns = self.namespaces.setdefault(namespace, {})
+            for v in vectors:
+                ns[v["id"]] = v
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids: List[str], namespace: str = ""):
+        ns = self.namespaces.get(namespace, {})
+        return {"vectors": {i: ns[i] for i in ids if i in ns}}
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        with self._lock:
+            ns = self.namespaces.get(namespace, {})
+            for i in ids:
+                ns.pop(i, None)
+
+    def describe_index_stats(self):
+        return {"namespaces": {k: {"vector_count": len(v)} for k, v in self.namespaces.items()}}
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+def _upsert_with_retry(index, vectors: List[Dict], namespace: str, attempts: int = 3):
+    delay = 1.0
+    for i in range(attempts):
+        try:
+            return index.upsert(vectors=vectors, namespace=namespace)
+        except Exception:
+            if i == attempts - 1:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+
+def to_pinecone_vectors(batch: List[Dict], vecs, titles: Dict[str, str]) -> List[Dict]:
+    vectors = []
+    for r, v in zip(batch, vecs):
+        vectors.append(
+            {
+                "id": r["chunk_id"],
+                "values": v.tolist() if hasattr(v, "tolist") else list(v),
+                "metadata": {
+                    "title": titles.get(r["doc_id"], ""),
+                    "doc_id": r["doc_id"],
+                    "chunk_index": r["chunk_index"],
+                    "start_char": r["start_char"],
+                    "end_char": r["end_char"],
+                    "source": "cuad-v1",
+                },
+            }
+        )
+    return vectors
+
+
+def run_pipeline(
+    index,
+    embedder,
+    *,
+    fingerprint: str,
+    namespace: Optional[str] = None,
+    index_name: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    upsert_workers: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    resume: bool = True,
+    fetch_batch=fetch_chunk_batch,
+    checkpoint: bool = True,
+) -> int:
+    """
+    fetch (SQLite) -> encode (CPU) -> upsert (N network workers), connected by
+    bounded queues so encoding overlaps with network I/O. Progress is
+    checkpointed per (index, namespace, model fingerprint), and every upserted
+    chunk is recorded in embedding_manifest.
+    `fetch_batch(after_rowid, limit)` selects which chunks to embed (all by default).
+    Returns the number of chunks upserted in this run.
+    """
+    namespace = namespace or settings.pinecone_namespace
+    index_name = index_name or settings.pinecone_index_name
+    batch_size = batch_size or settings.embed_batch_size
+    upsert_workers = upsert_workers or settings.upsert_workers
+    queue_size = queue_size or settings.pipeline_queue_size
+
+    ensure_manifest_table()
+    start_rowid = load_checkpoint(index_name, namespace, fingerprint) if (resume and checkpoint) else 0
+    if start_rowid:
+        print(f"Resuming from checkpoint: last_rowid={start_rowid}")
 
     titles = doc_titles_map()
+    tracker = _CheckpointTracker(index_name, namespace, fingerprint, start_rowid, persist=checkpoint)
+
+    encode_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    upsert_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def put(q, item):
+        # Bounded put that gives up once another stage has failed.
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fetcher():
+        try:
+            last, seq = start_rowid, 0
+            while not stop.is_set():
+                batch = fetch_batch(last, batch_size)
+                if not batch:
+                    break
+                if not put(encode_q, (seq, batch)):
+                    return
+                last = batch[-1]["rowid"]
+                seq += 1
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(encode_q, _DONE)
+
+    def encoder():
+        try:
+            while True:
+                item = get(encode_q)
+                if item is _DONE:
+                    break
+                seq, batch = item
+                vecs = embedder.encode(
+                    [r["text"] for r in batch], batch_size=min(64, batch_size), normalize_embeddings=True
+                )
+                vectors = to_pinecone_vectors(batch, vecs, titles)
+                if not put(upsert_q, (seq, batch, vectors)):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(upsert_workers):
+                put(upsert_q, _DONE)
+
+    def upserter():
+        try:
+            while True:
+                item = get(upsert_q)
+                if item is _DONE:
+                    break
+                seq, batch, vectors = item
+                _upsert_with_retry(index, vectors, namespace)
+                record_manifest(index_name, namespace, fingerprint, batch)
+                tracker.complete(seq, batch[-1]["rowid"], len(vectors))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=fetcher, name="fetch"), threading.Thread(target=encoder, name="encode")]
+    threads += [threading.Thread(target=upserter, name=f"upsert-{i}") for i in range(upsert_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        print(f"Pipeline stopped; checkpoint at last_rowid={tracker.last_rowid}. Re-run to resume.")
+        raise errors[0]
+    return tracker.total
+
+
+def main(*, index=None, embedder=None, resume: bool = True):
+    if embedder is None:
+        embedder, dim = load_local_embedder()
+    else:
+        dim = embedder.get_sentence_embedding_dimension()
+    print("Local embedding dim:", dim)
+
+    if index is None:
+        from src.retrieval import get_pinecone_index
+        index = get_pinecone_index()
 
-    while True:
-        batch = fetch_chunk_batch(last_rowid, BATCH)
-        if not batch:
-            break
-
-        texts = [r["text"] for r in batch]
-        vecs = embedder.encode(texts, batch_size=min(64, BATCH), normalize_embeddings=True)
-
-        vectors = []
-        for r, v in zip(batch, vecs):
-            vectors.append(
-                {
-                    "id": r["chunk_id"],
-                    "values": v.tolist(),
-                    "metadata": {
-                        "title": titles.get(r["doc_id"], ""),
-                        "doc_id": r["doc_id"],
-                        "chunk_index": r["chunk_index"],
-                        "start_char": r["start_char"],
-                        "end_char": r["end_char"],
-                        "source": "cuad-v1",
-                    },
-                }
-            )
-
-        # Upsert = insert if new, replace if existing
-        index.upsert(vectors=vectors, namespace=settings.pinecone_namespace)
-
-        last_rowid = batch[-1]["rowid"]
-        total += len(batch)
-        print(f"upserted {total} chunks... last_rowid={last_rowid}")
-
-    print(f"✅ Upsert complete. total_chunks={total}")
+    t0 = time.perf_counter()
+    total = run_pipeline(index, embedder, fingerprint=model_fingerprint(dim), resume=resume)
+    print(f"✅ Upsert complete. total_chunks={total} in {time.perf_counter() - t0:.1f}s")
 
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Embed SQLite chunks and upsert them into Pinecone.")
+    ap.add_argument("--no-resume", action="store_true", help="ignore any saved checkpoint and start from rowid 0")
+    args = ap.parse_args()
+    main(resume=not args.no_resume)
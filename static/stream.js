@@ -0,0 +1,95 @@
+// Progressive rendering for /ask/stream (Server-Sent Events over fetch).
+// Falls back to the normal form POST to /ask if streaming isn't available.
+(function () {
+  const form = document.querySelector("form.form");
+  const panel = document.getElementById("live-result");
+  if (!form || !panel || !window.fetch || !window.ReadableStream || !window.TextDecoder) return;
+
+  const answerEl = panel.querySelector("[data-answer]");
+  const sourcesEl = panel.querySelector("[data-sources]");
+  const timingEl = panel.querySelector("[data-timing]");
+
+  function sourceCard(s) {
+    const card = document.createElement("div");
+    card.className = "source-card";
+
+    const top = document.createElement("div");
+    top.className = "source-top";
+    const chips = [["chip chip-green", "Source"], ["chip chip-ghost mono", "chunk_id: " + s.chunk_id],
+                   ["chip chip-ghost", "idx: " + s.chunk_index]];
+    if (s.score !== null && s.score !== undefined) chips.push(["chip chip-ghost", "score: " + s.score.toFixed(4)]);
+    for (const [cls, label] of chips) {
+      const c = document.createElement("span");
+      c.className = cls;
+      c.textContent = label;
+      top.appendChild(c);
+    }
+
+    const body = document.createElement("div");
+    body.className = "source-body";
+    body.textContent = s.text;
+
+    card.appendChild(top);
+    card.appendChild(body);
+    return card;
+  }
+
+  function handle(event, data, clientT0) {
+    if (event === "timing") {
+      const client = Math.round(performance.now() - clientT0);
+      timingEl.textContent += (timingEl.textContent ? " • " : "") + data.stage + ": " + data.ms + "ms (client " + client + "ms)";
+    } else if (event === "sources") {
+      sourcesEl.replaceChildren(...data.sources.map(sourceCard));
+      if (!data.sources.length) sourcesEl.textContent = "No retrieved chunks returned.";
+    } else if (event === "token") {
+      answerEl.textContent += data.text;
+    } else if (event === "done") {
+      answerEl.textContent = data.answer;
+    } else if (event === "error") {
+      answerEl.textContent = "Error: " + data.message;
+    }
+  }
+
+  form.addEventListener("submit", async function (e) {
+    e.preventDefault();
+    const clientT0 = performance.now();
+    panel.hidden = false;
+    answerEl.textContent = "";
+    sourcesEl.textContent = "Retrieving…";
+    timingEl.textContent = "";
+
+    let resp;
+    try {
+      resp = await fetch("/ask/stream", { method: "POST", body: new FormData(form) });
+    } catch (err) {
+      form.submit();
+      return;
+    }
+    if (!resp.ok || !resp.body) {
+      form.submit();
+      return;
+    }
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buf.indexOf("\n\n")) !== -1) {
+        const block = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = "message";
+        let data = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (data) handle(event, JSON.parse(data), clientT0);
+      }
+    }
+  });
+})();
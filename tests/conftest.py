@@ -0,0 +1,124 @@
+import hashlib
+import os
+import re
+import types
+
+# Settings requires a Gemini key at import time; nothing here calls Gemini.
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from src import db
+from src.chunking import content_hash
+from src.config import settings
+
+
+class FakeEmbedder:
+    """
+    Deterministic stand-in for the SentenceTransformer: a text always maps to
+    the same unit vector, different texts (almost surely) to different ones.
+    """
+
+    dim = 8
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.encoded.extend(texts)
+        out = []
+        for t in texts:
+            seed = int.from_bytes(hashlib.sha256(t.encode("utf-8")).digest()[:4], "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            out.append(v / np.linalg.norm(v))
+        return np.stack(out)
+
+
+class FakeTokenizer:
+    """
+    Word/punctuation tokenizer with the tokenizers.Tokenizer encode_batch shape
+    (ids + character offsets), so chunking runs without the baked model.
+    """
+
+    _TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+    def encode_batch(self, texts, add_special_tokens=False):
+        out = []
+        for t in texts:
+            offsets = [(m.start(), m.end()) for m in self._TOKEN_RE.finditer(t)]
+            out.append(types.SimpleNamespace(ids=list(range(len(offsets))), offsets=offsets))
+        return out
+
+    def count(self, t: str) -> int:
+        return len(self._TOKEN_RE.findall(t))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """
+    A fresh SQLite DB with the app schema; the engine singletons point at it
+    for the duration of the test.
+    """
+    path = tmp_path / "contractrag.db"
+    monkeypatch.setattr(settings, "sqlite_path", str(path))
+    monkeypatch.setattr(settings, "sqlite_immutable", False)
+    monkeypatch.setattr(db, "_ENGINE", None)
+    monkeypatch.setattr(db, "_READ_ENGINE", None)
+    db.init_schema()
+    yield path
+    for engine in (db._ENGINE, db._READ_ENGINE):
+        if engine is not None:
+            engine.dispose()
+
+
+@pytest.fixture
+def add_chunks(sqlite_db):
+    """
+    Insert chunks as {chunk_id, doc_id, text}; documents are created on demand
+    and chunk_index/offsets follow insertion order per doc.
+    """
+
+    def add(rows):
+        with db.get_conn() as conn:
+            for r in rows:
+                conn.execute(
+                    text("INSERT OR IGNORE INTO documents (doc_id, title, source) VALUES (:d, :t, 'test')"),
+                    {"d": r["doc_id"], "t": f"Contract {r['doc_id']}"},
+                )
+                idx = conn.execute(
+                    text("SELECT COUNT(*) FROM chunks WHERE doc_id = :d"), {"d": r["doc_id"]}
+                ).scalar()
+                conn.execute(
+                    text("""
+                    INSERT INTO chunks (chunk_id, doc_id, chunk_index, start_char, end_char, text, content_hash)
+                    VALUES (:chunk_id, :doc_id, :idx, :start, :end, :text, :hash)
+                    """),
+                    {
+                        **r,
+                        "idx": idx,
+                        "start": idx * 1000,
+                        "end": idx * 1000 + len(r["text"]),
+                        "hash": content_hash(r["text"]),
+                    },
+                )
+
+    return add
+
+
+@pytest.fixture
+def fake_embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def fake_tokenizer(monkeypatch):
+    import src.chunking as chunking
+
+    tok = FakeTokenizer()
+    monkeypatch.setattr(chunking, "_TOKENIZER", tok)
+    return tok
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src import answer_cache
+from src.answer_cache import AnswerCache, answer_cache_key
+from src.config import settings
+from src.db_artifact import _write_stamp
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = tmp_path / "contractrag.db"
+    path.write_bytes(b"v1" * 100)
+    monkeypatch.setattr(settings, "sqlite_path", str(path))
+    return path
+
+
+def _key(question="What is the governing law?", **kw):
+    args = {"doc_id": "doc-1", "top_k": 12, "prompt_fingerprint": "fp-1", **kw}
+    return answer_cache_key(question, **args)
+
+
+def test_key_ignores_case_and_whitespace(db_file):
+    assert _key("What is the governing law?") == _key("  what is the   GOVERNING law? ")
+
+
+@pytest.mark.parametrize("change", [
+    {"question": "What is the term?"},
+    {"doc_id": "doc-2"},
+    {"doc_id": None},
+    {"top_k": 8},
+    {"prompt_fingerprint": "fp-2"},
+])
+def test_key_changes_with_each_input(db_file, change):
+    assert _key(**change) != _key()
+
+
+@pytest.mark.parametrize("setting,value", [
+    ("answer_cache_version", "2"),
+    ("pinecone_namespace", "other"),
+    ("vector_backend", "local"),
+    ("local_embedding_model", "other-model"),
+    ("embedder_backend", "onnx"),
+    ("hybrid_retrieval", True),
+])
+def test_key_changes_with_the_corpus_version(db_file, monkeypatch, setting, value):
+    before = _key()
+    monkeypatch.setattr(settings, setting, value)
+
+    assert _key() != before
+
+
+def test_key_changes_when_a_local_db_is_rewritten(db_file):
+    before = _key()
+    db_file.write_bytes(b"v2" * 101)
+
+    assert _key() != before
+
+
+def test_key_survives_a_redownload_of_the_same_published_db(db_file):
+    _write_stamp(db_file, generation="7", sha256="abc", n_bytes=db_file.stat().st_size)
+    before = _key()
+
+    # A cold start fetches the same artifact again: same bytes, new mtime.
+    st = db_file.stat()
+    db_file.write_bytes(db_file.read_bytes())
+    os.utime(db_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert _key() == before
+
+    _write_stamp(db_file, generation="8", sha256="def", n_bytes=db_file.stat().st_size)
+    db_file.write_bytes(db_file.read_bytes())
+    os.utime(db_file, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+    assert _key() != before
+
+
+def test_stale_stamp_falls_back_to_size_and_mtime(db_file):
+    _write_stamp(db_file, generation="7", sha256="abc", n_bytes=1)
+
+    assert answer_cache._db_identity() == f"{db_file.stat().st_size}:{db_file.stat().st_mtime_ns}"
+
+
+def test_cache_misses_after_the_corpus_changes(db_file):
+    cache = AnswerCache(16)
+    cache.put(_key(), {"answer": "Delaware"})
+    assert cache.get(_key()) == {"answer": "Delaware"}
+
+    db_file.write_bytes(b"v2" * 101)
+
+    assert cache.get(_key()) is None
+
+
+def test_get_or_compute_runs_once_per_key(db_file):
+    cache = AnswerCache(16)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"answer": "Delaware"}
+
+    assert cache.get_or_compute(_key(), compute) == {"answer": "Delaware"}
+    assert cache.get_or_compute(_key(), compute) == {"answer": "Delaware", "cache": "exact"}
+    assert len(calls) == 1
+
+
+def test_disk_tier_survives_a_restart(db_file, tmp_path):
+    path = str(Path(tmp_path) / "answers.db")
+    AnswerCache(16, path=path).put(_key(), {"answer": "Delaware"})
+
+    assert AnswerCache(16, path=path).get(_key()) == {"answer": "Delaware"}
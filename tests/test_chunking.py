@@ -0,0 +1,88 @@
+import pytest
+
+from src.chunking import chunk_document, chunk_structured, chunk_text
+
+CONTRACT = """ARTICLE 1 DEFINITIONS
+
+1.1 "Agreement" means this agreement. "Party" means a signatory. The Effective Date is the date of signature.
+
+1.2 "Territory" means the United States. Products are those listed in Exhibit A.
+
+ARTICLE 2 TERM AND TERMINATION
+
+2.1 This Agreement starts on the Effective Date. It continues for two years. It renews for one year terms.
+
+2.2 Either Party may terminate on sixty days notice. Termination does not affect accrued rights. Sections 3 and 4 survive.
+"""
+
+
+def _check_offsets(text, chunks):
+    for i, c in enumerate(chunks):
+        assert c["chunk_index"] == i
+        assert c["text"] == text[c["start_char"]:c["end_char"]]
+        assert c["text"] == c["text"].strip()
+
+
+@pytest.mark.parametrize("max_tokens,overlap", [(12, 0), (24, 6), (40, 10), (400, 0)])
+def test_chunk_structured_offsets_and_token_cap(fake_tokenizer, max_tokens, overlap):
+    chunks = chunk_structured(CONTRACT, max_tokens=max_tokens, overlap_tokens=overlap)
+
+    _check_offsets(CONTRACT, chunks)
+    assert all(fake_tokenizer.count(c["text"]) <= max_tokens for c in chunks)
+    # Every word of the contract lands in some chunk.
+    covered = set()
+    for c in chunks:
+        covered.update(range(c["start_char"], c["end_char"]))
+    assert all(i in covered for i, ch in enumerate(CONTRACT) if not ch.isspace())
+
+
+def test_chunk_structured_keeps_documents_under_min_tokens_whole(fake_tokenizer):
+    chunks = chunk_structured(CONTRACT, max_tokens=400, min_tokens=400)
+
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == CONTRACT.strip()
+
+
+def test_chunk_structured_overlap_repeats_trailing_sentences(fake_tokenizer):
+    chunks = chunk_structured(CONTRACT, max_tokens=24, overlap_tokens=10)
+
+    overlaps = [b["start_char"] < a["end_char"] for a, b in zip(chunks, chunks[1:])]
+    assert any(overlaps)
+    for a, b in zip(chunks, chunks[1:]):
+        if b["start_char"] < a["end_char"]:
+            assert fake_tokenizer.count(CONTRACT[b["start_char"]:a["end_char"]]) <= 10
+
+
+def test_chunk_structured_starts_a_chunk_at_headings(fake_tokenizer):
+    chunks = chunk_structured(CONTRACT, max_tokens=120, min_tokens=8)
+
+    assert [c["text"].split("\n")[0] for c in chunks] == ["ARTICLE 1 DEFINITIONS", "ARTICLE 2 TERM AND TERMINATION"]
+
+
+def test_chunk_structured_splits_run_on_text_between_words(fake_tokenizer):
+    text = " ".join(f"word{i}" for i in range(100))
+
+    chunks = chunk_structured(text, max_tokens=16)
+
+    _check_offsets(text, chunks)
+    assert all(fake_tokenizer.count(c["text"]) <= 16 for c in chunks)
+    assert " ".join(c["text"] for c in chunks) == text
+
+
+@pytest.mark.parametrize("kwargs", [{"max_tokens": 0}, {"max_tokens": 10, "overlap_tokens": 10}, {"max_tokens": 10, "overlap_tokens": -1}])
+def test_chunk_structured_rejects_bad_sizes(fake_tokenizer, kwargs):
+    with pytest.raises(ValueError):
+        chunk_structured(CONTRACT, **kwargs)
+
+
+def test_chunk_text_windows_overlap():
+    text = "x" * 2500
+
+    chunks = chunk_text(text, chunk_size=1000, chunk_overlap=200)
+
+    assert [(c["start_char"], c["end_char"]) for c in chunks] == [(0, 1000), (800, 1800), (1600, 2500)]
+
+
+def test_chunk_document_rejects_unknown_chunker():
+    with pytest.raises(ValueError):
+        chunk_document(CONTRACT, chunker="tokens", chunk_size=100, chunk_overlap=0)
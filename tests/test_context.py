@@ -0,0 +1,82 @@
+import pytest
+
+from src import context
+from src.config import settings
+
+
+def _span(chunk_id, n_chars, score=1.0, word="clause"):
+    return {"doc_id": "d1", "chunk_ids": [chunk_id], "text": (f"{word} " * n_chars)[:n_chars], "score": score, "rank": 0}
+
+
+@pytest.fixture(autouse=True)
+def chars_per_token(monkeypatch):
+    monkeypatch.setattr(settings, "context_chars_per_token", 4.0)
+
+
+def test_pack_keeps_spans_in_order_within_budget():
+    spans = [_span("a", 400), _span("b", 400), _span("c", 400)]  # 100 tokens each
+
+    packed, skipped = context.pack(spans, budget=250)
+
+    assert [s["chunk_ids"] for s in packed] == [["a"], ["b"]]
+    assert [s["chunk_ids"] for s in skipped] == [["c"]]
+
+
+def test_pack_skips_a_span_that_does_not_fit_but_keeps_smaller_ones():
+    spans = [_span("a", 400), _span("big", 800), _span("small", 200)]
+
+    packed, skipped = context.pack(spans, budget=160)
+
+    assert [s["chunk_ids"][0] for s in packed] == ["a", "small"]
+    assert [s["chunk_ids"][0] for s in skipped] == ["big"]
+
+
+def test_pack_truncates_the_best_span_at_a_word_boundary():
+    spans = [_span("a", 1000), _span("b", 40)]
+
+    packed, skipped = context.pack(spans, budget=50)
+
+    assert packed[0]["truncated"] is True
+    assert len(packed[0]["text"]) <= 200
+    assert packed[0]["text"].endswith("clause")
+    assert [s["chunk_ids"][0] for s in skipped] == ["b"]
+
+
+def test_pack_exact_fit():
+    packed, skipped = context.pack([_span("a", 400)], budget=100)
+
+    assert len(packed) == 1 and not skipped
+    assert "truncated" not in packed[0]
+
+
+def _chunk(chunk_id, doc_id, start, text):
+    return {"chunk_id": chunk_id, "doc_id": doc_id, "start_char": start, "end_char": start + len(text), "text": text}
+
+
+def test_build_context_merges_overlap_and_reports_drops(monkeypatch):
+    monkeypatch.setattr(settings, "context_builder", True)
+    body = " ".join(f"w{i}" for i in range(400))
+    chunks = [
+        _chunk("d1::0", "d1", 0, body[0:600]),
+        _chunk("d1::1", "d1", 500, body[500:1100]),
+        _chunk("d2::0", "d2", 0, "x " * 2000),
+    ]
+    matches = [{"id": "d1::0", "score": 0.9}, {"id": "d1::1", "score": 0.8}, {"id": "d2::0", "score": 0.1}]
+
+    prompt_chunks, report = context.build_context(chunks, matches, budget=400)
+
+    assert prompt_chunks[0]["chunk_id"] == "d1::0, d1::1"
+    assert prompt_chunks[0]["text"] == body[0:1100]
+    assert report["merged_spans"] == 2
+    assert report["dropped_chunk_ids"] == {"duplicate": [], "budget": ["d2::0"]}
+
+
+def test_build_context_ranks_by_rerank_score(monkeypatch):
+    monkeypatch.setattr(settings, "context_builder", True)
+    chunks = [_chunk("a", "d1", 0, "alpha " * 100), _chunk("b", "d2", 0, "beta " * 100)]
+    matches = [{"id": "a", "score": 0.9, "rerank_score": -2.0}, {"id": "b", "score": 0.5, "rerank_score": 3.0}]
+
+    prompt_chunks, report = context.build_context(chunks, matches, budget=200)
+
+    assert [c["chunk_id"] for c in prompt_chunks] == ["b"]
+    assert report["dropped_chunk_ids"]["budget"] == ["a"]
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import text
+
+from src import sync_vectors
+from src.chunking import content_hash
+from src.config import settings
+from src.db import get_conn
+from src.upsert_chunks_to_pinecone import InMemoryIndex
+
+
+@pytest.fixture
+def index(add_chunks, fake_embedder):
+    add_chunks([
+        {"chunk_id": "a", "doc_id": "d1", "text": "Governing law is Delaware."},
+        {"chunk_id": "b", "doc_id": "d1", "text": "Either party may terminate on 30 days notice."},
+        {"chunk_id": "c", "doc_id": "d2", "text": "The term is two years."},
+    ])
+    index = InMemoryIndex()
+    first = sync_vectors.sync(index=index, embedder=fake_embedder)
+    assert first == {"new": 3, "changed": 0, "stale": 0, "upserted": 3, "deleted": 0}
+    fake_embedder.encoded.clear()
+    return index
+
+
+def _stored(index):
+    return index.namespaces[settings.pinecone_namespace]
+
+
+def test_sync_is_a_noop_when_nothing_changed(index, fake_embedder):
+    result = sync_vectors.sync(index=index, embedder=fake_embedder)
+
+    assert result == {"new": 0, "changed": 0, "stale": 0, "upserted": 0, "deleted": 0}
+    assert fake_embedder.encoded == []
+
+
+def test_sync_embeds_new_and_changed_and_deletes_stale(index, add_chunks, fake_embedder):
+    old_b = _stored(index)["b"]["values"]
+    new_b = "Either party may terminate on 60 days notice."
+    with get_conn() as conn:
+        conn.execute(
+            text("UPDATE chunks SET text = :t, content_hash = :h WHERE chunk_id = 'b'"),
+            {"t": new_b, "h": content_hash(new_b)},
+        )
+        conn.execute(text("DELETE FROM chunks WHERE chunk_id = 'c'"))
+    add_chunks([{"chunk_id": "d", "doc_id": "d1", "text": "Notices must be in writing."}])
+
+    result = sync_vectors.sync(index=index, embedder=fake_embedder)
+
+    assert result == {"new": 1, "changed": 1, "stale": 1, "upserted": 2, "deleted": 1}
+    assert sorted(fake_embedder.encoded) == sorted([new_b, "Notices must be in writing."])
+    assert sorted(_stored(index)) == ["a", "b", "d"]
+    assert _stored(index)["b"]["values"] != old_b
+    with get_conn() as conn:
+        manifest = dict(conn.execute(text("SELECT chunk_id, content_hash FROM embedding_manifest")).fetchall())
+    assert manifest == {"a": content_hash("Governing law is Delaware."), "b": content_hash(new_b),
+                        "d": content_hash("Notices must be in writing.")}
+
+
+def test_sync_reembeds_everything_for_a_new_model(index, fake_embedder, monkeypatch):
+    monkeypatch.setattr(fake_embedder, "dim", 16)
+
+    result = sync_vectors.sync(index=index, embedder=fake_embedder)
+
+    assert result["changed"] == 3
+    assert result["upserted"] == 3
+    assert all(len(v["values"]) == 16 for v in _stored(index).values())
+
+
+def test_dry_run_only_reports_the_plan(index, fake_embedder):
+    with get_conn() as conn:
+        conn.execute(text("DELETE FROM chunks WHERE chunk_id = 'a'"))
+
+    plan = sync_vectors.sync(index=index, embedder=fake_embedder, dry_run=True)
+
+    assert plan == {"new": 0, "changed": 0, "stale": 1}
+    assert "a" in _stored(index)
@@ -0,0 +1,105 @@
+from functools import partial
+
+import pytest
+from sqlalchemy import text
+
+from src import upsert_chunks_to_pinecone as up
+from src.db import get_conn
+
+NS = "test-ns"
+INDEX = "test-index"
+FP = "test-fingerprint"
+
+
+class FlakyIndex(up.InMemoryIndex):
+    """
+    InMemoryIndex whose upserts start failing after `fail_after` successful
+    calls, until `fail_after` is reset to None.
+    """
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def upsert(self, vectors, namespace=""):
+        if self.fail_after is not None and self.upsert_calls >= self.fail_after:
+            raise ConnectionError("simulated outage")
+        return super().upsert(vectors, namespace=namespace)
+
+
+@pytest.fixture
+def chunks(add_chunks):
+    rows = [{"chunk_id": f"c{i:02d}", "doc_id": f"d{i // 4}", "text": f"Clause {i} text."} for i in range(10)]
+    add_chunks(rows)
+    return rows
+
+
+@pytest.fixture(autouse=True)
+def no_retry_backoff(monkeypatch):
+    monkeypatch.setattr(up, "_upsert_with_retry", partial(up._upsert_with_retry, attempts=1))
+
+
+def _run(index, embedder):
+    return up.run_pipeline(
+        index, embedder, fingerprint=FP, namespace=NS, index_name=INDEX, batch_size=2, upsert_workers=1, queue_size=2
+    )
+
+
+def test_run_pipeline_upserts_every_chunk_with_metadata(chunks, fake_embedder):
+    index = up.InMemoryIndex()
+
+    assert _run(index, fake_embedder) == 10
+
+    stored = index.namespaces[NS]
+    assert sorted(stored) == [r["chunk_id"] for r in chunks]
+    v = stored["c05"]
+    assert len(v["values"]) == fake_embedder.dim
+    assert v["metadata"]["doc_id"] == "d1"
+    assert v["metadata"]["title"] == "Contract d1"
+    assert up.load_checkpoint(INDEX, NS, FP) == 10
+    with get_conn() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM embedding_manifest")).scalar() == 10
+
+
+def test_run_pipeline_resumes_from_checkpoint(chunks, fake_embedder):
+    index = FlakyIndex(fail_after=2)
+
+    with pytest.raises(ConnectionError):
+        _run(index, fake_embedder)
+    # Two batches of two made it; the checkpoint stops at the last of them.
+    assert up.load_checkpoint(INDEX, NS, FP) == 4
+    assert len(index.namespaces[NS]) == 4
+
+    index.fail_after = None
+    fake_embedder.encoded.clear()
+    assert _run(index, fake_embedder) == 6
+
+    assert sorted(index.namespaces[NS]) == [r["chunk_id"] for r in chunks]
+    # Nothing before the checkpoint is embedded again.
+    assert fake_embedder.encoded == [r["text"] for r in chunks[4:]]
+    assert up.load_checkpoint(INDEX, NS, FP) == 10
+
+
+def test_checkpoint_is_per_model_fingerprint(chunks, fake_embedder):
+    index = up.InMemoryIndex()
+    _run(index, fake_embedder)
+
+    fake_embedder.encoded.clear()
+    n = up.run_pipeline(index, fake_embedder, fingerprint="other-model", namespace=NS, index_name=INDEX, batch_size=4)
+
+    assert n == 10
+    assert len(fake_embedder.encoded) == 10
+
+
+def test_checkpoint_tracker_only_advances_over_contiguous_batches(sqlite_db):
+    up._ensure_checkpoint_table()
+    tracker = up._CheckpointTracker(INDEX, NS, FP, start_rowid=0)
+
+    tracker.complete(1, last_rowid=4, n=2)
+    assert tracker.last_rowid == 0
+    assert up.load_checkpoint(INDEX, NS, FP) == 0
+
+    tracker.complete(0, last_rowid=2, n=2)
+    assert tracker.last_rowid == 4
+    assert tracker.total == 4
+    assert up.load_checkpoint(INDEX, NS, FP) == 4